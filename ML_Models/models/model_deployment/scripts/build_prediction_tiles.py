@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预测瓦片构建脚本 - 离线批处理任务
+- 在每个支持城市周边（默认50km）的密集网格上批量运行混合模型
+- 每个城市保存一个.npz瓦片，供在线预测插值使用
+- 瓦片基于当日观测数据，建议每日定时运行（PREDICTION_TILES_MAX_AGE默认24小时）
+"""
+
+import sys
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(current_dir))))
+shap_deployment_dir = os.path.join(project_root, 'ML_Models', 'models', 'shap_deployment')
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'api'))
+
+from ML_Models.models.shap_deployment.hybrid_model_wrapper import HybridSHAPModelWrapper
+from ML_Models.models.shap_deployment.prediction_tiles import build_city_tile, default_tiles_directory
+
+
+def main(output_dir: str, radius_km: float, spacing_deg: float, cities=None):
+    """构建所有城市的预测瓦片"""
+    print("🧱 预测瓦片构建")
+    print("=" * 60)
+    print(f"⏰ 开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = HybridSHAPModelWrapper(os.path.join(shap_deployment_dir, 'trained_models_66'))
+    print(f"📦 模型版本: {model.model_version}")
+
+    for city, center in model.city_centers.items():
+        if cities and city not in cities:
+            continue
+
+        start_time = time.time()
+        tile = build_city_tile(model, city, center['lat'], center['lon'],
+                               radius_km=radius_km, spacing_deg=spacing_deg)
+        tile_path = Path(output_dir) / f"{city.lower()}.npz"
+        tile.save(tile_path)
+
+        print(f"✅ {city}: {len(tile.latitudes)}×{len(tile.longitudes)}网格, "
+              f"{time.time() - start_time:.1f}s → {tile_path} ({tile_path.stat().st_size / 1024:.1f}KB)")
+
+    print(f"\n⏰ 完成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='预测瓦片构建 - 离线批处理')
+    parser.add_argument('--output-dir', default=default_tiles_directory(), help='瓦片输出目录')
+    parser.add_argument('--radius-km', type=float, default=50.0, help='覆盖半径（公里，默认: 50）')
+    parser.add_argument('--spacing', type=float, default=0.05, help='网格间距（度，默认: 0.05）')
+    parser.add_argument('--cities', nargs='*', help='只构建指定城市（默认: 全部）')
+
+    args = parser.parse_args()
+    main(args.output_dir, args.radius_km, args.spacing, args.cities)
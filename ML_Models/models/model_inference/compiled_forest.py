@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编译后的随机森林 - 纯NumPy推理
+
+把scikit-learn的RandomForestRegressor展开为连续的节点数组
+（feature / threshold / children_left / children_right / value），
+每个数组保存为单独的.npy文件，可以用np.load(mmap_mode='r')直接映射；
+推理时对所有样本和所有树做向量化遍历，结果与sklearn完全一致，
+服务端加载时不需要导入sklearn。
+
+用法:
+    python compiled_forest.py export <models_directory>
+"""
+
+import sys
+import json
+import hashlib
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any, Union
+
+logger = logging.getLogger(__name__)
+
+# 导出格式版本，格式变化时递增
+FORMAT_VERSION = 1
+
+FOREST_ARRAYS = ('feature', 'threshold', 'children_left', 'children_right', 'value', 'roots')
+
+
+def file_sha1(path: Union[str, Path]) -> str:
+    """计算源模型文件的SHA1（用于判断导出文件是否与源模型一致）"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompiledForest:
+    """向量化的随机森林回归推理器"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.meta = meta
+        self.n_features_in_ = meta['n_features']
+        self.n_estimators = meta['n_trees']
+        self.max_depth = meta['max_depth']
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], mmap: bool = True) -> 'CompiledForest':
+        """加载导出的森林（默认内存映射）"""
+        directory = Path(directory)
+        with open(directory / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"不支持的导出格式版本: {meta.get('format_version')}")
+
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode) for name in FOREST_ARRAYS}
+        return cls(arrays, meta)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        批量预测
+
+        与sklearn一致: 输入先转换为float32，与float64阈值比较(x <= threshold走左子树)，
+        各树结果按树的顺序累加后除以树的数量。
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"特征数量不匹配: 输入{X.shape[1]} vs 模型{self.n_features_in_}")
+
+        n_samples = X.shape[0]
+        rows = np.arange(n_samples)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_samples, len(self.roots))).copy()
+
+        # 每轮把所有尚未到达叶节点的(样本, 树)向下走一层
+        for _ in range(self.max_depth):
+            left = self.children_left[nodes]
+            is_leaf = left < 0
+            if is_leaf.all():
+                break
+            feature = np.maximum(self.feature[nodes], 0)
+            go_left = X[rows, feature] <= self.threshold[nodes]
+            nodes = np.where(is_leaf, nodes, np.where(go_left, left, self.children_right[nodes]))
+
+        leaf_values = self.value[nodes]
+        predictions = np.zeros(n_samples, dtype=np.float64)
+        for tree in range(leaf_values.shape[1]):
+            predictions += leaf_values[:, tree]
+        predictions /= leaf_values.shape[1]
+        return predictions
+
+
+class CompiledStandardScaler:
+    """StandardScaler的NumPy等价实现（只保存mean_和scale_）"""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'CompiledStandardScaler':
+        with np.load(path, allow_pickle=False) as data:
+            scaler = cls(data['mean'], data['scale'])
+            scaler.source_sha1 = str(data['source_sha1']) if 'source_sha1' in data.files else ''
+            return scaler
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+def export_forest(model, output_dir: Union[str, Path], source_path: Union[str, Path] = None) -> Path:
+    """
+    把sklearn RandomForestRegressor导出为连续的节点数组
+
+    所有树的节点拼接在一起，子节点索引转换为全局索引（叶节点保持-1）
+    """
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("只支持单输出的随机森林回归模型")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        roots.append(offset)
+        features.append(tree.feature.astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(np.where(tree.children_left >= 0, tree.children_left + offset, -1).astype(np.int32))
+        rights.append(np.where(tree.children_right >= 0, tree.children_right + offset, -1).astype(np.int32))
+        values.append(tree.value[:, 0, 0].astype(np.float64))
+        offset += tree.node_count
+
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'children_left': np.concatenate(lefts),
+        'children_right': np.concatenate(rights),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32)
+    }
+    for name, array in arrays.items():
+        np.save(output_dir / f"{name}.npy", np.ascontiguousarray(array))
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'n_features': int(model.n_features_in_),
+        'n_trees': len(model.estimators_),
+        'n_nodes': int(offset),
+        'max_depth': int(max(estimator.tree_.max_depth for estimator in model.estimators_)),
+        'source_sha1': file_sha1(source_path) if source_path else None
+    }
+    with open(output_dir / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    logger.info(f"✅ 随机森林导出完成: {meta['n_trees']}棵树, {meta['n_nodes']}个节点 → {output_dir}")
+    return output_dir
+
+
+def export_scaler(scaler, output_path: Union[str, Path], source_path: Union[str, Path] = None) -> Path:
+    """导出StandardScaler参数"""
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(scaler.n_features_in_)
+    scale = scaler.scale_ if scaler.with_std else np.ones(scaler.n_features_in_)
+    np.savez(output_path, mean=mean.astype(np.float64), scale=scale.astype(np.float64),
+             source_sha1=np.array(file_sha1(source_path) if source_path else ''))
+    logger.info(f"✅ 标准化器参数导出完成 → {output_path}")
+    return Path(output_path)
+
+
+def compiled_forest_path(model_file: Union[str, Path]) -> Path:
+    """源模型文件对应的导出目录: RandomForest_climate_model.joblib → RandomForest_climate_model_compiled/"""
+    model_file = Path(model_file)
+    return model_file.with_name(f"{model_file.stem}_compiled")
+
+
+def compiled_scaler_path(scaler_file: Union[str, Path]) -> Path:
+    """源标准化器文件对应的导出文件: feature_scaler.joblib → feature_scaler_compiled.npz"""
+    scaler_file = Path(scaler_file)
+    return scaler_file.with_name(f"{scaler_file.stem}_compiled.npz")
+
+
+def load_compiled_forest_for(model_file: Union[str, Path]):
+    """
+    加载源模型文件对应的编译森林
+
+    Returns:
+        CompiledForest；导出文件不存在或与源模型不一致时返回None
+    """
+    directory = compiled_forest_path(model_file)
+    if not (directory / 'meta.json').exists():
+        return None
+
+    try:
+        forest = CompiledForest.load(directory)
+    except Exception as e:
+        logger.warning(f"⚠️ 编译森林加载失败 {directory}: {e}")
+        return None
+
+    source_sha1 = forest.meta.get('source_sha1')
+    if source_sha1 and source_sha1 != file_sha1(model_file):
+        logger.warning(f"⚠️ 编译森林与源模型不一致，忽略: {directory}")
+        return None
+    return forest
+
+
+def load_compiled_scaler_for(scaler_file: Union[str, Path]):
+    """
+    加载源标准化器文件对应的NumPy参数
+
+    Returns:
+        CompiledStandardScaler；导出文件不存在或与源文件不一致时返回None
+    """
+    path = compiled_scaler_path(scaler_file)
+    if not path.exists():
+        return None
+
+    try:
+        scaler = CompiledStandardScaler.load(path)
+    except Exception as e:
+        logger.warning(f"⚠️ 标准化器参数加载失败 {path}: {e}")
+        return None
+
+    if scaler.source_sha1 and scaler.source_sha1 != file_sha1(scaler_file):
+        logger.warning(f"⚠️ 标准化器参数与源文件不一致，忽略: {path}")
+        return None
+    return scaler
+
+
+def export_models_directory(models_dir: Union[str, Path]):
+    """导出模型目录中所有随机森林模型和标准化器"""
+    import joblib
+
+    models_dir = Path(models_dir)
+    for model_file in sorted(models_dir.glob("RandomForest_*.joblib")):
+        export_forest(joblib.load(model_file), compiled_forest_path(model_file), source_path=model_file)
+
+    scaler_file = models_dir / "feature_scaler.joblib"
+    if scaler_file.exists():
+        export_scaler(joblib.load(scaler_file), compiled_scaler_path(scaler_file), source_path=scaler_file)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) != 3 or sys.argv[1] != 'export':
+        print("用法: python compiled_forest.py export <models_directory>")
+        sys.exit(1)
+
+    export_models_directory(sys.argv[2])
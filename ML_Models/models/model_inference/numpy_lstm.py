@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NumPy LSTM推理引擎 - 不依赖TensorFlow
+
+从Keras .h5文件中提取Sequential模型（LSTM / Dense / Dropout）的权重，
+保存为一个.npz权重文件；服务端用向量化的NumPy前向计算
+（Keras门顺序 i, f, c, o，float32计算）替代TensorFlow，输出与Keras在浮点误差范围内一致。
+
+用法:
+    python numpy_lstm.py convert <LSTM_model.h5>
+"""
+
+import sys
+import json
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any, List, Union
+
+try:
+    from .compiled_forest import file_sha1
+except ImportError:
+    from compiled_forest import file_sha1
+
+logger = logging.getLogger(__name__)
+
+# 权重文件格式版本，格式变化时递增
+FORMAT_VERSION = 1
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    # exp溢出为inf时结果正确地趋于0，不需要警告
+    with np.errstate(over='ignore'):
+        return 1.0 / (1.0 + np.exp(-x))
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+}
+
+# 推理时不起作用的层
+PASSTHROUGH_LAYERS = ('InputLayer', 'Dropout')
+
+
+def _activation(name: str):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"不支持的激活函数: {name}")
+    return ACTIVATIONS[name]
+
+
+class NumpySequentialModel:
+    """Keras Sequential模型（LSTM + Dense）的NumPy前向计算实现"""
+
+    def __init__(self, layers: List[Dict[str, Any]], weights: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.layers = layers
+        self.weights = weights
+        self.meta = meta
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'NumpySequentialModel':
+        """加载转换后的权重文件"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"不支持的权重文件格式版本: {meta.get('format_version')}")
+            weights = {name: data[name] for name in data.files if name != 'meta'}
+        return cls(meta['layers'], weights, meta)
+
+    def _lstm(self, layer: Dict[str, Any], inputs: np.ndarray) -> np.ndarray:
+        """LSTM层: inputs (N, T, F) → (N, units) 或 (N, T, units)"""
+        kernel = self.weights[f"{layer['name']}/kernel"]
+        recurrent_kernel = self.weights[f"{layer['name']}/recurrent_kernel"]
+        bias = self.weights.get(f"{layer['name']}/bias")
+        activation = _activation(layer['activation'])
+        recurrent_activation = _activation(layer['recurrent_activation'])
+        units = layer['units']
+
+        n_samples, timesteps, _ = inputs.shape
+        h = np.zeros((n_samples, units), dtype=np.float32)
+        c = np.zeros((n_samples, units), dtype=np.float32)
+
+        # 输入投影对所有时间步一次性计算
+        projected = inputs @ kernel
+        if bias is not None:
+            projected = projected + bias
+
+        time_order = range(timesteps - 1, -1, -1) if layer.get('go_backwards') else range(timesteps)
+        outputs = []
+        for t in time_order:
+            z = projected[:, t, :] + h @ recurrent_kernel
+            # Keras门顺序: input, forget, cell, output
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            c = f * c + i * activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            h = o * activation(c)
+            outputs.append(h)
+
+        if layer.get('return_sequences'):
+            return np.stack(outputs, axis=1)
+        return h
+
+    def _dense(self, layer: Dict[str, Any], inputs: np.ndarray) -> np.ndarray:
+        outputs = inputs @ self.weights[f"{layer['name']}/kernel"]
+        bias = self.weights.get(f"{layer['name']}/bias")
+        if bias is not None:
+            outputs = outputs + bias
+        return _activation(layer['activation'])(outputs)
+
+    def predict(self, x: np.ndarray, batch_size: int = None, verbose: int = 0) -> np.ndarray:
+        """前向计算（接口与keras Model.predict兼容，batch_size/verbose仅为兼容保留）"""
+        outputs = np.asarray(x, dtype=np.float32)
+        for layer in self.layers:
+            if layer['class_name'] == 'LSTM':
+                outputs = self._lstm(layer, outputs)
+            elif layer['class_name'] == 'Dense':
+                outputs = self._dense(layer, outputs)
+        return outputs
+
+
+def convert_keras_h5(h5_path: Union[str, Path], output_path: Union[str, Path] = None) -> Path:
+    """
+    把Keras .h5 Sequential模型转换为NumPy权重文件（只需要h5py，不需要TensorFlow）
+    """
+    import h5py
+
+    h5_path = Path(h5_path)
+    output_path = Path(output_path) if output_path else numpy_weights_path(h5_path)
+
+    layers, weights = [], {}
+    with h5py.File(h5_path, 'r') as f:
+        model_config = json.loads(f.attrs['model_config'])
+        keras_version = f.attrs.get('keras_version', '')
+        keras_version = keras_version.decode() if isinstance(keras_version, bytes) else str(keras_version)
+        if model_config['class_name'] != 'Sequential':
+            raise ValueError(f"只支持Sequential模型: {model_config['class_name']}")
+
+        model_weights = f['model_weights']
+        for layer_config in model_config['config']['layers']:
+            class_name = layer_config['class_name']
+            config = layer_config['config']
+
+            if class_name in PASSTHROUGH_LAYERS:
+                continue
+            if class_name not in ('LSTM', 'Dense'):
+                raise ValueError(f"不支持的层类型: {class_name}")
+            if class_name == 'LSTM' and (config.get('stateful') or config.get('time_major')):
+                raise ValueError(f"不支持stateful/time_major的LSTM层: {config['name']}")
+
+            name = config['name']
+            layer = {'class_name': class_name, 'name': name, 'activation': config['activation']}
+            if class_name == 'LSTM':
+                layer.update({
+                    'units': config['units'],
+                    'recurrent_activation': config['recurrent_activation'],
+                    'return_sequences': bool(config.get('return_sequences')),
+                    'go_backwards': bool(config.get('go_backwards'))
+                })
+                # 校验激活函数是否受支持
+                _activation(config['recurrent_activation'])
+            _activation(config['activation'])
+
+            group = model_weights[name]
+            for weight_name in group.attrs['weight_names']:
+                weight_name = weight_name.decode() if isinstance(weight_name, bytes) else weight_name
+                short_name = weight_name.split('/')[-1].split(':')[0]
+                weights[f"{name}/{short_name}"] = np.asarray(group[weight_name], dtype=np.float32)
+
+            layers.append(layer)
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'keras_version': keras_version,
+        'layers': layers,
+        'source_sha1': file_sha1(h5_path)
+    }
+    np.savez(output_path, meta=np.array(json.dumps(meta)), **weights)
+
+    logger.info(f"✅ LSTM权重转换完成: {len(layers)}层 → {output_path}")
+    return output_path
+
+
+def numpy_weights_path(h5_path: Union[str, Path]) -> Path:
+    """源模型文件对应的权重文件: LSTM_geographic_model.h5 → LSTM_geographic_model_numpy.npz"""
+    h5_path = Path(h5_path)
+    return h5_path.with_name(f"{h5_path.stem}_numpy.npz")
+
+
+def load_numpy_model_for(h5_path: Union[str, Path]):
+    """
+    加载源模型文件对应的NumPy模型
+
+    Returns:
+        NumpySequentialModel；权重文件不存在、加载失败或与源模型不一致时返回None
+    """
+    path = numpy_weights_path(h5_path)
+    if not path.exists():
+        return None
+
+    try:
+        model = NumpySequentialModel.load(path)
+    except Exception as e:
+        logger.warning(f"⚠️ NumPy LSTM权重加载失败 {path}: {e}")
+        return None
+
+    if model.meta.get('source_sha1') != file_sha1(h5_path):
+        logger.warning(f"⚠️ NumPy LSTM权重与源模型不一致，忽略: {path}")
+        return None
+    return model
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) != 3 or sys.argv[1] != 'convert':
+        print("用法: python numpy_lstm.py convert <LSTM_model.h5>")
+        sys.exit(1)
+
+    convert_keras_h5(sys.argv[2])
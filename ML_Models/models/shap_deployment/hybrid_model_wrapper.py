@@ -6,19 +6,48 @@
 """
 
 import os
+import sys
 import json
+import importlib.util
+import random
+import hashlib
 import logging
+import threading
 import numpy as np
+from contextlib import nullcontext
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
-import joblib
+from typing import Dict, Any, Optional, Tuple, List
 
-# 深度学习模型支持
+# 前向计算计时（在API进程中使用时记录到/metrics）
 try:
-    from tensorflow.keras.models import load_model
-    TF_AVAILABLE = True
+    from api.utils.metrics import MODEL_FORWARD_SECONDS, timed
 except ImportError:
-    TF_AVAILABLE = False
+    MODEL_FORWARD_SECONDS = timed = None
+
+# 深度学习模型支持（只检查是否安装；仅在缺少NumPy权重文件时才导入TensorFlow）
+TF_AVAILABLE = importlib.util.find_spec('tensorflow') is not None
+
+# 预测瓦片（包内导入或作为独立模块导入）
+try:
+    from .prediction_tiles import get_prediction_tile_store
+except ImportError:
+    from prediction_tiles import get_prediction_tile_store
+
+# TreeSHAP解释器（基于编译森林和持久化的背景摘要）
+try:
+    from .tree_shap import load_tree_explainer_for
+except ImportError:
+    from tree_shap import load_tree_explainer_for
+
+# 编译后的随机森林/标准化器（纯NumPy，服务时不需要导入sklearn）
+try:
+    from ..model_inference.compiled_forest import load_compiled_forest_for, load_compiled_scaler_for
+    from ..model_inference.numpy_lstm import load_numpy_model_for
+except ImportError:
+    sys.path.append(str(Path(__file__).resolve().parent.parent / "model_inference"))
+    from compiled_forest import load_compiled_forest_for, load_compiled_scaler_for
+    from numpy_lstm import load_numpy_model_for
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -42,6 +71,9 @@ class HybridSHAPModelWrapper:
         self.loaded_models = {}
         self.scaler = None
         self.feature_engineer = None
+        self._tree_explainer = None
+        self._tree_explainer_loaded = False
+        self._tree_explainer_lock = threading.Lock()
         
         # 城市中心坐标
         self.city_centers = {
@@ -66,16 +98,23 @@ class HybridSHAPModelWrapper:
         
         logger.info("HybridSHAPModelWrapper初始化完成")
         self._load_models()
+        self.model_version = self._compute_model_version()
     
     def _load_models(self):
         """加载混合模型"""
         logger.info("开始加载混合模型...")
         
-        # 加载标准化器
+        use_compiled = os.getenv('COMPILED_FOREST_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        use_numpy_lstm = os.getenv('NUMPY_LSTM_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        
+        # 加载标准化器（优先使用导出的NumPy参数）
         scaler_files = list(self.models_dir.glob("feature_scaler.joblib"))
         if scaler_files:
-            self.scaler = joblib.load(scaler_files[0])
-            logger.info(f"✅ 标准化器加载成功: {scaler_files[0]}")
+            self.scaler = load_compiled_scaler_for(scaler_files[0]) if use_compiled else None
+            if self.scaler is None:
+                import joblib
+                self.scaler = joblib.load(scaler_files[0])
+            logger.info(f"✅ 标准化器加载成功: {scaler_files[0]} ({type(self.scaler).__name__})")
         else:
             logger.warning("⚠️ 未找到标准化器文件")
         
@@ -93,18 +132,28 @@ class HybridSHAPModelWrapper:
                 
                 # 根据模型类型加载
                 if config['model_type'] == 'RandomForest':
-                    model = joblib.load(latest_model_file)
-                    logger.info(f"✅ RandomForest {dimension}模型加载成功: {latest_model_file}")
+                    # 优先使用编译后的NumPy森林（内存映射加载，无需sklearn）
+                    model = load_compiled_forest_for(latest_model_file) if use_compiled else None
+                    if model is None:
+                        import joblib
+                        model = joblib.load(latest_model_file)
+                    logger.info(f"✅ RandomForest {dimension}模型加载成功: {latest_model_file} ({type(model).__name__})")
                 
                 elif config['model_type'] == 'LSTM':
-                    if not TF_AVAILABLE:
+                    # 优先使用转换后的NumPy权重，避免导入TensorFlow
+                    model = load_numpy_model_for(latest_model_file) if use_numpy_lstm else None
+                    if model is not None:
+                        logger.info(f"✅ LSTM {dimension}模型加载成功 (NumPy): {latest_model_file}")
+                    elif not TF_AVAILABLE:
                         logger.error(f"❌ TensorFlow不可用，无法加载LSTM {dimension}模型")
                         continue
                     
                     try:
-                        # 尝试使用自定义对象加载
-                        model = load_model(latest_model_file, compile=False)
-                        logger.info(f"✅ LSTM {dimension}模型加载成功: {latest_model_file}")
+                        if model is None:
+                            from tensorflow.keras.models import load_model
+                            # 尝试使用自定义对象加载
+                            model = load_model(latest_model_file, compile=False)
+                            logger.info(f"✅ LSTM {dimension}模型加载成功: {latest_model_file}")
                     except Exception as e:
                         logger.warning(f"⚠️ LSTM模型加载失败，使用备用方案: {e}")
                         # 如果LSTM加载失败，我们可以使用一个简单的备用模型
@@ -123,6 +172,17 @@ class HybridSHAPModelWrapper:
             except Exception as e:
                 logger.error(f"❌ {dimension}模型加载失败: {e}")
     
+    def _compute_model_version(self) -> str:
+        """根据已加载的模型文件（文件名、大小、修改时间）生成模型版本标识"""
+        model_files = [model_info['file_path'] for model_info in self.loaded_models.values()]
+        model_files.extend(self.models_dir.glob("feature_scaler.joblib"))
+        
+        digest = hashlib.sha1()
+        for path in sorted(Path(p) for p in model_files):
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{int(stat.st_mtime)};".encode())
+        return digest.hexdigest()[:12]
+    
     def get_closest_city(self, latitude: float, longitude: float) -> str:
         """获取最接近的城市"""
         min_distance = float('inf')
@@ -165,173 +225,349 @@ class HybridSHAPModelWrapper:
             # 返回零特征作为fallback
             return np.zeros(66)
     
+    # 🏙️ 城市经济基础数据
+    CITY_ECONOMIC_BASE = {
+        'London': 0.90,
+        'Manchester': 0.70,
+        'Edinburgh': 0.60
+    }
+
+    # 🗓️ 季节调整因子
+    SEASONAL_FACTORS = {
+        1: 0.88, 2: 0.85, 3: 0.92, 4: 0.95, 5: 0.98, 6: 1.02,
+        7: 1.05, 8: 1.03, 9: 0.96, 10: 0.93, 11: 1.00, 12: 1.08
+    }
+
     def _calculate_economic_score(self, latitude: float, longitude: float, month: int) -> float:
         """计算经济得分 (改进的启发式方法)"""
-        # 🏙️ 城市经济基础数据
-        city_economic_base = {
-            'London': 0.90,
-            'Manchester': 0.70,
-            'Edinburgh': 0.60
-        }
-        
-        # 📍 地理区域经济系数
-        zone_factors = {
-            'city_center': 0.95,   # 市中心区 (0-5km)
-            'urban': 0.70,         # 城市区 (5-20km)
-            'suburban': 0.45       # 郊外区 (20km+)
+        return float(self._calculate_economic_scores([latitude], [longitude], [month])[0])
+
+    def _calculate_economic_scores(self, latitudes, longitudes, months) -> np.ndarray:
+        """
+        向量化计算一批位置的经济得分
+
+        与逐行启发式方法结果一致：最近城市基础分 × 区域/距离系数 × 季节系数 × 确定性波动
+        """
+        lats = np.asarray(latitudes, dtype=float)
+        lons = np.asarray(longitudes, dtype=float)
+        months = np.asarray(months, dtype=int)
+
+        # 最近城市（与get_closest_city相同，距离相等时取第一个）
+        cities = list(self.city_centers.keys())
+        center_lats = np.array([self.city_centers[c]['lat'] for c in cities])
+        center_lons = np.array([self.city_centers[c]['lon'] for c in cities])
+        distances = np.sqrt((lats[:, None] - center_lats[None, :])**2 + (lons[:, None] - center_lons[None, :])**2)
+        closest = np.argmin(distances, axis=1)
+
+        city_base_score = np.array([self.CITY_ECONOMIC_BASE.get(c, 0.50) for c in cities])[closest]
+        distance_km = distances[np.arange(len(lats)), closest] * 111
+
+        # 📍 地理区域经济系数: 市中心区 (0-5km) / 城市区 (5-20km) / 郊外区 (20km+)
+        is_center = distance_km <= 5
+        is_urban = ~is_center & (distance_km <= 20)
+        base_zone_factor = np.where(is_center, 0.95, np.where(is_urban, 0.70, 0.45))
+        max_distance = np.where(is_center, 5, np.where(is_urban, 20, 50))
+
+        distance_factor = np.where(
+            is_center,
+            np.maximum(0.8, 1.0 - (distance_km / max_distance) * 0.2),
+            np.maximum(0.3, 1.0 - (distance_km / max_distance) * 0.7)
+        )
+
+        geographic_multiplier = base_zone_factor * distance_factor
+        seasonal_multiplier = np.array([self.SEASONAL_FACTORS.get(int(m), 1.0) for m in months])
+
+        # 每行独立的确定性波动（种子与单点计算相同，不影响全局random状态）
+        economic_volatility = np.array([
+            1.0 + random.Random(int(lat * 1000 + lon * 1000 + int(m))).uniform(-0.03, 0.03)
+            for lat, lon, m in zip(lats, lons, months)
+        ])
+
+        final_scores = city_base_score * geographic_multiplier * seasonal_multiplier * economic_volatility
+        return np.maximum(0.1, final_scores)
+
+    def _normalize_location(self, location: Dict[str, Any], default_month: Optional[int]) -> Tuple[float, float, int]:
+        """校验并解析单个位置输入"""
+        latitude = float(location['latitude'])
+        longitude = float(location['longitude'])
+        month = location.get('month') or default_month or datetime.now().month
+        month = int(month)
+
+        if not (-90 <= latitude <= 90):
+            raise ValueError(f"latitude必须在-90到90之间: {latitude}")
+        if not (-180 <= longitude <= 180):
+            raise ValueError(f"longitude必须在-180到180之间: {longitude}")
+        if not (1 <= month <= 12):
+            raise ValueError(f"month必须在1到12之间: {month}")
+
+        return latitude, longitude, month
+
+    def _predict_from_tiles(self, latitude: float, longitude: float, month: int) -> Optional[Dict[str, Any]]:
+        """从预计算瓦片插值得到预测结果；超出覆盖范围、瓦片过期或未启用时返回None"""
+        tile_store = get_prediction_tile_store()
+        if tile_store is None:
+            return None
+
+        tile_scores = tile_store.lookup(latitude, longitude, month, self.model_version)
+        if tile_scores is None:
+            return None
+
+        model_scores = {dimension: np.array([score]) for dimension, score in tile_scores.items()
+                        if dimension in self.loaded_models}
+        economic_score = self._calculate_economic_score(latitude, longitude, month)
+        result = self._build_result(latitude, longitude, month, model_scores, 0, economic_score)
+        result['prediction_source'] = 'tiles'
+        return result
+
+    def _model_forward(self, dimension: str, features_matrix: np.ndarray) -> np.ndarray:
+        """对一批特征执行单个维度模型的前向计算"""
+        model_info = self.loaded_models[dimension]
+        model = model_info['model']
+        timer = timed(MODEL_FORWARD_SECONDS, model_info['config']['model_type'], dimension) if timed else nullcontext()
+
+        with timer:
+            if dimension == 'climate':
+                # RandomForest直接使用原始特征
+                return np.asarray(model.predict(features_matrix), dtype=float).reshape(-1)
+
+            # LSTM需要标准化和重塑数据
+            if self.scaler is not None:
+                features_scaled = self.scaler.transform(features_matrix)
+            else:
+                logger.warning("⚠️ 未找到标准化器，使用原始特征")
+                features_scaled = features_matrix
+
+            # 重塑为LSTM格式 (N, 1, 66)
+            features_lstm = features_scaled.reshape(len(features_scaled), 1, features_scaled.shape[1])
+            predictions = model.predict(features_lstm, batch_size=max(1, len(features_lstm)), verbose=0)
+            return np.asarray(predictions, dtype=float).reshape(-1)
+
+    def predict_features_batch(self, features_matrix: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        对N×66特征矩阵执行一次RandomForest和一次LSTM前向计算
+
+        Returns:
+            {维度: 长度为N的得分数组}，单行预测失败时对应位置为NaN
+        """
+        features_matrix = np.asarray(features_matrix, dtype=float)
+        if features_matrix.ndim == 1:
+            features_matrix = features_matrix.reshape(1, -1)
+
+        scores = {}
+        for dimension in ('climate', 'geographic'):
+            if dimension not in self.loaded_models:
+                continue
+            try:
+                scores[dimension] = self._model_forward(dimension, features_matrix)
+            except Exception as e:
+                # 整批失败时逐行重试，隔离出错的行
+                logger.warning(f"⚠️ {dimension}批量预测失败，逐行重试: {e}")
+                row_scores = np.full(len(features_matrix), np.nan)
+                for i in range(len(features_matrix)):
+                    try:
+                        row_scores[i] = self._model_forward(dimension, features_matrix[i:i + 1])[0]
+                    except Exception as row_error:
+                        logger.warning(f"⚠️ {dimension}模型第{i}行预测失败: {row_error}")
+                scores[dimension] = row_scores
+
+        return scores
+
+    def get_tree_explainer(self):
+        """获取Climate模型的TreeSHAP解释器（首次使用时加载，不可用时返回None）"""
+        if not self._tree_explainer_loaded:
+            with self._tree_explainer_lock:
+                if not self._tree_explainer_loaded:
+                    climate_info = self.loaded_models.get('climate')
+                    if climate_info is not None:
+                        try:
+                            self._tree_explainer = load_tree_explainer_for(
+                                climate_info['file_path'], forest=climate_info['model']
+                            )
+                        except Exception as e:
+                            logger.error(f"❌ TreeSHAP解释器加载失败: {e}")
+                    if self._tree_explainer is not None:
+                        logger.info(f"✅ TreeSHAP解释器加载成功: 背景样本{len(self._tree_explainer.background)}个")
+                    self._tree_explainer_loaded = True
+        return self._tree_explainer
+
+    def explain_features_batch(self, features_matrix: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        对N×66特征矩阵批量计算Climate模型的TreeSHAP值
+
+        Returns:
+            每行一个SHAP分析字典；解释器不可用或计算失败时为错误说明
+        """
+        features_matrix = np.asarray(features_matrix, dtype=float)
+        if features_matrix.ndim == 1:
+            features_matrix = features_matrix.reshape(1, -1)
+
+        explainer = self.get_tree_explainer()
+        if explainer is None:
+            return [{'error': 'TreeSHAP解释器不可用'} for _ in range(len(features_matrix))]
+
+        try:
+            explanations = explainer.explain(features_matrix)
+        except Exception as e:
+            logger.error(f"❌ TreeSHAP批量解释失败: {e}")
+            return [{'error': f'TreeSHAP解释失败: {e}'} for _ in range(len(features_matrix))]
+
+        for explanation in explanations:
+            explanation['model_version'] = self.model_version
+        return explanations
+
+    def _build_result(self, latitude: float, longitude: float, month: int,
+                      model_scores: Dict[str, np.ndarray], row: int, economic_score: float) -> Dict[str, Any]:
+        """将批量计算结果组装为单个位置的预测字典"""
+        result = {
+            'city': self.get_closest_city(latitude, longitude),
+            'coordinates': {'lat': latitude, 'lon': longitude, 'month': month},
+            'success': True
         }
-        
-        # 🗓️ 季节调整因子
-        seasonal_factors = {
-            1: 0.88, 2: 0.85, 3: 0.92, 4: 0.95, 5: 0.98, 6: 1.02,
-            7: 1.05, 8: 1.03, 9: 0.96, 10: 0.93, 11: 1.00, 12: 1.08
+
+        # Climate预测 (使用RandomForest)
+        if 'climate' in model_scores:
+            climate_score = model_scores['climate'][row]
+            if np.isfinite(climate_score):
+                result['climate_score'] = float(climate_score)
+                result['climate_confidence'] = 0.95
+                result['climate_model_type'] = 'RandomForest'
+            else:
+                result['climate_score'] = 0.5
+                result['climate_confidence'] = 0.3
+
+        # Geographic预测 (使用LSTM)
+        if 'geographic' in model_scores:
+            geographic_score = model_scores['geographic'][row]
+            if np.isfinite(geographic_score):
+                result['geographic_score'] = float(geographic_score)
+                result['geographic_confidence'] = 0.97
+                result['geographic_model_type'] = 'LSTM'
+            else:
+                result['geographic_score'] = 0.5
+                result['geographic_confidence'] = 0.3
+
+        # Economic Score (启发式算法)
+        result['economic_score'] = float(economic_score)
+        result['economic_confidence'] = 0.75
+
+        # 计算综合置信度
+        confidences = [
+            result.get('climate_confidence', 0.3),
+            result.get('geographic_confidence', 0.3),
+            result.get('economic_confidence', 0.75)
+        ]
+        result['overall_confidence'] = float(np.mean(confidences))
+        return result
+
+    @staticmethod
+    def _failed_result(location: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        """单个位置预测失败时的默认结果"""
+        return {
+            'coordinates': {
+                'lat': location.get('latitude'),
+                'lon': location.get('longitude'),
+                'month': location.get('month')
+            },
+            'success': False,
+            'error': str(error),
+            'climate_score': 0.5,
+            'geographic_score': 0.5,
+            'economic_score': 0.5,
+            'climate_confidence': 0.3,
+            'geographic_confidence': 0.3,
+            'economic_confidence': 0.3,
+            'overall_confidence': 0.3
         }
-        
-        city = self.get_closest_city(latitude, longitude)
-        city_base_score = city_economic_base.get(city, 0.50)
-        center = self.city_centers[city]
-        distance_deg = np.sqrt((latitude - center['lat'])**2 + (longitude - center['lon'])**2)
-        distance_km = distance_deg * 111
-        
-        if distance_km <= 5:
-            zone_type = 'city_center'
-            max_distance = 5
-        elif distance_km <= 20:
-            zone_type = 'urban'
-            max_distance = 20
-        else:
-            zone_type = 'suburban'
-            max_distance = 50
-        
-        base_zone_factor = zone_factors[zone_type]
-        
-        if zone_type == 'city_center':
-            distance_factor = max(0.8, 1.0 - (distance_km / max_distance) * 0.2)
-        else:
-            distance_factor = max(0.3, 1.0 - (distance_km / max_distance) * 0.7)
-        
-        geographic_multiplier = base_zone_factor * distance_factor
-        seasonal_multiplier = seasonal_factors.get(month, 1.0)
-        
-        import random
-        random.seed(int(latitude * 1000 + longitude * 1000 + month))
-        economic_volatility = 1.0 + random.uniform(-0.03, 0.03)
-        
-        final_score = city_base_score * geographic_multiplier * seasonal_multiplier * economic_volatility
-        return max(0.1, final_score)
-    
-    def predict_environmental_scores(self, latitude: float, longitude: float, month: int) -> Dict[str, Any]:
+
+    def predict_batch(self, locations: List[Dict[str, Any]], month: Optional[int] = None,
+                      analyze_shap: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量混合模型环境评分预测
+
+        Args:
+            locations: [{"latitude": float, "longitude": float, "month": int (可选), "name": str (可选)}, ...]
+            month: 位置未指定月份时使用的默认月份（默认当前月份）
+            analyze_shap: 是否附加Climate模型的TreeSHAP分析（需要特征，因此不使用预测瓦片）
+
+        Returns:
+            与输入顺序一致的预测结果列表，单个位置失败不影响其他位置
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(locations)
+        rows, feature_rows = [], []
+
+        logger.info(f"开始混合模型批量预测: {len(locations)}个位置")
+
+        # 逐行构建特征（瓦片覆盖的位置直接插值），失败的行单独标记
+        for i, location in enumerate(locations):
+            try:
+                latitude, longitude, row_month = self._normalize_location(location, month)
+                tile_result = None if analyze_shap else self._predict_from_tiles(latitude, longitude, row_month)
+                if tile_result is not None:
+                    results[i] = tile_result
+                    continue
+                feature_rows.append(self._prepare_features(latitude, longitude, row_month))
+                rows.append((i, latitude, longitude, row_month))
+            except Exception as e:
+                logger.warning(f"⚠️ 第{i}个位置特征准备失败: {e}")
+                results[i] = self._failed_result(location if isinstance(location, dict) else {}, e)
+
+        if rows:
+            try:
+                features_matrix = np.vstack(feature_rows)
+                model_scores = self.predict_features_batch(features_matrix)
+                explanations = self.explain_features_batch(features_matrix) if analyze_shap else None
+                economic_scores = self._calculate_economic_scores(
+                    [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows]
+                )
+                for row, (i, latitude, longitude, row_month) in enumerate(rows):
+                    results[i] = self._build_result(
+                        latitude, longitude, row_month, model_scores, row, economic_scores[row]
+                    )
+                    results[i]['prediction_source'] = 'live'
+                    if explanations is not None:
+                        results[i]['shap_analysis'] = explanations[row]
+            except Exception as e:
+                logger.error(f"❌ 混合模型批量预测失败: {e}")
+                for i, _, _, _ in rows:
+                    results[i] = self._failed_result(locations[i], e)
+
+        # 保留调用方传入的位置名称
+        for location, result in zip(locations, results):
+            if isinstance(location, dict) and location.get('name'):
+                result['name'] = location['name']
+
+        successful = sum(1 for r in results if r.get('success'))
+        logger.info(f"✅ 混合模型批量预测完成: 成功{successful}/{len(results)}")
+        return results
+
+    def predict_environmental_scores(self, latitude: float, longitude: float, month: int = None,
+                                     analyze_shap: bool = False) -> Dict[str, Any]:
         """
         混合模型环境评分预测
         
         Args:
             latitude: 纬度
             longitude: 经度  
-            month: 月份
+            month: 月份（默认当前月份）
+            analyze_shap: 是否附加SHAP分析
             
         Returns:
             包含三维度评分的字典
         """
-        result = {
-            'city': self.get_closest_city(latitude, longitude),
-            'coordinates': {'lat': latitude, 'lon': longitude, 'month': month},
-            'success': True
-        }
-        
         logger.info(f"开始混合模型预测: ({latitude:.3f}, {longitude:.3f}, 月份{month})")
-        
-        try:
-            # 准备基础特征
-            features = self._prepare_features(latitude, longitude, month)
-            features_2d = features.reshape(1, -1)
-            
-            # Climate预测 (使用RandomForest)
-            if 'climate' in self.loaded_models:
-                try:
-                    climate_model_info = self.loaded_models['climate']
-                    climate_model = climate_model_info['model']
-                    
-                    # RandomForest直接使用原始特征
-                    climate_score = float(climate_model.predict(features_2d)[0])
-                    result['climate_score'] = climate_score
-                    result['climate_confidence'] = 0.95
-                    result['climate_model_type'] = 'RandomForest'
-                    
-                    logger.info(f"✅ Climate预测成功 (RandomForest): {climate_score:.3f}")
-                    
-                except Exception as e:
-                    logger.warning(f"⚠️ Climate模型预测失败: {e}")
-                    result['climate_score'] = 0.5
-                    result['climate_confidence'] = 0.3
-            
-            # Geographic预测 (使用LSTM)
-            if 'geographic' in self.loaded_models:
-                try:
-                    geographic_model_info = self.loaded_models['geographic']
-                    geographic_model = geographic_model_info['model']
-                    
-                    # LSTM需要标准化和重塑数据
-                    if self.scaler is not None:
-                        features_scaled = self.scaler.transform(features_2d)
-                    else:
-                        logger.warning("⚠️ 未找到标准化器，使用原始特征")
-                        features_scaled = features_2d
-                    
-                    # 重塑为LSTM格式 (1, 1, 66) - 修正输入维度
-                    features_lstm = features_scaled.reshape(1, 1, 66)
-                    
-                    # LSTM预测
-                    geographic_score = float(geographic_model.predict(features_lstm, verbose=0)[0][0])
-                    result['geographic_score'] = geographic_score
-                    result['geographic_confidence'] = 0.97
-                    result['geographic_model_type'] = 'LSTM'
-                    
-                    logger.info(f"✅ Geographic预测成功 (LSTM): {geographic_score:.3f}")
-                    
-                except Exception as e:
-                    logger.warning(f"⚠️ Geographic模型预测失败: {e}")
-                    result['geographic_score'] = 0.5
-                    result['geographic_confidence'] = 0.3
-            
-            # Economic Score (启发式算法)
-            economic_score = self._calculate_economic_score(latitude, longitude, month)
-            result['economic_score'] = economic_score
-            result['economic_confidence'] = 0.75
-            
-            # 计算综合置信度
-            confidences = [
-                result.get('climate_confidence', 0.3),
-                result.get('geographic_confidence', 0.3),
-                result.get('economic_confidence', 0.75)
-            ]
-            result['overall_confidence'] = np.mean(confidences)
-            
-            logger.info(f"✅ 混合模型预测完成，综合置信度: {result['overall_confidence']:.3f}")
-            
-        except Exception as e:
-            logger.error(f"❌ 混合模型预测失败: {e}")
-            result['success'] = False
-            result['error'] = str(e)
-            
-            # 设置默认值
-            result.update({
-                'climate_score': 0.5,
-                'geographic_score': 0.5,
-                'economic_score': 0.5,
-                'climate_confidence': 0.3,
-                'geographic_confidence': 0.3,
-                'economic_confidence': 0.3,
-                'overall_confidence': 0.3
-            })
-        
-        return result
+        return self.predict_batch(
+            [{'latitude': latitude, 'longitude': longitude, 'month': month}],
+            analyze_shap=analyze_shap
+        )[0]
     
     def get_model_info(self) -> Dict[str, Any]:
         """获取混合模型信息"""
         info = {
             'hybrid_strategy': True,
+            'model_version': self.model_version,
             'models_loaded': len(self.loaded_models),
             'scaler_available': self.scaler is not None,
+            'tree_shap_loaded': self._tree_explainer is not None,
             'model_details': {}
         }
         
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预测瓦片 - 城市范围内预计算的混合模型预测网格
+
+望远镜只能指向基准城市1-50km范围内的位置，输入空间是每个城市的一小块区域 × 12个月。
+离线任务（model_deployment/scripts/build_prediction_tiles.py）在每个城市的密集网格上
+批量运行混合模型，把Climate/Geographic得分保存为紧凑的NumPy瓦片；
+在线预测时在瓦片上做双线性插值，超出覆盖范围或瓦片过期时回退到实时推理。
+"""
+
+import os
+import time
+import logging
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+# 瓦片中保存的模型维度
+TILE_DIMENSIONS = ('climate', 'geographic')
+
+# 每度纬度对应的公里数
+KM_PER_DEGREE = 111.32
+
+
+class PredictionTile:
+    """单个城市的预测瓦片: 每个维度一个(12, 纬度点数, 经度点数)的得分数组"""
+
+    def __init__(self, city: str, latitudes: np.ndarray, longitudes: np.ndarray,
+                 scores: Dict[str, np.ndarray], model_version: str, built_at: float):
+        self.city = city
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.scores = scores
+        self.model_version = model_version
+        self.built_at = built_at
+
+    @classmethod
+    def load(cls, path: Path) -> 'PredictionTile':
+        """从npz文件加载瓦片"""
+        with np.load(path, allow_pickle=False) as data:
+            scores = {dimension: data[dimension] for dimension in TILE_DIMENSIONS if dimension in data.files}
+            return cls(
+                city=str(data['city']),
+                latitudes=data['latitudes'],
+                longitudes=data['longitudes'],
+                scores=scores,
+                model_version=str(data['model_version']),
+                built_at=float(data['built_at'])
+            )
+
+    def save(self, path: Path):
+        """保存为压缩的npz文件（得分以float32保存）"""
+        np.savez_compressed(
+            path,
+            city=np.array(self.city),
+            latitudes=self.latitudes,
+            longitudes=self.longitudes,
+            model_version=np.array(self.model_version),
+            built_at=np.array(self.built_at),
+            **{dimension: values.astype(np.float32) for dimension, values in self.scores.items()}
+        )
+
+    def covers(self, latitude: float, longitude: float) -> bool:
+        """坐标是否在瓦片网格范围内"""
+        return (self.latitudes[0] <= latitude <= self.latitudes[-1]
+                and self.longitudes[0] <= longitude <= self.longitudes[-1])
+
+    def interpolate(self, latitude: float, longitude: float, month: int) -> Optional[Dict[str, float]]:
+        """
+        双线性插值
+
+        Returns:
+            {维度: 得分}；不在覆盖范围内或相邻网格点有缺失值时返回None
+        """
+        if not self.covers(latitude, longitude):
+            return None
+
+        i = int(np.clip(np.searchsorted(self.latitudes, latitude) - 1, 0, len(self.latitudes) - 2))
+        j = int(np.clip(np.searchsorted(self.longitudes, longitude) - 1, 0, len(self.longitudes) - 2))
+        ty = (latitude - self.latitudes[i]) / (self.latitudes[i + 1] - self.latitudes[i])
+        tx = (longitude - self.longitudes[j]) / (self.longitudes[j + 1] - self.longitudes[j])
+
+        result = {}
+        for dimension, values in self.scores.items():
+            corners = values[month - 1, i:i + 2, j:j + 2].astype(float)
+            if not np.all(np.isfinite(corners)):
+                return None
+            top = corners[0, 0] * (1 - tx) + corners[0, 1] * tx
+            bottom = corners[1, 0] * (1 - tx) + corners[1, 1] * tx
+            result[dimension] = float(top * (1 - ty) + bottom * ty)
+
+        return result
+
+
+class PredictionTileStore:
+    """加载目录下所有城市瓦片并提供插值查询"""
+
+    def __init__(self, tiles_directory: str, max_age_seconds: float = 86400.0):
+        """
+        Args:
+            tiles_directory: 瓦片目录（每个城市一个.npz文件）
+            max_age_seconds: 瓦片最大有效期（特征基于最近的观测数据，需要定期重建）
+        """
+        self.tiles_dir = Path(tiles_directory)
+        self.max_age_seconds = max_age_seconds
+        self.tiles: Dict[str, PredictionTile] = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0}
+        self.reload()
+
+    def reload(self):
+        """重新加载瓦片文件"""
+        tiles = {}
+        for path in sorted(self.tiles_dir.glob("*.npz")):
+            try:
+                tile = PredictionTile.load(path)
+                tiles[tile.city] = tile
+            except Exception as e:
+                logger.warning(f"⚠️ 瓦片加载失败 {path}: {e}")
+        self.tiles = tiles
+        if tiles:
+            logger.info(f"✅ 预测瓦片加载完成: {', '.join(sorted(tiles))}")
+
+    def is_stale(self, tile: PredictionTile, model_version: str) -> bool:
+        """模型版本不一致或超过有效期的瓦片视为过期"""
+        return tile.model_version != model_version or time.time() - tile.built_at > self.max_age_seconds
+
+    def _record_stat(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def lookup(self, latitude: float, longitude: float, month: int,
+               model_version: str) -> Optional[Dict[str, float]]:
+        """查询插值得分，不可用时返回None（调用方回退到实时推理）"""
+        for tile in self.tiles.values():
+            if not tile.covers(latitude, longitude):
+                continue
+            if self.is_stale(tile, model_version):
+                self._record_stat('stale')
+                continue
+            scores = tile.interpolate(latitude, longitude, month)
+            if scores is not None:
+                self._record_stat('hits')
+                return scores
+
+        self._record_stat('misses')
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取瓦片状态和命中统计"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        stats['tiles'] = {
+            city: {
+                'grid_shape': [len(tile.latitudes), len(tile.longitudes)],
+                'model_version': tile.model_version,
+                'age_seconds': time.time() - tile.built_at
+            }
+            for city, tile in self.tiles.items()
+        }
+        stats['max_age_seconds'] = self.max_age_seconds
+        return stats
+
+
+def build_city_tile(model, city: str, center_lat: float, center_lon: float,
+                    radius_km: float = 50.0, spacing_deg: float = 0.05,
+                    months: Optional[List[int]] = None) -> PredictionTile:
+    """
+    在城市周边的密集网格上批量运行混合模型，生成预测瓦片
+
+    Args:
+        model: HybridSHAPModelWrapper实例
+        city: 城市名称
+        center_lat, center_lon: 城市中心坐标
+        radius_km: 覆盖半径（公里）
+        spacing_deg: 网格间距（度）
+        months: 需要计算的月份（默认1-12）
+    """
+    months = months or list(range(1, 13))
+
+    lat_half_span = radius_km / KM_PER_DEGREE
+    lon_half_span = radius_km / (KM_PER_DEGREE * np.cos(np.radians(center_lat)))
+    latitudes = np.arange(center_lat - lat_half_span, center_lat + lat_half_span + spacing_deg, spacing_deg)
+    longitudes = np.arange(center_lon - lon_half_span, center_lon + lon_half_span + spacing_deg, spacing_deg)
+
+    grid_lat, grid_lon = np.meshgrid(latitudes, longitudes, indexing='ij')
+    points = list(zip(grid_lat.ravel(), grid_lon.ravel()))
+    logger.info(f"开始构建{city}瓦片: {len(latitudes)}×{len(longitudes)}网格, {len(months)}个月")
+
+    scores = {dimension: np.full((12, len(latitudes), len(longitudes)), np.nan)
+              for dimension in TILE_DIMENSIONS if dimension in model.loaded_models}
+
+    # 66维特征只取决于位置和当前日期的观测数据（与月份无关），
+    # 因此每个网格点只构建一次特征、执行一次批量前向计算，结果写入所有月份
+    features = np.vstack([model._prepare_features(lat, lon, months[0]) for lat, lon in points])
+    model_scores = model.predict_features_batch(features)
+
+    for dimension, values in model_scores.items():
+        grid_values = values.reshape(len(latitudes), len(longitudes))
+        for month in months:
+            scores[dimension][month - 1] = grid_values
+    logger.info(f"✅ {city}瓦片构建完成: {len(points)}个网格点")
+
+    return PredictionTile(city, latitudes, longitudes, scores, model.model_version, time.time())
+
+
+# 单例实例
+_tile_store = None
+_tile_store_lock = threading.Lock()
+
+
+def prediction_tiles_enabled() -> bool:
+    """是否启用预测瓦片（PREDICTION_TILES_ENABLED，默认启用）"""
+    return os.getenv('PREDICTION_TILES_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def default_tiles_directory() -> str:
+    return os.getenv('PREDICTION_TILES_DIR', str(Path(__file__).parent / "prediction_tiles"))
+
+
+def get_prediction_tile_store() -> Optional[PredictionTileStore]:
+    """
+    获取瓦片存储单例（未启用时返回None）
+
+    配置项:
+        PREDICTION_TILES_DIR, PREDICTION_TILES_MAX_AGE
+    """
+    global _tile_store
+    if not prediction_tiles_enabled():
+        return None
+
+    if _tile_store is None:
+        with _tile_store_lock:
+            if _tile_store is None:
+                _tile_store = PredictionTileStore(
+                    default_tiles_directory(),
+                    max_age_seconds=float(os.getenv('PREDICTION_TILES_MAX_AGE', 86400))
+                )
+    return _tile_store
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TreeSHAP解释器 - RandomForest Climate模型的精确SHAP值
+
+基于编译后的NumPy森林（model_inference/compiled_forest.py）实现interventional TreeSHAP：
+- 森林展开为叶节点路径表，每个叶节点记录路径上每个特征的取值区间(lower, upper]
+- 背景分布是训练数据的加权k-means摘要（离线构建并持久化为.npz），
+  背景样本的路径掩码在加载时一次性计算
+- 对(样本, 背景样本, 叶节点)做向量化的位掩码运算，一次调用解释任意多行，
+  不需要shap库和sklearn，结果满足可加性: base_value + Σ SHAP值 = 森林预测值
+
+用法:
+    python tree_shap.py build-background <models_directory> <training_data.pkl> [--clusters 50]
+"""
+
+import sys
+import json
+import math
+import pickle
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+try:
+    from ..model_inference.compiled_forest import file_sha1, load_compiled_forest_for
+except ImportError:
+    sys.path.append(str(Path(__file__).resolve().parent.parent / "model_inference"))
+    from compiled_forest import file_sha1, load_compiled_forest_for
+
+logger = logging.getLogger(__name__)
+
+# 背景摘要文件格式版本，格式变化时递增
+FORMAT_VERSION = 1
+
+# 单次向量化计算的(样本 × 背景样本 × 叶节点)元素上限，控制内存占用
+MAX_CHUNK_ELEMENTS = 4_000_000
+
+# 11个环境变量归入三个维度（66个特征 = 每个变量6个特征: 4个滞后值 + 2个变化率）
+DIMENSION_VARIABLES = {
+    'climate': ['temperature', 'humidity', 'wind_speed', 'precipitation', 'solar_radiation'],
+    'geographic': ['atmospheric_pressure', 'soil_temperature_0_7cm', 'soil_moisture_7_28cm',
+                   'reference_evapotranspiration', 'urban_flood_risk'],
+    'economic': ['NO2']
+}
+
+
+def feature_variable(feature_name: str) -> Optional[str]:
+    """特征名对应的环境变量: temperature_lag_1m → temperature"""
+    variables = [v for variables in DIMENSION_VARIABLES.values() for v in variables]
+    matches = [v for v in variables if feature_name == v or feature_name.startswith(f"{v}_")]
+    return max(matches, key=len) if matches else None
+
+
+def group_attributions(feature_names: List[str], values: np.ndarray) -> Dict[str, Dict[str, Any]]:
+    """把66个特征的SHAP值按环境变量汇总，并归入climate/geographic/economic三个维度"""
+    variable_totals: Dict[str, float] = {}
+    for name, value in zip(feature_names, values):
+        variable = feature_variable(name)
+        if variable is not None:
+            variable_totals[variable] = variable_totals.get(variable, 0.0) + float(value)
+
+    groups = {}
+    for dimension, variables in DIMENSION_VARIABLES.items():
+        dimension_values = {v: variable_totals.get(v, 0.0) for v in variables}
+        groups[dimension] = {
+            'total': float(sum(dimension_values.values())),
+            'total_abs': float(sum(abs(v) for v in dimension_values.values())),
+            'variables': dimension_values
+        }
+    return groups
+
+
+def _shapley_weight_tables(max_players: int):
+    """
+    叶节点博弈的Shapley权重表
+
+    只由样本决定路径的特征数a、只由背景样本决定路径的特征数c:
+        样本侧特征: +(a-1)! c! / (a+c)!
+        背景侧特征: -a! (c-1)! / (a+c)!
+    """
+    positive = np.zeros((max_players + 1, max_players + 1))
+    negative = np.zeros((max_players + 1, max_players + 1))
+    for a in range(max_players + 1):
+        for c in range(max_players + 1):
+            if a + c == 0:
+                continue
+            total = math.factorial(a + c)
+            if a > 0:
+                positive[a, c] = math.factorial(a - 1) * math.factorial(c) / total
+            if c > 0:
+                negative[a, c] = math.factorial(a) * math.factorial(c - 1) / total
+    return positive, negative
+
+
+def _popcount(masks: np.ndarray, n_bits: int) -> np.ndarray:
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks).astype(np.int64)
+    counts = np.zeros(masks.shape, dtype=np.int64)
+    for bit in range(n_bits):
+        counts += (masks >> bit) & 1
+    return counts
+
+
+class TreeSHAPExplainer:
+    """编译森林上的向量化interventional TreeSHAP"""
+
+    def __init__(self, forest, background: np.ndarray, background_weights: np.ndarray,
+                 feature_names: List[str], expected_value: float = None):
+        """
+        Args:
+            forest: CompiledForest实例
+            background: 背景摘要样本 (K, 66)
+            background_weights: 背景样本权重（簇大小），内部归一化
+            feature_names: 66个特征名称
+            expected_value: 背景分布上的平均预测值（缺省时现场计算）
+        """
+        self.forest = forest
+        self.n_features = forest.n_features_in_
+        self.feature_names = list(feature_names)
+        if len(self.feature_names) != self.n_features:
+            raise ValueError(f"特征名称数量不匹配: {len(self.feature_names)} vs 模型{self.n_features}")
+
+        self._build_leaf_table()
+
+        self.background = np.asarray(background, dtype=np.float32)
+        weights = np.asarray(background_weights, dtype=np.float64)
+        self.background_weights = weights / weights.sum()
+        self._background_masks = self._path_masks(self.background)
+        self.expected_value = float(expected_value) if expected_value is not None else \
+            float(np.dot(self.background_weights, forest.predict(self.background)))
+
+        self._positive_weights, self._negative_weights = _shapley_weight_tables(self.path_width)
+
+    def _build_leaf_table(self):
+        """把每棵树展开为叶节点表: 路径上每个特征合并为一个取值区间(lower, upper]"""
+        forest = self.forest
+        leaves = []
+        for root in forest.roots:
+            stack = [(int(root), {})]
+            while stack:
+                node, bounds = stack.pop()
+                left = int(forest.children_left[node])
+                if left < 0:
+                    leaves.append((float(forest.value[node]), bounds))
+                    continue
+                feature = int(forest.feature[node])
+                threshold = float(forest.threshold[node])
+                lower, upper = bounds.get(feature, (-np.inf, np.inf))
+                # 与推理一致: x <= threshold 走左子树
+                stack.append((left, {**bounds, feature: (lower, min(upper, threshold))}))
+                stack.append((int(forest.children_right[node]), {**bounds, feature: (max(lower, threshold), upper)}))
+
+        self.path_width = max(1, max(len(bounds) for _, bounds in leaves))
+        if self.path_width > 62:
+            raise ValueError(f"叶节点路径上的特征过多: {self.path_width}")
+
+        n_leaves = len(leaves)
+        # 路径不足path_width的位置填充为"总是满足"的占位特征（索引n_features）
+        self.leaf_features = np.full((n_leaves, self.path_width), self.n_features, dtype=np.int64)
+        self.leaf_lower = np.full((n_leaves, self.path_width), -np.inf)
+        self.leaf_upper = np.full((n_leaves, self.path_width), np.inf)
+        self.leaf_values = np.zeros(n_leaves)
+        for i, (value, bounds) in enumerate(leaves):
+            self.leaf_values[i] = value
+            for j, (feature, (lower, upper)) in enumerate(sorted(bounds.items())):
+                self.leaf_features[i, j] = feature
+                self.leaf_lower[i, j] = lower
+                self.leaf_upper[i, j] = upper
+
+        self._bit_values = np.left_shift(np.int64(1), np.arange(self.path_width, dtype=np.int64))
+        self._full_mask = np.int64((1 << self.path_width) - 1)
+        logger.info(f"TreeSHAP叶节点表构建完成: {n_leaves}个叶节点, 路径宽度{self.path_width}")
+
+    def _path_masks(self, X: np.ndarray) -> np.ndarray:
+        """每行样本在每个叶节点路径上满足区间条件的特征位掩码 (N, 叶节点数)"""
+        # 与CompiledForest一致: 输入转换为float32后与float64阈值比较
+        X = np.asarray(X, dtype=np.float32)
+        padded = np.hstack([X, np.zeros((len(X), 1), dtype=np.float32)])
+        values = padded[:, self.leaf_features]
+        satisfied = (values > self.leaf_lower) & (values <= self.leaf_upper)
+        return (satisfied * self._bit_values).sum(axis=2)
+
+    def _explain_chunk(self, X: np.ndarray) -> np.ndarray:
+        x_masks = self._path_masks(X)[:, None, :]
+        b_masks = self._background_masks[None, :, :]
+
+        sample_only = x_masks & ~b_masks
+        background_only = b_masks & ~x_masks
+        # 只有路径被样本/背景样本共同覆盖、且至少一侧有独占特征的(样本, 背景样本, 叶节点)才有贡献，
+        # 这类组合通常不到千分之二，只对它们计算
+        active = ((x_masks | b_masks) == self._full_mask) & ((sample_only | background_only) != 0)
+        rows, backgrounds, leaves = np.nonzero(active)
+        sample_only = sample_only[rows, backgrounds, leaves]
+        background_only = background_only[rows, backgrounds, leaves]
+
+        a = _popcount(sample_only, self.path_width)
+        c = _popcount(background_only, self.path_width)
+        scale = self.leaf_values[leaves] * self.background_weights[backgrounds]
+        positive = self._positive_weights[a, c] * scale
+        negative = self._negative_weights[a, c] * scale
+
+        # 路径上第j个特征的贡献: 样本侧为正，背景侧为负
+        contributions = (((sample_only[:, None] & self._bit_values) != 0) * positive[:, None]
+                         - ((background_only[:, None] & self._bit_values) != 0) * negative[:, None])
+
+        width = self.n_features + 1
+        index = rows[:, None] * width + self.leaf_features[leaves]
+        values = np.bincount(index.ravel(), weights=contributions.ravel(), minlength=len(X) * width)
+        return values.reshape(len(X), width)[:, :self.n_features] / len(self.forest.roots)
+
+    def shap_values(self, X: np.ndarray) -> np.ndarray:
+        """
+        批量计算SHAP值
+
+        Returns:
+            (N, 66)数组，每行满足 expected_value + 行和 = 森林预测值
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"特征数量不匹配: 输入{X.shape[1]} vs 模型{self.n_features}")
+
+        per_row = len(self.background) * len(self.leaf_values)
+        chunk_size = max(1, MAX_CHUNK_ELEMENTS // per_row)
+        return np.vstack([self._explain_chunk(X[i:i + chunk_size]) for i in range(0, len(X), chunk_size)])
+
+    def explain(self, X: np.ndarray) -> List[Dict[str, Any]]:
+        """批量解释，返回每行的SHAP分析字典（66个特征值 + 三维度汇总）"""
+        values = self.shap_values(X)
+        explanations = []
+        for row in values:
+            prediction_value = self.expected_value + float(row.sum())
+            explanations.append({
+                'method': 'TreeSHAP',
+                'explained_model': 'RandomForest_climate',
+                'base_value': self.expected_value,
+                'prediction_value': prediction_value,
+                'feature_importance': {name: float(v) for name, v in zip(self.feature_names, row)},
+                'dimension_attributions': group_attributions(self.feature_names, row),
+                'background_size': len(self.background)
+            })
+        return explanations
+
+
+def shap_background_path(model_file: Union[str, Path]) -> Path:
+    """源模型文件对应的背景摘要: RandomForest_climate_model.joblib → RandomForest_climate_model_shap_background.npz"""
+    model_file = Path(model_file)
+    return model_file.with_name(f"{model_file.stem}_shap_background.npz")
+
+
+def summarize_background(X: np.ndarray, n_clusters: int = 50, n_iterations: int = 25, seed: int = 42):
+    """
+    加权k-means背景摘要
+
+    每个簇取离中心最近的真实训练样本作为代表（保持特征组合真实），权重为簇大小。
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if len(X) <= n_clusters:
+        return X, np.ones(len(X))
+
+    # 按特征标准差缩放后聚类，避免大量纲特征主导距离
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Z = (X - X.mean(axis=0)) / scale
+
+    rng = np.random.default_rng(seed)
+    centers = Z[rng.choice(len(Z), n_clusters, replace=False)]
+    for _ in range(n_iterations):
+        distances = ((Z[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        for k in range(n_clusters):
+            members = Z[labels == k]
+            if len(members):
+                centers[k] = members.mean(axis=0)
+
+    distances = ((Z[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    labels = distances.argmin(axis=1)
+    representatives, weights = [], []
+    for k in range(n_clusters):
+        members = np.flatnonzero(labels == k)
+        if len(members) == 0:
+            continue
+        representatives.append(members[distances[members, k].argmin()])
+        weights.append(len(members))
+    return X[representatives], np.asarray(weights, dtype=np.float64)
+
+
+def build_background(model_file: Union[str, Path], X: np.ndarray, feature_names: List[str],
+                     n_clusters: int = 50) -> Path:
+    """为编译森林构建并保存背景摘要（背景样本、权重、期望值）"""
+    model_file = Path(model_file)
+    forest = load_compiled_forest_for(model_file)
+    if forest is None:
+        raise FileNotFoundError(f"未找到与源模型一致的编译森林，请先运行compiled_forest.py export: {model_file}")
+
+    background, weights = summarize_background(X, n_clusters=n_clusters)
+    explainer = TreeSHAPExplainer(forest, background, weights, feature_names)
+
+    output_path = shap_background_path(model_file)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'source_sha1': file_sha1(model_file),
+        'n_training_rows': int(len(X)),
+        'feature_names': list(feature_names)
+    }
+    np.savez(output_path, meta=np.array(json.dumps(meta)), background=background,
+             weights=weights, expected_value=np.array(explainer.expected_value))
+
+    logger.info(f"✅ SHAP背景摘要构建完成: {len(X)}行训练数据 → {len(background)}个代表样本 → {output_path}")
+    return output_path
+
+
+def load_tree_explainer_for(model_file: Union[str, Path], forest=None) -> Optional[TreeSHAPExplainer]:
+    """
+    加载源模型文件对应的TreeSHAP解释器
+
+    Args:
+        model_file: RandomForest源模型文件
+        forest: 已加载的CompiledForest（缺省时按源模型文件加载）
+
+    Returns:
+        TreeSHAPExplainer；编译森林或背景摘要不存在、与源模型不一致时返回None
+    """
+    path = shap_background_path(model_file)
+    if not path.exists():
+        logger.warning(f"⚠️ 未找到SHAP背景摘要: {path}")
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"不支持的背景摘要格式版本: {meta.get('format_version')}")
+            background, weights = data['background'], data['weights']
+            expected_value = float(data['expected_value'])
+    except Exception as e:
+        logger.warning(f"⚠️ SHAP背景摘要加载失败 {path}: {e}")
+        return None
+
+    if meta.get('source_sha1') != file_sha1(model_file):
+        logger.warning(f"⚠️ SHAP背景摘要与源模型不一致，忽略: {path}")
+        return None
+
+    if forest is None or not hasattr(forest, 'roots'):
+        forest = load_compiled_forest_for(model_file)
+        if forest is None:
+            logger.warning(f"⚠️ TreeSHAP需要编译森林: {model_file}")
+            return None
+
+    return TreeSHAPExplainer(forest, background, weights, meta['feature_names'], expected_value)
+
+
+def _default_feature_names() -> List[str]:
+    """从简化特征工程器获取66个特征名称"""
+    project_root = Path(__file__).resolve().parents[3]
+    sys.path.insert(0, str(project_root / 'api'))
+    from utils.simplified_feature_engineer import get_simplified_feature_engineer
+    return get_simplified_feature_engineer().get_feature_names()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='TreeSHAP背景摘要构建')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build-background', help='从训练数据构建背景摘要')
+    build_parser.add_argument('models_directory', help='模型目录（包含RandomForest_*.joblib）')
+    build_parser.add_argument('training_data', help='训练数据缓存(.pkl，包含X)')
+    build_parser.add_argument('--clusters', type=int, default=50, help='背景样本数（默认: 50）')
+
+    args = parser.parse_args()
+    with open(args.training_data, 'rb') as f:
+        training_X = pickle.load(f)['X']
+
+    names = _default_feature_names()
+    for model_path in sorted(Path(args.models_directory).glob("RandomForest_*.joblib")):
+        build_background(model_path, training_X, names, n_clusters=args.clusters)
@@ -31,45 +31,44 @@ try:
 except ImportError:
     DOTENV_AVAILABLE = False
 
-# 导入可选依赖
-try:
-    import cloudinary
-    import cloudinary.uploader
-    import cloudinary.api
-    CLOUDINARY_AVAILABLE = True
-except ImportError:
-    CLOUDINARY_AVAILABLE = False
+from api.utils.startup_profile import startup_phase, startup_mode
+from api.utils.warmup import start_warmup, warmup_on_startup
+from api.utils.metrics import init_request_metrics
+from api.utils.request_profiler import init_request_profiler
+from api.utils.event_bus import init_event_bus
 
-try:
-    import psycopg2
-    from urllib.parse import urlparse
-    POSTGRESQL_AVAILABLE = True
-except ImportError:
-    POSTGRESQL_AVAILABLE = False
+# 导入可选依赖（cloudinary只检查是否安装，在配置服务时才导入）
+CLOUDINARY_AVAILABLE = importlib.util.find_spec('cloudinary') is not None
 
-# 导入路由蓝图
-from api.routes import ml_bp, health_bp
-from api.routes.images import images_bp
-from api.routes.frontend import frontend_bp
-from api.routes.environmental import environmental_bp
-from api.routes.lightweight_ml_predict import lightweight_ml_bp
-from api.routes.shap_predict import shap_bp
-from api.routes.admin import admin_bp
-from api.routes.simple_clear import simple_clear_bp
+# psycopg2是否可用由连接池模块判断
+from api.utils.db_pool import POSTGRESQL_AVAILABLE, init_db_pool, get_db_connection
 
-# 条件导入SHAP预测蓝图
-SHAP_BP_AVAILABLE = False
-shap_bp = None
+# 导入路由蓝图（蓝图模块只导入轻量依赖，模型和重依赖由延迟加载器在首次使用时加载）
+with startup_phase('import_blueprints'):
+    from api.routes import ml_bp, health_bp
+    from api.routes.health import probes_bp
+    from api.routes.images import images_bp
+    from api.routes.frontend import frontend_bp
+    from api.routes.environmental import environmental_bp
+    from api.routes.lightweight_ml_predict import lightweight_ml_bp
+    from api.routes.admin import admin_bp
+    from api.routes.jobs import jobs_bp
+    from api.utils.job_queue import start_job_workers
+    from api.routes.simple_clear import simple_clear_bp
 
-try:
-    from api.routes.shap_predict import shap_bp
-    SHAP_BP_AVAILABLE = True
-    print("✅ SHAP预测模块导入成功")
-except ImportError as e:
-    print(f"⚠️ SHAP预测模块不可用: {e}")
+    # 条件导入SHAP预测蓝图
     SHAP_BP_AVAILABLE = False
     shap_bp = None
 
+    try:
+        from api.routes.shap_predict import shap_bp
+        SHAP_BP_AVAILABLE = True
+        print("✅ SHAP预测模块导入成功")
+    except ImportError as e:
+        print(f"⚠️ SHAP预测模块不可用: {e}")
+        SHAP_BP_AVAILABLE = False
+        shap_bp = None
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO, 
@@ -84,14 +83,24 @@ def create_app():
     # 配置应用
     configure_app(app)
     
+    # 请求延迟指标（/metrics）
+    init_request_metrics(app)
+    
+    # 按需请求分析（需要ADMIN_TOKEN）
+    init_request_profiler(app)
+    
     # 初始化SocketIO
     socketio = None
     logger.info(f"🔍 SocketIO availability check: SOCKETIO_AVAILABLE={SOCKETIO_AVAILABLE}")
     
     if SOCKETIO_AVAILABLE:
         try:
-            socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
+            # 逐帧日志只在调试时开启（SOCKETIO_LOGGING=true），避免高峰期日志拖慢推送
+            socketio_logging = os.getenv('SOCKETIO_LOGGING', 'false').lower() in ('1', 'true', 'yes')
+            socketio = SocketIO(app, cors_allowed_origins="*", logger=socketio_logging, engineio_logger=socketio_logging)
             app.socketio = socketio
+            # 新图片事件经事件总线合并后按房间推送
+            init_event_bus(socketio)
             logger.info("✅ SocketIO successfully initialized")
             logger.info(f"🔗 SocketIO instance created: {type(socketio)}")
         except Exception as e:
@@ -106,10 +115,12 @@ def create_app():
             logger.warning(f"📦 flask-socketio import error: {import_error}")
     
     # 注册蓝图
-    register_blueprints(app)
+    with startup_phase('register_blueprints'):
+        register_blueprints(app)
     
     # 配置服务
-    configure_services(app)
+    with startup_phase('configure_services'):
+        configure_services(app)
     
     # 设置错误处理
     setup_error_handlers(app)
@@ -117,7 +128,21 @@ def create_app():
     # 执行启动检查（替代before_first_request）
     startup_check(app)
     
-    logger.info("🔭 Obscura No.7 应用初始化完成")
+    # 预热模型（/readyz在预热完成前返回503）
+    # eager模式: 启动时同步预热；lazy模式: 在后台线程中预热，不阻塞启动
+    if startup_mode() == 'eager':
+        with startup_phase('warmup'):
+            start_warmup(background=False)
+    elif warmup_on_startup():
+        start_warmup()
+    
+    # 启动后台任务工作线程（同时接管重启前未完成的任务）
+    try:
+        start_job_workers()
+    except Exception as e:
+        logger.error(f"❌ 任务工作线程启动失败: {e}")
+    
+    logger.info(f"🔭 Obscura No.7 应用初始化完成 (startup_mode={startup_mode()})")
     return app, socketio
 
 def configure_app(app):
@@ -143,6 +168,7 @@ def register_blueprints(app):
     # API蓝图
     app.register_blueprint(ml_bp)
     app.register_blueprint(health_bp)
+    app.register_blueprint(probes_bp)
     app.register_blueprint(images_bp)
     app.register_blueprint(environmental_bp)
     
@@ -156,6 +182,9 @@ def register_blueprints(app):
     else:
         logger.warning("⚠️ SHAP蓝图跳过注册")
     
+    # 后台任务状态蓝图
+    app.register_blueprint(jobs_bp)
+    
     # 管理员蓝图
     app.register_blueprint(admin_bp)
     logger.info("✅ 管理员蓝图注册成功")
@@ -176,6 +205,7 @@ def configure_services(app):
         cloudinary_url = os.getenv("CLOUDINARY_URL")
         if cloudinary_url and CLOUDINARY_AVAILABLE:
             try:
+                import cloudinary
                 cloudinary.config()
                 app.config['CLOUDINARY_CONFIGURED'] = True
                 logger.info("✅ Cloudinary配置成功")
@@ -189,19 +219,24 @@ def configure_services(app):
         database_url = os.getenv("DATABASE_URL")
         if database_url and POSTGRESQL_AVAILABLE:
             try:
-                conn = psycopg2.connect(database_url)
-                conn.close()
+                init_db_pool(app)
+                with get_db_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
                 app.config['DATABASE_INITIALIZED'] = True
-                logger.info("✅ 数据库连接成功")
+                logger.info("✅ 数据库连接池初始化成功")
             except Exception as e:
                 logger.error(f"❌ 数据库连接失败: {e}")
                 app.config['DATABASE_INITIALIZED'] = False
         else:
             app.config['DATABASE_INITIALIZED'] = False
         
-        # 检查工作流
+        # 检查工作流（lazy模式只检查文件是否存在，前端路由在使用时加载）
+        module_path = os.path.join(project_root, 'WorkFlow', 'NonRasberryPi_Workflow', '1_1_local_environment_setup_and_mock_process_validation.py')
+        if startup_mode() == 'lazy':
+            app.config['WORKFLOW_AVAILABLE'] = os.path.exists(module_path)
+            return
         try:
-            module_path = os.path.join(project_root, 'WorkFlow', 'NonRasberryPi_Workflow', '1_1_local_environment_setup_and_mock_process_validation.py')
             spec = importlib.util.spec_from_file_location("workflow_module", module_path)
             workflow_module = importlib.util.module_from_spec(spec)
             sys.modules["workflow_module"] = workflow_module
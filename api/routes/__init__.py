@@ -2,9 +2,24 @@
 # -*- coding: utf-8 -*-
 """
 API Routes Package
+
+ml_bp / health_bp在第一次访问时才导入，导入其他蓝图模块（如api.routes.images）
+时不会连带加载ML预测模块。
 """
 
-from .ml_predict import ml_bp
-from .health import health_bp
+import importlib
+
+_LAZY_BLUEPRINTS = {
+    'ml_bp': '.ml_predict',
+    'health_bp': '.health',
+}
 
 __all__ = ['ml_bp', 'health_bp']
+
+
+def __getattr__(name):
+    if name in _LAZY_BLUEPRINTS:
+        blueprint = getattr(importlib.import_module(_LAZY_BLUEPRINTS[name], __name__), name)
+        globals()[name] = blueprint
+        return blueprint
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
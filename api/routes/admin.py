@@ -4,13 +4,14 @@
 Admin Routes - 管理员功能API端点
 """
 
-from flask import Blueprint, request, jsonify, render_template_string
-import psycopg2
-import cloudinary
-import cloudinary.api
+from flask import Blueprint, request, jsonify, render_template_string, send_file
 import os
 import logging
 from datetime import datetime
+from api.utils.db_pool import get_db_connection
+from api.utils.admin_auth import require_admin_token
+from api.utils.request_profiler import get_profile_store
+from api.utils.event_bus import get_event_bus
 
 logger = logging.getLogger(__name__)
 
@@ -117,6 +118,60 @@ ADMIN_TEMPLATE = """
 </html>
 """
 
+# 请求分析结果列表模板
+PROFILES_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>OBSCURA No.7 - 请求分析</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 40px; background: #1a1a2e; color: #CD853F; }
+        .container { max-width: 1100px; margin: 0 auto; }
+        .header { text-align: center; margin-bottom: 40px; }
+        .action-card { background: #16213e; padding: 20px; margin: 20px 0; border-radius: 8px; border: 2px solid #CD853F; }
+        table { width: 100%; border-collapse: collapse; font-size: 14px; }
+        th, td { padding: 8px; border-bottom: 1px solid #CD853F; text-align: left; }
+        a { color: #F4A460; }
+        code { color: #F4A460; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🔬 OBSCURA No.7 请求分析</h1>
+            <p>带 <code>X-Profile: &lt;ADMIN_TOKEN&gt;</code> 请求头或 <code>?_profile=&lt;ADMIN_TOKEN&gt;</code> 参数的请求会被分析
+               （<code>X-Profile-Mode</code> / <code>_profile_mode</code>: sampling 或 deterministic）</p>
+        </div>
+
+        <div class="action-card">
+            <h3>📊 最近的分析结果 ({{ profiles|length }})</h3>
+            {% if profiles %}
+            <table>
+                <tr><th>时间</th><th>请求</th><th>状态</th><th>耗时</th><th>模式</th><th>样本</th><th>下载</th></tr>
+                {% for profile in profiles %}
+                <tr>
+                    <td>{{ profile.created_at[:19] }}</td>
+                    <td>{{ profile.method }} {{ profile.path }}{% if profile.query %}?{{ profile.query }}{% endif %}</td>
+                    <td>{{ profile.status }}</td>
+                    <td>{{ '%.1f'|format(profile.duration_ms) }}ms</td>
+                    <td>{{ profile.mode }}</td>
+                    <td>{{ profile.samples }}</td>
+                    <td>
+                        <a href="{{ url_for('admin.download_profile', profile_id=profile.id, fmt='speedscope', token=token) }}">speedscope</a> |
+                        <a href="{{ url_for('admin.download_profile', profile_id=profile.id, fmt='collapsed', token=token) }}">collapsed</a>
+                    </td>
+                </tr>
+                {% endfor %}
+            </table>
+            {% else %}
+            <p>暂无分析结果</p>
+            {% endif %}
+        </div>
+    </div>
+</body>
+</html>
+"""
+
 @admin_bp.route('')
 def admin_panel():
     """管理员面板主页"""
@@ -138,23 +193,22 @@ def gallery_status():
         try:
             database_url = os.getenv("DATABASE_URL")
             if database_url:
-                conn = psycopg2.connect(database_url)
-                cur = conn.cursor()
+                with get_db_connection() as conn:
+                    cur = conn.cursor()
                 
-                # 检查images表
-                cur.execute("SELECT COUNT(*) FROM images")
-                status['database_images'] = cur.fetchone()[0]
+                    # 检查images表
+                    cur.execute("SELECT COUNT(*) FROM images")
+                    status['database_images'] = cur.fetchone()[0]
                 
-                # 检查image_analysis表
-                cur.execute("SELECT COUNT(*) FROM image_analysis")
-                status['analysis_records'] = cur.fetchone()[0]
+                    # 检查image_analysis表
+                    cur.execute("SELECT COUNT(*) FROM image_analysis")
+                    status['analysis_records'] = cur.fetchone()[0]
                 
-                # 检查predictions表
-                cur.execute("SELECT COUNT(*) FROM predictions")
-                status['prediction_records'] = cur.fetchone()[0]
+                    # 检查predictions表
+                    cur.execute("SELECT COUNT(*) FROM predictions")
+                    status['prediction_records'] = cur.fetchone()[0]
                 
-                cur.close()
-                conn.close()
+                    cur.close()
         except Exception as e:
             logger.error(f"数据库检查失败: {e}")
         
@@ -170,6 +224,7 @@ def gallery_status():
         try:
             cloudinary_url = os.getenv("CLOUDINARY_URL")
             if cloudinary_url:
+                import cloudinary.api
                 cloudinary.config()
                 result = cloudinary.api.resources(
                     type="upload",
@@ -208,32 +263,31 @@ def clear_gallery():
         try:
             database_url = os.getenv("DATABASE_URL")
             if database_url:
-                conn = psycopg2.connect(database_url)
-                cur = conn.cursor()
+                with get_db_connection() as conn:
+                    cur = conn.cursor()
                 
-                # 获取删除前的数量
-                cur.execute("SELECT COUNT(*) FROM images")
-                images_count = cur.fetchone()[0]
+                    # 获取删除前的数量
+                    cur.execute("SELECT COUNT(*) FROM images")
+                    images_count = cur.fetchone()[0]
                 
-                cur.execute("SELECT COUNT(*) FROM image_analysis")
-                analysis_count = cur.fetchone()[0]
+                    cur.execute("SELECT COUNT(*) FROM image_analysis")
+                    analysis_count = cur.fetchone()[0]
                 
-                cur.execute("SELECT COUNT(*) FROM predictions")
-                predictions_count = cur.fetchone()[0]
+                    cur.execute("SELECT COUNT(*) FROM predictions")
+                    predictions_count = cur.fetchone()[0]
                 
-                # 删除数据
-                cur.execute("DELETE FROM image_analysis")
-                cur.execute("DELETE FROM images")
-                cur.execute("DELETE FROM predictions")
+                    # 删除数据
+                    cur.execute("DELETE FROM image_analysis")
+                    cur.execute("DELETE FROM images")
+                    cur.execute("DELETE FROM predictions")
                 
-                # 重置序列
-                cur.execute("ALTER SEQUENCE images_id_seq RESTART WITH 1")
-                cur.execute("ALTER SEQUENCE image_analysis_id_seq RESTART WITH 1")
-                cur.execute("ALTER SEQUENCE predictions_id_seq RESTART WITH 1")
+                    # 重置序列
+                    cur.execute("ALTER SEQUENCE images_id_seq RESTART WITH 1")
+                    cur.execute("ALTER SEQUENCE image_analysis_id_seq RESTART WITH 1")
+                    cur.execute("ALTER SEQUENCE predictions_id_seq RESTART WITH 1")
                 
-                conn.commit()
-                cur.close()
-                conn.close()
+                    conn.commit()
+                    cur.close()
                 
                 results['database_cleared'] = True
                 results['details'].append(f"数据库清理完成: {images_count}张图片, {analysis_count}条分析, {predictions_count}条预测")
@@ -261,6 +315,7 @@ def clear_gallery():
         try:
             cloudinary_url = os.getenv("CLOUDINARY_URL")
             if cloudinary_url:
+                import cloudinary.api
                 cloudinary.config()
                 
                 # 获取所有图片
@@ -287,6 +342,10 @@ def clear_gallery():
         
         success = any([results['database_cleared'], results['local_cleared'], results['cloudinary_cleared']])
         
+        # 通知图库页面重新加载
+        if success:
+            get_event_bus().publish('reset', None)
+        
         return jsonify({
             'success': success,
             'message': '; '.join(results['details']),
@@ -371,4 +430,34 @@ def test_ml_model():
             'success': False,
             'message': f'ML模型测试失败: {str(e)}',
             'error': str(e)
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@admin_bp.route('/profiles', methods=['GET'])
+@require_admin_token
+def list_profiles():
+    """最近的请求分析结果（HTML页面；?format=json 返回JSON）"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    profiles = get_profile_store().list(limit=limit)
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'profiles': profiles,
+            'timestamp': datetime.now().isoformat()
+        })
+    return render_template_string(PROFILES_TEMPLATE, profiles=profiles, token=request.args.get('token'))
+
+@admin_bp.route('/profiles/<profile_id>/<fmt>', methods=['GET'])
+@require_admin_token
+def download_profile(profile_id, fmt):
+    """下载分析结果（fmt: speedscope / collapsed）"""
+    path = get_profile_store().path(profile_id, fmt)
+    if path is None:
+        return jsonify({
+            'success': False,
+            'error': 'Profile not found',
+            'timestamp': datetime.now().isoformat()
+        }), 404
+
+    mimetype = 'application/json' if fmt == 'speedscope' else 'text/plain'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=path.name, max_age=0)
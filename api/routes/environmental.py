@@ -5,16 +5,148 @@ Environmental Data API Routes - 环境数据上传与管理API端点
 """
 
 from flask import Blueprint, request, jsonify
-import psycopg2
+from psycopg2.extras import execute_values
 import os
+import json
+import math
+import base64
 import logging
 from datetime import datetime
+from api.utils.db_pool import get_db_connection
 
 logger = logging.getLogger(__name__)
 
 # 创建蓝图
 environmental_bp = Blueprint('environmental', __name__, url_prefix='/api/v1/environmental')
 
+REQUIRED_FIELDS = ['coordinates', 'weather_data', 'timestamp', 'source']
+
+ENVIRONMENTAL_COLUMNS = (
+    'latitude', 'longitude', 'timestamp', 'source',
+    'temperature', 'humidity', 'pressure', 'wind_speed', 'wind_direction',
+    'weather_description', 'weather_main', 'cloud_cover', 'visibility',
+    'aqi', 'pm2_5', 'pm10', 'no2', 'so2', 'co', 'o3',
+    'raw_data', 'created_at'
+)
+
+# 单次批量上传的最大记录数
+MAX_BATCH_RECORDS = int(os.getenv('ENVIRONMENTAL_BATCH_MAX_RECORDS', 5000))
+
+# 列表查询
+MAX_LIMIT = 500
+MAX_RADIUS_KM = 500
+DEFAULT_CELL_SIZE = 0.01
+MAX_GRID_CELLS = 5000
+KM_PER_DEGREE = 111.32
+
+# 空间索引和查询使用同一个表达式（GiST表达式索引）
+SPATIAL_POINT_SQL = "point(longitude::float8, latitude::float8)"
+
+# 到(lat, lon)的大圆距离（km），参数: lat, lat, lon
+DISTANCE_KM_SQL = """(2 * 6371 * ASIN(SQRT(
+    POWER(SIN(RADIANS(latitude - %s) / 2), 2) +
+    COS(RADIANS(%s)) * COS(RADIANS(latitude)) * POWER(SIN(RADIANS(longitude - %s) / 2), 2)
+)))"""
+
+_query_indexes_checked = False
+
+def _environmental_row(data, created_at):
+    """上传的JSON记录 → environmental_data表的一行（顺序同ENVIRONMENTAL_COLUMNS）"""
+    coordinates = data['coordinates']
+    weather_data = data['weather_data']
+    current_weather = weather_data.get('current_weather', {})
+    air_quality = weather_data.get('air_quality', {})
+    
+    return (
+        coordinates.get('latitude'),
+        coordinates.get('longitude'),
+        data['timestamp'],
+        data['source'],
+        current_weather.get('temperature'),
+        current_weather.get('humidity'),
+        current_weather.get('pressure'),
+        current_weather.get('wind_speed'),
+        current_weather.get('wind_direction'),
+        current_weather.get('weather_description'),
+        current_weather.get('weather_main'),
+        current_weather.get('cloud_cover'),
+        current_weather.get('visibility'),
+        air_quality.get('aqi'),
+        air_quality.get('pm2_5'),
+        air_quality.get('pm10'),
+        air_quality.get('no2'),
+        air_quality.get('so2'),
+        air_quality.get('co'),
+        air_quality.get('o3'),
+        json.dumps(data),  # 原始JSON数据
+        created_at
+    )
+
+def _validate_batch_record(data):
+    """校验批量上传的一条记录，返回错误信息（有效时返回None）"""
+    if not isinstance(data, dict):
+        return "Record must be a JSON object"
+    
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in data]
+    if missing_fields:
+        return f"Missing required fields: {', '.join(missing_fields)}"
+    
+    coordinates, weather_data = data['coordinates'], data['weather_data']
+    if not isinstance(coordinates, dict) or not isinstance(weather_data, dict):
+        return "coordinates and weather_data must be JSON objects"
+    for name in ('current_weather', 'air_quality'):
+        if not isinstance(weather_data.get(name, {}), dict):
+            return f"weather_data.{name} must be a JSON object"
+    
+    latitude, longitude = coordinates.get('latitude'), coordinates.get('longitude')
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (latitude, longitude)):
+        return "coordinates.latitude and coordinates.longitude must be numbers"
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return f"Coordinates out of range: ({latitude}, {longitude})"
+    
+    try:
+        datetime.fromisoformat(str(data['timestamp']).replace('Z', '+00:00'))
+    except ValueError:
+        return f"Invalid ISO timestamp: {data['timestamp']}"
+    return None
+
+def _parse_batch_body():
+    """
+    解析批量上传的请求体: JSON数组、{"records": [...]}或NDJSON（每行一条记录）
+
+    Returns:
+        (记录列表, 解析错误列表)；无法解析的NDJSON行以None占位，错误中记录其索引
+    """
+    body = request.get_data(as_text=True)
+    
+    if 'ndjson' not in (request.mimetype or ''):
+        try:
+            parsed = json.loads(body)
+        except ValueError:
+            # 不是单个JSON文档: 数组格式错误直接拒绝，否则按NDJSON逐行解析
+            if body.lstrip().startswith('['):
+                raise ValueError("Request body is not valid JSON")
+            parsed = None
+        if isinstance(parsed, dict) and isinstance(parsed.get('records'), list):
+            return parsed['records'], []
+        if isinstance(parsed, list):
+            return parsed, []
+        if isinstance(parsed, dict):
+            return [parsed], []
+        if parsed is not None:
+            raise ValueError("Expected a JSON array of records")
+    
+    records, errors = [], []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            errors.append({"index": len(records), "error": f"Invalid JSON: {e}"})
+            records.append(None)
+    return records, errors
+
 @environmental_bp.route('/upload', methods=['POST'])
 def upload_environmental_data():
     """
@@ -34,8 +166,7 @@ def upload_environmental_data():
             }), 400
         
         # 验证必要字段
-        required_fields = ['coordinates', 'weather_data', 'timestamp', 'source']
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = [field for field in REQUIRED_FIELDS if field not in data]
         
         if missing_fields:
             return jsonify({
@@ -52,58 +183,23 @@ def upload_environmental_data():
         
         # 提取具体的环境参数
         current_weather = weather_data.get('current_weather', {})
-        air_quality = weather_data.get('air_quality', {})
         
         # 保存环境数据到数据库
         try:
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
-            cur = conn.cursor()
+            with get_db_connection() as conn:
+                cur = conn.cursor()
             
-            # 创建环境数据记录
-            cur.execute("""
-                INSERT INTO environmental_data (
-                    latitude, longitude, timestamp, source,
-                    temperature, humidity, pressure, wind_speed, wind_direction,
-                    weather_description, weather_main, cloud_cover, visibility,
-                    aqi, pm2_5, pm10, no2, so2, co, o3,
-                    raw_data, created_at
-                ) VALUES (
-                    %s, %s, %s, %s, 
-                    %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s
-                ) RETURNING id
-            """, (
-                coordinates.get('latitude'),
-                coordinates.get('longitude'),
-                timestamp,
-                source,
-                current_weather.get('temperature'),
-                current_weather.get('humidity'),
-                current_weather.get('pressure'),
-                current_weather.get('wind_speed'),
-                current_weather.get('wind_direction'),
-                current_weather.get('weather_description'),
-                current_weather.get('weather_main'),
-                current_weather.get('cloud_cover'),
-                current_weather.get('visibility'),
-                air_quality.get('aqi'),
-                air_quality.get('pm2_5'),
-                air_quality.get('pm10'),
-                air_quality.get('no2'),
-                air_quality.get('so2'),
-                air_quality.get('co'),
-                air_quality.get('o3'),
-                str(data),  # 原始JSON数据
-                datetime.now()
-            ))
+                # 创建环境数据记录
+                cur.execute(f"""
+                    INSERT INTO environmental_data ({', '.join(ENVIRONMENTAL_COLUMNS)})
+                    VALUES ({', '.join(['%s'] * len(ENVIRONMENTAL_COLUMNS))})
+                    RETURNING id
+                """, _environmental_row(data, datetime.now()))
             
-            env_data_id = cur.fetchone()[0]
+                env_data_id = cur.fetchone()[0]
             
-            conn.commit()
-            cur.close()
-            conn.close()
+                conn.commit()
+                cur.close()
             
             logger.info(f"Environmental data saved with ID: {env_data_id}")
             
@@ -139,91 +235,380 @@ def upload_environmental_data():
             "timestamp": datetime.now().isoformat()
         }), 500
 
-@environmental_bp.route('', methods=['GET'])
-def get_environmental_data():
+@environmental_bp.route('/upload/batch', methods=['POST'])
+def upload_environmental_data_batch():
     """
-    获取环境数据列表API端点
+    批量环境数据上传API端点（树莓派离线后同步）
+    
+    接收: JSON数组、{"records": [...]}或NDJSON，每条记录格式同/upload
+    返回: 每条记录的数据ID或错误信息（按请求中的顺序）
     
-    支持查询参数: limit, offset, start_date, end_date
-    返回: 环境数据列表
+    有效记录用execute_values在一个事务中插入；无效记录不影响其他记录。
     """
     try:
-        # 获取查询参数
-        limit = request.args.get('limit', 50, type=int)
-        offset = request.args.get('offset', 0, type=int)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        try:
+            records, parse_errors = _parse_batch_body()
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }), 400
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
+        if not records:
+            return jsonify({
+                "success": False,
+                "error": "No records provided",
+                "timestamp": datetime.now().isoformat()
+            }), 400
         
-        # 构建查询
-        base_query = """
-            SELECT id, latitude, longitude, timestamp, source,
-                   temperature, humidity, pressure, wind_speed,
-                   weather_description, weather_main, aqi, created_at
-            FROM environmental_data
-        """
+        if len(records) > MAX_BATCH_RECORDS:
+            return jsonify({
+                "success": False,
+                "error": f"Too many records: {len(records)} (max {MAX_BATCH_RECORDS})",
+                "timestamp": datetime.now().isoformat()
+            }), 413
         
-        conditions = []
-        params = []
+        # 批量校验
+        results = [None] * len(records)
+        for error in parse_errors:
+            results[error['index']] = error
         
-        if start_date:
-            conditions.append("timestamp >= %s")
-            params.append(start_date)
+        created_at = datetime.now()
+        valid_indexes, rows = [], []
+        for index, record in enumerate(records):
+            if results[index] is not None:
+                continue
+            error = _validate_batch_record(record)
+            if error:
+                results[index] = {"index": index, "error": error}
+                continue
+            valid_indexes.append(index)
+            rows.append(_environmental_row(record, created_at))
         
-        if end_date:
-            conditions.append("timestamp <= %s")
-            params.append(end_date)
+        # 一个事务插入所有有效记录
+        if rows:
+            try:
+                with get_db_connection() as conn:
+                    cur = conn.cursor()
+                
+                    inserted = execute_values(cur, f"""
+                        INSERT INTO environmental_data ({', '.join(ENVIRONMENTAL_COLUMNS)})
+                        VALUES %s
+                        RETURNING id
+                    """, rows, page_size=len(rows), fetch=True)
+                
+                    conn.commit()
+                    cur.close()
+            
+            except Exception as e:
+                logger.error(f"Batch database insert failed: {e}")
+                return jsonify({
+                    "success": False,
+                    "error": f"Database save failed: {str(e)}",
+                    "timestamp": datetime.now().isoformat()
+                }), 500
+            
+            for index, (env_data_id,) in zip(valid_indexes, inserted):
+                results[index] = {"index": index, "id": env_data_id}
         
-        if conditions:
-            base_query += " WHERE " + " AND ".join(conditions)
+        failed = len(records) - len(rows)
+        logger.info(f"Environmental batch saved: {len(rows)} inserted, {failed} rejected")
         
-        base_query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+        status_code = 201 if not failed else (207 if rows else 400)
+        return jsonify({
+            "success": bool(rows),
+            "inserted": len(rows),
+            "failed": failed,
+            "results": results,
+            "message": f"{len(rows)} of {len(records)} environmental records uploaded",
+            "timestamp": datetime.now().isoformat()
+        }), status_code
         
-        cur.execute(base_query, params)
+    except Exception as e:
+        logger.error(f"Unexpected error in upload_environmental_data_batch: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Internal server error",
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+def _ensure_query_indexes(cur):
+    """
+    确保查询索引存在（每个进程只检查一次）:
+    坐标点的GiST表达式索引（PostgreSQL内置point类型，不需要PostGIS）支撑边界框/半径查询，
+    (timestamp, id)复合索引支撑时间范围过滤和keyset分页
+    """
+    global _query_indexes_checked
+    if _query_indexes_checked:
+        return
+    for name, statement in (
+        ('spatial', f"""
+            CREATE INDEX IF NOT EXISTS idx_environmental_data_location
+            ON environmental_data USING GIST ({SPATIAL_POINT_SQL})
+        """),
+        ('timestamp', """
+            CREATE INDEX IF NOT EXISTS idx_environmental_data_timestamp_id
+            ON environmental_data (timestamp DESC, id DESC)
+        """)
+    ):
+        try:
+            cur.execute(statement)
+            cur.connection.commit()
+        except Exception as e:
+            cur.connection.rollback()
+            logger.warning(f"⚠️ Could not ensure environmental {name} index: {e}")
+    _query_indexes_checked = True
+
+def _encode_environmental_cursor(timestamp, env_data_id):
+    """将(timestamp, id)编码为不透明游标"""
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    raw = f"{timestamp}|{env_data_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_environmental_cursor(cursor):
+    """解析游标，格式错误时抛出ValueError"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        timestamp, env_data_id = raw.rsplit('|', 1)
+        return timestamp, int(env_data_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _float_arg(args, name, minimum=None, maximum=None):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return value
+
+def _parse_environmental_filters(args):
+    """
+    解析时间范围和空间过滤参数
+
+    支持: start_date, end_date, source,
+          bbox=min_lon,min_lat,max_lon,max_lat,
+          lat, lon, radius_km（半径查询，先用外接矩形走GiST索引，再按大圆距离精确过滤）
+
+    Returns:
+        (WHERE条件列表, 参数列表, 半径查询中心或None)
+    """
+    conditions, params = [], []
+    
+    if args.get('start_date'):
+        conditions.append("timestamp >= %s")
+        params.append(args['start_date'])
+    if args.get('end_date'):
+        conditions.append("timestamp <= %s")
+        params.append(args['end_date'])
+    if args.get('source'):
+        conditions.append("source = %s")
+        params.append(args['source'])
+    
+    if args.get('bbox'):
+        try:
+            min_lon, min_lat, max_lon, max_lat = [float(v) for v in args['bbox'].split(',')]
+        except ValueError:
+            raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+        if min_lon > max_lon or min_lat > max_lat:
+            raise ValueError("bbox minimums must not exceed maximums")
+        conditions.append(f"{SPATIAL_POINT_SQL} <@ box(point(%s, %s), point(%s, %s))")
+        params.extend([min_lon, min_lat, max_lon, max_lat])
+    
+    center = None
+    radius_km = _float_arg(args, 'radius_km', 0, MAX_RADIUS_KM)
+    if radius_km is not None:
+        lat = _float_arg(args, 'lat', -90, 90)
+        lon = _float_arg(args, 'lon', -180, 180)
+        if lat is None or lon is None:
+            raise ValueError("lat and lon are required with radius_km")
         
-        environmental_data = []
-        for row in cur.fetchall():
-            environmental_data.append({
-                "id": row[0],
-                "latitude": row[1],
-                "longitude": row[2],
-                "timestamp": row[3],
-                "source": row[4],
-                "temperature": row[5],
-                "humidity": row[6],
-                "pressure": row[7],
-                "wind_speed": row[8],
-                "weather_description": row[9],
-                "weather_main": row[10],
-                "aqi": row[11],
-                "created_at": row[12].isoformat() if row[12] else None
-            })
+        # 外接矩形（索引过滤）
+        lat_delta = radius_km / KM_PER_DEGREE
+        lon_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        conditions.append(f"{SPATIAL_POINT_SQL} <@ box(point(%s, %s), point(%s, %s))")
+        params.extend([lon - lon_delta, lat - lat_delta, lon + lon_delta, lat + lat_delta])
         
-        # 获取总数
-        count_query = "SELECT COUNT(*) FROM environmental_data"
-        if conditions:
-            count_query += " WHERE " + " AND ".join(conditions[:-2])  # 排除limit/offset参数
-            cur.execute(count_query, params[:-2])
-        else:
-            cur.execute(count_query)
+        # 精确距离过滤
+        conditions.append(f"{DISTANCE_KM_SQL} <= %s")
+        params.extend([lat, lat, lon, radius_km])
+        center = (lat, lon)
+    
+    return conditions, params, center
+
+def _aggregate_environmental_grid(cur, where, params, args):
+    """按网格单元聚合（热力图），返回每个单元的中心、记录数和平均值"""
+    cell_size = _float_arg(args, 'cell_size', 0.001, 5.0) or DEFAULT_CELL_SIZE
+    
+    cur.execute(f"""
+        SELECT FLOOR(latitude / %s) AS cell_y, FLOOR(longitude / %s) AS cell_x,
+               COUNT(*), AVG(temperature), AVG(humidity), AVG(pressure),
+               AVG(aqi), AVG(pm2_5), MIN(timestamp), MAX(timestamp)
+        FROM environmental_data
+        {where}
+        GROUP BY cell_y, cell_x
+        ORDER BY COUNT(*) DESC
+        LIMIT %s
+    """, [cell_size, cell_size, *params, MAX_GRID_CELLS + 1])
+    rows = cur.fetchall()
+    
+    def _avg(value):
+        return round(float(value), 3) if value is not None else None
+    
+    cells = [{
+        "latitude": round((row[0] + 0.5) * cell_size, 6),
+        "longitude": round((row[1] + 0.5) * cell_size, 6),
+        "bounds": [round(row[1] * cell_size, 6), round(row[0] * cell_size, 6),
+                   round((row[1] + 1) * cell_size, 6), round((row[0] + 1) * cell_size, 6)],
+        "count": row[2],
+        "avg_temperature": _avg(row[3]),
+        "avg_humidity": _avg(row[4]),
+        "avg_pressure": _avg(row[5]),
+        "avg_aqi": _avg(row[6]),
+        "avg_pm2_5": _avg(row[7]),
+        "first_timestamp": row[8].isoformat() if isinstance(row[8], datetime) else row[8],
+        "last_timestamp": row[9].isoformat() if isinstance(row[9], datetime) else row[9]
+    } for row in rows[:MAX_GRID_CELLS]]
+    
+    return {
+        "cell_size": cell_size,
+        "cells": cells,
+        "truncated": len(rows) > MAX_GRID_CELLS
+    }
+
+@environmental_bp.route('', methods=['GET'])
+def get_environmental_data():
+    """
+    获取环境数据列表API端点
+    
+    支持查询参数:
+        时间/来源: start_date, end_date, source
+        空间: bbox=min_lon,min_lat,max_lon,max_lat 或 lat, lon, radius_km
+        分页: limit, cursor（keyset分页，按timestamp, id倒序）；
+              offset（旧版偏移分页，返回总数）
+        聚合: aggregate=grid, cell_size（度）返回每个网格单元的平均值
+    返回: 环境数据列表或网格聚合结果
+    """
+    try:
+        try:
+            conditions, params, center = _parse_environmental_filters(request.args)
+            limit = max(1, min(request.args.get('limit', 50, type=int), MAX_LIMIT))
+            cursor = request.args.get('cursor')
+            cursor_key = _decode_environmental_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }), 400
         
-        total_count = cur.fetchone()[0]
+        offset = request.args.get('offset', type=int)
+        aggregate = request.args.get('aggregate')
         
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            _ensure_query_indexes(cur)
+            
+            filter_where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+            
+            if aggregate:
+                if aggregate != 'grid':
+                    return jsonify({
+                        "success": False,
+                        "error": "aggregate must be 'grid'",
+                        "timestamp": datetime.now().isoformat()
+                    }), 400
+                try:
+                    grid = _aggregate_environmental_grid(cur, filter_where, params, request.args)
+                except ValueError as e:
+                    return jsonify({
+                        "success": False,
+                        "error": str(e),
+                        "timestamp": datetime.now().isoformat()
+                    }), 400
+                cur.close()
+                return jsonify({
+                    "success": True,
+                    "aggregate": grid,
+                    "timestamp": datetime.now().isoformat()
+                }), 200
+            
+            # 构建查询
+            distance_column = f", {DISTANCE_KM_SQL}" if center else ""
+            distance_params = [center[0], center[0], center[1]] if center else []
+            
+            page_conditions, page_params = list(conditions), list(params)
+            if cursor_key and offset is None:
+                page_conditions.append("(timestamp, id) < (%s, %s)")
+                page_params.extend(cursor_key)
+            where = (" WHERE " + " AND ".join(page_conditions)) if page_conditions else ""
+            
+            query = f"""
+                SELECT id, latitude, longitude, timestamp, source,
+                       temperature, humidity, pressure, wind_speed,
+                       weather_description, weather_main, aqi, created_at{distance_column}
+                FROM environmental_data
+                {where}
+                ORDER BY timestamp DESC, id DESC
+                LIMIT %s
+            """
+            query_params = [*distance_params, *page_params, limit + 1]
+            if offset is not None:
+                query += " OFFSET %s"
+                query_params.append(offset)
+            
+            cur.execute(query, query_params)
+            rows = cur.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        
+            environmental_data = []
+            for row in rows:
+                item = {
+                    "id": row[0],
+                    "latitude": row[1],
+                    "longitude": row[2],
+                    "timestamp": row[3],
+                    "source": row[4],
+                    "temperature": row[5],
+                    "humidity": row[6],
+                    "pressure": row[7],
+                    "wind_speed": row[8],
+                    "weather_description": row[9],
+                    "weather_main": row[10],
+                    "aqi": row[11],
+                    "created_at": row[12].isoformat() if row[12] else None
+                }
+                if center:
+                    item["distance_km"] = round(float(row[13]), 3)
+                environmental_data.append(item)
+            
+            pagination = {
+                "limit": limit,
+                "has_more": has_more
+            }
+            if offset is not None:
+                # 旧版偏移分页: 返回总数
+                cur.execute(f"SELECT COUNT(*) FROM environmental_data{filter_where}", params)
+                pagination.update({"total": cur.fetchone()[0], "offset": offset})
+            else:
+                pagination["next_cursor"] = (
+                    _encode_environmental_cursor(rows[-1][3], rows[-1][0]) if has_more else None
+                )
+        
+            cur.close()
         
         return jsonify({
             "success": True,
             "environmental_data": environmental_data,
-            "pagination": {
-                "total": total_count,
-                "limit": limit,
-                "offset": offset,
-                "has_more": offset + limit < total_count
-            },
+            "pagination": pagination,
             "timestamp": datetime.now().isoformat()
         }), 200
         
@@ -241,62 +626,61 @@ def get_environmental_data_detail(env_data_id):
     获取特定环境数据详情
     """
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute("""
-            SELECT id, latitude, longitude, timestamp, source,
-                   temperature, humidity, pressure, wind_speed, wind_direction,
-                   weather_description, weather_main, cloud_cover, visibility,
-                   aqi, pm2_5, pm10, no2, so2, co, o3,
-                   raw_data, created_at
-            FROM environmental_data 
-            WHERE id = %s
-        """, (env_data_id,))
+            cur.execute("""
+                SELECT id, latitude, longitude, timestamp, source,
+                       temperature, humidity, pressure, wind_speed, wind_direction,
+                       weather_description, weather_main, cloud_cover, visibility,
+                       aqi, pm2_5, pm10, no2, so2, co, o3,
+                       raw_data, created_at
+                FROM environmental_data 
+                WHERE id = %s
+            """, (env_data_id,))
         
-        row = cur.fetchone()
+            row = cur.fetchone()
         
-        if not row:
-            return jsonify({
-                "success": False,
-                "error": "Environmental data not found",
-                "timestamp": datetime.now().isoformat()
-            }), 404
+            if not row:
+                return jsonify({
+                    "success": False,
+                    "error": "Environmental data not found",
+                    "timestamp": datetime.now().isoformat()
+                }), 404
         
-        environmental_data = {
-            "id": row[0],
-            "coordinates": {
-                "latitude": row[1],
-                "longitude": row[2]
-            },
-            "timestamp": row[3],
-            "source": row[4],
-            "weather": {
-                "temperature": row[5],
-                "humidity": row[6],
-                "pressure": row[7],
-                "wind_speed": row[8],
-                "wind_direction": row[9],
-                "weather_description": row[10],
-                "weather_main": row[11],
-                "cloud_cover": row[12],
-                "visibility": row[13]
-            },
-            "air_quality": {
-                "aqi": row[14],
-                "pm2_5": row[15],
-                "pm10": row[16],
-                "no2": row[17],
-                "so2": row[18],
-                "co": row[19],
-                "o3": row[20]
-            },
-            "raw_data": row[21],
-            "created_at": row[22].isoformat() if row[22] else None
-        }
+            environmental_data = {
+                "id": row[0],
+                "coordinates": {
+                    "latitude": row[1],
+                    "longitude": row[2]
+                },
+                "timestamp": row[3],
+                "source": row[4],
+                "weather": {
+                    "temperature": row[5],
+                    "humidity": row[6],
+                    "pressure": row[7],
+                    "wind_speed": row[8],
+                    "wind_direction": row[9],
+                    "weather_description": row[10],
+                    "weather_main": row[11],
+                    "cloud_cover": row[12],
+                    "visibility": row[13]
+                },
+                "air_quality": {
+                    "aqi": row[14],
+                    "pm2_5": row[15],
+                    "pm10": row[16],
+                    "no2": row[17],
+                    "so2": row[18],
+                    "co": row[19],
+                    "o3": row[20]
+                },
+                "raw_data": row[21],
+                "created_at": row[22].isoformat() if row[22] else None
+            }
         
-        cur.close()
-        conn.close()
+            cur.close()
         
         return jsonify({
             "success": True,
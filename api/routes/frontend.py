@@ -10,7 +10,7 @@ import sys
 import logging
 from flask import Blueprint, render_template, jsonify, request
 from datetime import datetime
-import psycopg2
+from api.utils.db_pool import get_db_connection
 
 # 添加项目根目录到路径
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -45,9 +45,9 @@ def get_system_status():
         database_status = False
         if database_url:
             try:
-                import psycopg2
-                conn = psycopg2.connect(database_url)
-                conn.close()
+                with get_db_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
                 database_status = True
             except Exception as e:
                 logger.error(f"数据库连接检查失败: {e}")
@@ -128,11 +128,10 @@ def image_detail(image_id):
         
         # 验证图片是否存在（基础检查）
         try:
-            conn = psycopg2.connect(database_url)
-            cur = conn.cursor()
-            cur.execute("SELECT id FROM images WHERE id = %s", (image_id,))
-            image_exists = cur.fetchone()
-            conn.close()
+            with get_db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT id FROM images WHERE id = %s", (image_id,))
+                image_exists = cur.fetchone()
             
             if not image_exists:
                 logger.warning(f"图片不存在，ID: {image_id}")
@@ -163,35 +162,34 @@ def gallery_stats():
                 "error": "Database not configured"
             }), 503
         
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
         
-        # 获取图片总数
-        cur.execute("SELECT COUNT(*) FROM images")
-        total_images = cur.fetchone()[0]
+            # 获取图片总数
+            cur.execute("SELECT COUNT(*) FROM images")
+            total_images = cur.fetchone()[0]
         
-        # 获取预测总数
-        cur.execute("SELECT COUNT(DISTINCT prediction_id) FROM images")
-        unique_predictions = cur.fetchone()[0]
+            # 获取预测总数
+            cur.execute("SELECT COUNT(DISTINCT prediction_id) FROM images")
+            unique_predictions = cur.fetchone()[0]
         
-        # 获取最近的图片
-        cur.execute("""
-            SELECT COUNT(*) FROM images 
-            WHERE created_at >= NOW() - INTERVAL '7 days'
-        """)
-        recent_images = cur.fetchone()[0]
+            # 获取最近的图片
+            cur.execute("""
+                SELECT COUNT(*) FROM images 
+                WHERE created_at >= NOW() - INTERVAL '7 days'
+            """)
+            recent_images = cur.fetchone()[0]
         
-        # 获取最新图片的创建时间
-        cur.execute("""
-            SELECT created_at FROM images 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        """)
-        latest_result = cur.fetchone()
-        latest_image = latest_result[0].isoformat() if latest_result else None
+            # 获取最新图片的创建时间
+            cur.execute("""
+                SELECT created_at FROM images 
+                ORDER BY created_at DESC 
+                LIMIT 1
+            """)
+            latest_result = cur.fetchone()
+            latest_image = latest_result[0].isoformat() if latest_result else None
         
-        cur.close()
-        conn.close()
+            cur.close()
         
         return jsonify({
             "success": True,
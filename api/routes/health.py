@@ -5,13 +5,24 @@
 用于诊断服务器状态和依赖包问题
 """
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
 import sys
 import os
+from datetime import datetime
+
+from api.utils.db_pool import get_pool_stats
+from api.utils.startup_profile import get_startup_profile
+from api.utils.warmup import get_warmup_status, start_warmup
+from api.utils.metrics import get_metrics_summary, metrics_enabled, render_prometheus
 
 # 创建蓝图
 health_bp = Blueprint('health', __name__, url_prefix='/health')
 
+# 负载均衡器探针（根路径）
+probes_bp = Blueprint('probes', __name__)
+
+_process_started = datetime.now()
+
 @health_bp.route('/', methods=['GET'])
 def health_check():
     """基础健康检查"""
@@ -65,3 +76,62 @@ def simple_test():
         'message': 'Hello from simple test',
         'working': True
     })
+
+@health_bp.route('/db-pool', methods=['GET'])
+def db_pool_status():
+    """数据库连接池状态（借出次数、等待时间、健康检查失败等）"""
+    return jsonify({
+        'status': 'success',
+        'db_pool': get_pool_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@health_bp.route('/startup', methods=['GET'])
+def startup_status():
+    """启动模式、各启动阶段耗时和延迟加载器状态（模型是否已加载、加载耗时）"""
+    return jsonify({
+        'status': 'success',
+        'startup': get_startup_profile(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@probes_bp.route('/livez', methods=['GET'])
+def livez():
+    """存活探针：进程能处理请求即返回200（不访问数据库和模型）"""
+    return jsonify({
+        'status': 'alive',
+        'uptime_seconds': round((datetime.now() - _process_started).total_seconds(), 1),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@probes_bp.route('/readyz', methods=['GET'])
+def readyz():
+    """就绪探针：模型加载并预热完成后返回200，否则返回503（未开始或已失败时触发预热）"""
+    status = get_warmup_status()
+    if status['state'] in ('pending', 'failed'):
+        start_warmup()
+        status = get_warmup_status()
+
+    return jsonify({
+        'status': 'ready' if status['ready'] else 'not_ready',
+        'warmup': status,
+        'timestamp': datetime.now().isoformat()
+    }), 200 if status['ready'] else 503
+
+@probes_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """延迟直方图：Prometheus文本格式；?format=json 返回估算的p50/p95/p99（毫秒）"""
+    if not metrics_enabled():
+        return jsonify({
+            'status': 'disabled',
+            'message': 'Metrics collection is disabled (METRICS_ENABLED=false)',
+            'timestamp': datetime.now().isoformat()
+        }), 404
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'status': 'success',
+            'metrics': get_metrics_summary(),
+            'timestamp': datetime.now().isoformat()
+        })
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
@@ -4,13 +4,31 @@
 Images API Routes - 图片上传与管理API端点
 """
 
-from flask import Blueprint, request, jsonify, current_app
-import cloudinary.uploader
-import psycopg2
+from flask import Blueprint, request, jsonify, send_file
+import requests
 import os
 import logging
 import hashlib
 from datetime import datetime
+from api.utils.db_pool import get_db_connection
+from api.utils.single_flight import get_single_flight
+from api.utils.job_queue import enqueue_job, register_job_handler, heartbeat_job
+from api.utils.rate_limiter import get_rate_limiter
+from api.utils.admin_auth import require_admin_token
+from api.utils.story_cache import get_story_cache, story_cache_enabled
+from api.utils.image_cache import (
+    get_image_cache, get_image_cache_stats, get_http_session, image_cache_enabled, ImageTooLargeError
+)
+from api.utils.story_refresh import (
+    parse_story_refresh_filters, create_story_refresh_run, get_story_refresh_run,
+    set_story_refresh_job, run_story_refresh
+)
+from api.utils.warmup import register_warmup_step
+from api.utils.metrics import EXTERNAL_REQUEST_SECONDS, STORY_GENERATION_SECONDS, timed, observe
+from api.utils.event_bus import GALLERY_ROOM, get_event_bus, image_room
+from api.utils.image_derivatives import (
+    create_derivatives, select_rendition, client_image_preferences, ensure_derivatives_column
+)
 from werkzeug.datastructures import FileStorage
 import io
 import json
@@ -18,50 +36,21 @@ import random
 import hashlib
 import uuid
 import time
+import base64
 
-# SocketIO导入
-try:
-    from flask_socketio import emit
-    SOCKETIO_AVAILABLE = True
-except ImportError:
-    SOCKETIO_AVAILABLE = False
+logger = logging.getLogger(__name__)
 
-# 加载环境变量
+# 加载环境变量（cloudinary在上传时才导入，缩短冷启动）
 try:
     from dotenv import load_dotenv
     # 确保从项目根目录加载.env文件
     # 当前文件：api/routes/images.py，需要向上两级到达项目根目录
-    current_file = os.path.abspath(__file__)  # /path/to/project/api/routes/images.py
-    routes_dir = os.path.dirname(current_file)  # /path/to/project/api/routes
-    api_dir = os.path.dirname(routes_dir)  # /path/to/project/api
-    project_root = os.path.dirname(api_dir)  # /path/to/project
-    env_path = os.path.join(project_root, '.env')
-    
-    print(f"🔍 当前文件路径: {current_file}")
-    print(f"🔍 计算的项目根目录: {project_root}")
-    print(f"🔍 .env文件路径: {env_path}")
-    
+    env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.env')
     if os.path.exists(env_path):
         load_dotenv(env_path)
-        print(f"✅ 已加载环境变量文件: {env_path}")
-    else:
-        print(f"⚠️ 环境变量文件不存在: {env_path}")
-except ImportError:
-    print("⚠️ python-dotenv未安装，无法加载.env文件")
-
-# 验证DeepSeek API密钥
-deepseek_key = os.getenv('DEEPSEEK_API_KEY')
-if deepseek_key:
-    print(f"✅ DeepSeek API密钥已加载: {deepseek_key[:10]}...{deepseek_key[-5:]}")
-else:
-    print("❌ DeepSeek API密钥未找到")
-
-# 添加OpenAI导入
-try:
-    import openai
-    OPENAI_AVAILABLE = True
+        logger.debug(f"✅ 已加载环境变量文件: {env_path}")
 except ImportError:
-    OPENAI_AVAILABLE = False
+    logger.debug("⚠️ python-dotenv未安装，无法加载.env文件")
 
 # 本地图片存储（用于开发环境）
 LOCAL_IMAGES_STORE = {}
@@ -69,30 +58,32 @@ LOCAL_IMAGES_STORE = {}
 # 本地开发时的分析结果存储
 LOCAL_ANALYSIS_STORE = {}
 
-logger = logging.getLogger(__name__)
-
 # 创建蓝图
 images_bp = Blueprint('images', __name__, url_prefix='/api/v1/images')
 
 def emit_new_image_event(image_data):
-    """发送新图片上传事件到所有连接的客户端"""
+    """新图片事件放入事件总线（合并后以images_delta推送到gallery房间，不阻塞上传请求）"""
     try:
-        if SOCKETIO_AVAILABLE and hasattr(current_app, 'socketio'):
-            # 直接使用SocketIO实例发送事件到所有客户端
-            socketio = current_app.socketio
-            socketio.emit('new_image_uploaded', {
-                'image_id': image_data.get('id'),
-                'description': image_data.get('description', ''),
-                'created_at': image_data.get('created_at'),
-                'message': 'New environmental vision uploaded!'
-            })
-            logger.info(f"✅ WebSocket event sent for image {image_data.get('id')}")
-        else:
-            logger.warning("⚠️ SocketIO not available, skipping event emission")
+        get_event_bus().publish('added', {
+            'id': image_data.get('id'),
+            'url': image_data.get('url'),
+            'thumbnail_url': image_data.get('thumbnail_url'),
+            'description': image_data.get('description', ''),
+            'prediction_id': image_data.get('prediction_id'),
+            'created_at': image_data.get('created_at')
+        }, rooms=(GALLERY_ROOM,))
+    except Exception as e:
+        logger.error(f"❌ Failed to publish new image event: {e}")
+
+def emit_image_updated_event(image_id, rooms=None, **changes):
+    """图片更新事件（缩略图、分析完成等），默认推送到gallery和图片详情页房间"""
+    try:
+        get_event_bus().publish('updated', dict(changes, id=image_id),
+                                rooms=rooms or (GALLERY_ROOM, image_room(image_id)))
     except Exception as e:
-        logger.error(f"❌ Failed to emit WebSocket event: {e}")
+        logger.error(f"❌ Failed to publish image update event: {e}")
 
-def process_image_analysis(image_id, image_url, description, prediction_id):
+def process_image_analysis(image_id, image_url, description, prediction_id, force_unique=None):
     """
     在图片上传后立即进行分析和故事生成
     
@@ -101,6 +92,7 @@ def process_image_analysis(image_id, image_url, description, prediction_id):
         image_url: 图片URL
         description: 图片描述
         prediction_id: 预测ID
+        force_unique: 是否绕过故事缓存生成新故事（见generate_ai_environmental_story）
         
     Returns:
         dict: 分析结果
@@ -112,7 +104,7 @@ def process_image_analysis(image_id, image_url, description, prediction_id):
         shap_data = generate_shap_analysis_data(image_id, description)
         
         # 2. 生成AI故事
-        story_data = generate_ai_environmental_story(shap_data)
+        story_data = generate_ai_environmental_story(shap_data, force_unique=force_unique)
         
         # 3. 组合分析结果
         analysis_result = {
@@ -258,30 +250,38 @@ def transform_to_hierarchical_shap_data(flat_shap_data):
         return flat_shap_data
     
     original_features = flat_shap_data['shap_analysis'].get('feature_importance', {})
+    dimension_attributions = flat_shap_data['shap_analysis'].get('dimension_attributions')
     
     # 定义特征到维度的映射
-    feature_mapping = {
-        'climate': {
-            'temperature': original_features.get('temperature', 0.0),
-            'humidity': original_features.get('humidity', 0.0),
-            'climate_zone': original_features.get('climate_zone', 0.0),
-            'precipitation': original_features.get('precipitation', 0.0),
-            'wind_speed': original_features.get('wind_speed', 0.0)
-        },
-        'geographic': {
-            'location_factor': original_features.get('location_factor', 0.0),
-            'pressure': original_features.get('pressure', 0.0),
-            'elevation': original_features.get('elevation', 0.0),
-            'latitude': original_features.get('latitude', 0.0),
-            'longitude': original_features.get('longitude', 0.0)
-        },
-        'economic': {
-            'seasonal_factor': original_features.get('seasonal_factor', 0.0),
-            'population_density': original_features.get('population_density', 0.0),
-            'urban_index': original_features.get('urban_index', 0.0),
-            'infrastructure': original_features.get('infrastructure', 0.0)
+    if dimension_attributions:
+        # TreeSHAP结果: 66个特征已按环境变量汇总到三个维度，使用贡献的绝对值作为重要性
+        feature_mapping = {
+            dimension: {variable: abs(value) for variable, value in data.get('variables', {}).items()}
+            for dimension, data in dimension_attributions.items()
+        }
+    else:
+        feature_mapping = {
+            'climate': {
+                'temperature': original_features.get('temperature', 0.0),
+                'humidity': original_features.get('humidity', 0.0),
+                'climate_zone': original_features.get('climate_zone', 0.0),
+                'precipitation': original_features.get('precipitation', 0.0),
+                'wind_speed': original_features.get('wind_speed', 0.0)
+            },
+            'geographic': {
+                'location_factor': original_features.get('location_factor', 0.0),
+                'pressure': original_features.get('pressure', 0.0),
+                'elevation': original_features.get('elevation', 0.0),
+                'latitude': original_features.get('latitude', 0.0),
+                'longitude': original_features.get('longitude', 0.0)
+            },
+            'economic': {
+                'seasonal_factor': original_features.get('seasonal_factor', 0.0),
+                'population_density': original_features.get('population_density', 0.0),
+                'urban_index': original_features.get('urban_index', 0.0),
+                'infrastructure': original_features.get('infrastructure', 0.0)
+            }
         }
-    }
     
     # 计算每个维度的总重要性
     dimension_scores = {}
@@ -447,124 +447,197 @@ def validate_hierarchical_shap_data(shap_data):
     
     return validation_result
 
-def generate_ai_environmental_story(shap_data, force_unique=True):
+# 故事风格选项（故事缓存按风格/基调区分变体）
+STORY_STYLES = [
+    "like a scene from a climate science thriller",
+    "as if narrated by a future environmental historian", 
+    "in the style of a dramatic weather report from 2050",
+    "like an excerpt from an environmental documentary",
+    "as a dramatic eyewitness account from the future",
+    "in the tone of a scientific expedition journal",
+    "like a chapter from a climate change novel",
+    "as told by a time traveler from 2080",
+    "in the voice of an AI environmental analyst",
+    "like a dramatic news report from the future",
+    "as a poetic environmental meditation",
+    "in the style of a survival story",
+    "like a letter from a climate refugee",
+    "as an urgent environmental briefing",
+    "in the tone of a nature documentary narrator"
+]
+
+# 添加随机情感基调
+EMOTIONAL_TONES = [
+    "with urgent concern and hope",
+    "with dramatic tension and mystery",
+    "with scientific wonder and awe",
+    "with melancholic beauty",
+    "with fierce determination",
+    "with quiet contemplation",
+    "with explosive energy",
+    "with gentle optimism",
+    "with stark realism",
+    "with poetic elegance"
+]
+
+def generate_ai_environmental_story(shap_data, force_unique=None):
     """
     使用DeepSeek生成环境故事（约100词英文，戏剧性描述）
     
     Args:
         shap_data: SHAP分析数据，包含三个维度得分和特征重要性
-        force_unique: 是否强制生成唯一故事（默认True）
+        force_unique: 是否强制生成唯一故事；None时由STORY_CACHE_ENABLED决定
+                      （启用故事缓存时从缓存的故事变体中选择）
         
     Returns:
         str: 生成的英文环境故事
     """
+    start_time = time.perf_counter()
+    story, source = _generate_story_with_source(shap_data, force_unique)
+    observe(STORY_GENERATION_SECONDS, time.perf_counter() - start_time, source)
+    return story
+
+def _generate_story_with_source(shap_data, force_unique):
+    """生成故事，返回(故事, 来源)  来源: llm / cache_hit / cache_stale / cache_miss / fallback"""
     # 获取DeepSeek API密钥
     deepseek_key = os.getenv('DEEPSEEK_API_KEY')
     if not deepseek_key:
         logger.warning("DeepSeek API key not found, using fallback story")
-        return generate_fallback_story(shap_data)
+        return generate_fallback_story(shap_data), 'fallback'
+    
+    if force_unique is None:
+        force_unique = not story_cache_enabled()
     
     try:
-        import requests
-        import random
-        import uuid
-        
-        # 构建用于故事生成的prompt
-        climate_score = shap_data.get('climate_score', 0.5) * 100
-        geographic_score = shap_data.get('geographic_score', 0.5) * 100  
-        economic_score = shap_data.get('economic_score', 0.5) * 100
-        city = shap_data.get('city', 'Unknown Location')
-        
-        # 获取主要特征影响
-        feature_importance = shap_data.get('shap_analysis', {}).get('feature_importance', {})
-        top_features = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)[:3]
-        
-        # 🔧 修复：增强随机性，确保每次刷新都生成完全不同的故事
-        import time
-        
-        # 使用多重随机源确保唯一性
-        current_time = time.time()
-        microseconds = int((current_time * 1000000) % 1000000)  # 微秒级时间戳
-        process_id = os.getpid() % 10000  # 进程ID
-        random_uuid = str(uuid.uuid4())[:8]  # 随机UUID片段
-        random_number = random.randint(100000, 999999)  # 纯随机数
-        
-        # 创建强随机性标识符
-        unique_id = f"{microseconds}_{process_id}_{random_uuid}_{random_number}"
-        image_hash = hashlib.md5(f"{city}_{climate_score}_{geographic_score}_{economic_score}_{unique_id}".encode()).hexdigest()[:8]
-        
-        # 大幅扩展故事风格选项和随机元素
-        story_styles = [
-            "like a scene from a climate science thriller",
-            "as if narrated by a future environmental historian", 
-            "in the style of a dramatic weather report from 2050",
-            "like an excerpt from an environmental documentary",
-            "as a dramatic eyewitness account from the future",
-            "in the tone of a scientific expedition journal",
-            "like a chapter from a climate change novel",
-            "as told by a time traveler from 2080",
-            "in the voice of an AI environmental analyst",
-            "like a dramatic news report from the future",
-            "as a poetic environmental meditation",
-            "in the style of a survival story",
-            "like a letter from a climate refugee",
-            "as an urgent environmental briefing",
-            "in the tone of a nature documentary narrator"
-        ]
+        if force_unique:
+            return request_deepseek_story(shap_data, deepseek_key,
+                                          acquire_timeout=_deepseek_acquire_timeout()), 'llm'
         
-        # 添加随机情感基调
-        emotional_tones = [
-            "with urgent concern and hope",
-            "with dramatic tension and mystery",
-            "with scientific wonder and awe",
-            "with melancholic beauty",
-            "with fierce determination",
-            "with quiet contemplation",
-            "with explosive energy",
-            "with gentle optimism",
-            "with stark realism",
-            "with poetic elegance"
-        ]
-        
-        # 添加随机视角
-        perspectives = [
-            "from the perspective of the environment itself",
-            "through the eyes of a scientist",
-            "from a bird's eye view",
-            "from ground level",
-            "through the lens of time",
-            "from multiple viewpoints",
-            "through natural elements",
-            "from an urban perspective",
-            "through seasonal changes",
-            "from a global viewpoint"
-        ]
-        
-        # 使用真正的随机种子（不基于image_id）
-        random.seed(int(current_time * 1000000) % 2**32)
-        
-        # 随机选择风格元素
-        style_hint = random.choice(story_styles)
-        emotional_tone = random.choice(emotional_tones)
-        perspective = random.choice(perspectives)
-        
-        # 添加随机的特殊指令
-        special_instructions = [
-            "Include metaphors from nature.",
-            "Use contrasting imagery.",
-            "Focus on the human element.",
-            "Emphasize the passage of time.",
-            "Include sensory details.",
-            "Use symbolism.",
-            "Create dramatic tension.",
-            "Include environmental sounds.",
-            "Use color imagery.",
-            "Focus on transformation."
-        ]
-        special_instruction = random.choice(special_instructions)
+        story_cache = get_story_cache()
+        key, style_hint, emotional_tone = story_cache.choose_variant(
+            story_cache.base_fields(shap_data), STORY_STYLES, EMOTIONAL_TONES
+        )
+        story, cache_status = story_cache.get_or_generate(
+            key, lambda: request_deepseek_story(shap_data, deepseek_key, style_hint, emotional_tone,
+                                                acquire_timeout=_deepseek_acquire_timeout())
+        )
+        logger.info(f"📚 Story cache {cache_status} for {shap_data.get('city', 'Unknown Location')} ({key[:12]})")
+        return story, f"cache_{cache_status}"
+    except Exception as e:
+        logger.error(f"❌ DeepSeek story generation failed: {e}")
+        return generate_fallback_story(shap_data), 'fallback'
+
+def _deepseek_chat_url():
+    """DeepSeek兼容的chat completions地址（DEEPSEEK_API_BASE可指向本地模拟服务测试）"""
+    api_base = os.getenv('DEEPSEEK_API_BASE', 'https://api.deepseek.com/v1').rstrip('/')
+    return f"{api_base}/chat/completions"
+
+def _get_deepseek_rate_limiter():
+    """所有DeepSeek请求共享的限速器（DEEPSEEK_RPM，每分钟请求数，0表示不限速）"""
+    return get_rate_limiter('deepseek', float(os.getenv('DEEPSEEK_RPM', 60)),
+                            burst=int(os.getenv('DEEPSEEK_BURST', 5)))
+
+def _get_deepseek_bulk_rate_limiter():
+    """
+    批量刷新额外使用的限速器（DEEPSEEK_BULK_RPM，默认DEEPSEEK_RPM的一半）
+    批量任务同时占用共享的deepseek令牌，剩余的预算留给页面访问
+    """
+    return get_rate_limiter('deepseek_bulk',
+                            float(os.getenv('DEEPSEEK_BULK_RPM', float(os.getenv('DEEPSEEK_RPM', 60)) / 2)),
+                            burst=1)
+
+def _deepseek_acquire_timeout():
+    """页面访问等待DeepSeek令牌的最长时间（DEEPSEEK_ACQUIRE_TIMEOUT秒，超时使用备用故事）"""
+    return float(os.getenv('DEEPSEEK_ACQUIRE_TIMEOUT', 2.0))
+
+def request_deepseek_story(shap_data, deepseek_key=None, style_hint=None, emotional_tone=None,
+                           acquire_timeout=None):
+    """
+    调用DeepSeek生成环境故事（不使用备用故事）
+    
+    Args:
+        shap_data: SHAP分析数据
+        deepseek_key: API密钥（默认读取DEEPSEEK_API_KEY）
+        style_hint / emotional_tone: 指定故事风格和情感基调（默认随机选择）
+        acquire_timeout: 等待限速令牌的最长秒数（None表示一直等待）
+    
+    Returns:
+        str: 生成的英文环境故事
         
-        # 构建高度随机化的prompt
-        prompt = f"""Write a dramatic environmental narrative in exactly 100 words for Analysis #{image_hash}. 
+    Raises:
+        RuntimeError: 未配置API密钥、等待限速令牌超时或API返回错误
+    """
+    deepseek_key = deepseek_key or os.getenv('DEEPSEEK_API_KEY')
+    if not deepseek_key:
+        raise RuntimeError("DeepSeek API key not configured")
+    
+    import requests
+    import random
+    import uuid
+    
+    # 构建用于故事生成的prompt
+    climate_score = shap_data.get('climate_score', 0.5) * 100
+    geographic_score = shap_data.get('geographic_score', 0.5) * 100  
+    economic_score = shap_data.get('economic_score', 0.5) * 100
+    city = shap_data.get('city', 'Unknown Location')
+    
+    # 获取主要特征影响
+    feature_importance = shap_data.get('shap_analysis', {}).get('feature_importance', {})
+    top_features = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)[:3]
+    
+    # 🔧 修复：增强随机性，确保每次刷新都生成完全不同的故事
+    import time
+    
+    # 使用多重随机源确保唯一性
+    current_time = time.time()
+    microseconds = int((current_time * 1000000) % 1000000)  # 微秒级时间戳
+    process_id = os.getpid() % 10000  # 进程ID
+    random_uuid = str(uuid.uuid4())[:8]  # 随机UUID片段
+    random_number = random.randint(100000, 999999)  # 纯随机数
+    
+    # 创建强随机性标识符
+    unique_id = f"{microseconds}_{process_id}_{random_uuid}_{random_number}"
+    image_hash = hashlib.md5(f"{city}_{climate_score}_{geographic_score}_{economic_score}_{unique_id}".encode()).hexdigest()[:8]
+    
+    # 添加随机视角
+    perspectives = [
+        "from the perspective of the environment itself",
+        "through the eyes of a scientist",
+        "from a bird's eye view",
+        "from ground level",
+        "through the lens of time",
+        "from multiple viewpoints",
+        "through natural elements",
+        "from an urban perspective",
+        "through seasonal changes",
+        "from a global viewpoint"
+    ]
+    
+    # 使用真正的随机种子（不基于image_id）
+    random.seed(int(current_time * 1000000) % 2**32)
+    
+    # 随机选择风格元素
+    style_hint = style_hint or random.choice(STORY_STYLES)
+    emotional_tone = emotional_tone or random.choice(EMOTIONAL_TONES)
+    perspective = random.choice(perspectives)
+    
+    # 添加随机的特殊指令
+    special_instructions = [
+        "Include metaphors from nature.",
+        "Use contrasting imagery.",
+        "Focus on the human element.",
+        "Emphasize the passage of time.",
+        "Include sensory details.",
+        "Use symbolism.",
+        "Create dramatic tension.",
+        "Include environmental sounds.",
+        "Use color imagery.",
+        "Focus on transformation."
+    ]
+    special_instruction = random.choice(special_instructions)
+    
+    # 构建高度随机化的prompt
+    prompt = f"""Write a dramatic environmental narrative in exactly 100 words for Analysis #{image_hash}. 
 
 Location: {city}
 Climate Impact: {climate_score:.1f}%
@@ -581,27 +654,30 @@ CRITICAL: This story MUST be entirely different from any previous analysis. Use
 
 Write EXACTLY 100 words. Be dramatic, engaging, and absolutely unique."""
 
-        # 调用DeepSeek API with higher temperature for more creativity
-        headers = {
-            'Authorization': f'Bearer {deepseek_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": "You are a creative environmental storyteller who writes dramatically different narratives each time. Never repeat styles, themes, or approaches. Be completely unique and original in every story."},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 150,
-            "temperature": 0.95,  # 增加温度以获得更多创造性
-            "top_p": 0.9,        # 添加nucleus sampling
-            "frequency_penalty": 0.5,  # 减少重复
-            "presence_penalty": 0.5    # 鼓励新颖性
-        }
-        
+    # 调用DeepSeek API with higher temperature for more creativity
+    headers = {
+        'Authorization': f'Bearer {deepseek_key}',
+        'Content-Type': 'application/json'
+    }
+    
+    data = {
+        "model": "deepseek-chat",
+        "messages": [
+            {"role": "system", "content": "You are a creative environmental storyteller who writes dramatically different narratives each time. Never repeat styles, themes, or approaches. Be completely unique and original in every story."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 150,
+        "temperature": 0.95,  # 增加温度以获得更多创造性
+        "top_p": 0.9,        # 添加nucleus sampling
+        "frequency_penalty": 0.5,  # 减少重复
+        "presence_penalty": 0.5    # 鼓励新颖性
+    }
+    
+    if not _get_deepseek_rate_limiter().acquire(timeout=acquire_timeout):
+        raise RuntimeError(f"DeepSeek rate limit: no token within {acquire_timeout}s")
+    with timed(EXTERNAL_REQUEST_SECONDS, 'deepseek'):
         response = requests.post(
-            'https://api.deepseek.com/v1/chat/completions',
+            _deepseek_chat_url(),
             headers=headers,
             json=data,
             timeout=30
@@ -614,11 +690,7 @@ Write EXACTLY 100 words. Be dramatic, engaging, and absolutely unique."""
             return story
         else:
             logger.error(f"❌ DeepSeek API error: {response.status_code} - {response.text}")
-            return generate_fallback_story(shap_data)
-        
-    except Exception as e:
-        logger.error(f"❌ DeepSeek story generation failed: {e}")
-        return generate_fallback_story(shap_data)
+            raise RuntimeError(f"DeepSeek API error: {response.status_code}")
 
 def generate_fallback_story(shap_data):
     """
@@ -656,6 +728,20 @@ def generate_fallback_story(shap_data):
     logger.info(f"✅ Fallback story generated for {city}")
     return story
 
+# predictions.id 分配使用的事务级advisory锁键
+PREDICTION_ID_LOCK_KEY = 70070001
+
+def _next_prediction_id(cur):
+    """
+    分配下一个prediction ID（MAX(id) + 1）
+
+    先获取事务级advisory锁，锁持有到调用方提交或回滚，
+    上传请求和后台分析任务不会在SELECT和INSERT之间拿到同一个ID
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (PREDICTION_ID_LOCK_KEY,))
+    cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM predictions")
+    return cur.fetchone()[0]
+
 @images_bp.route('', methods=['POST'])
 def upload_image():
     """
@@ -722,12 +808,14 @@ def upload_image():
         
         # 上传图片到Cloudinary
         try:
-            upload_result = cloudinary.uploader.upload(
-                file,
-                folder="obscura_images",
-                use_filename=True,
-                unique_filename=True
-            )
+            import cloudinary.uploader
+            with timed(EXTERNAL_REQUEST_SECONDS, 'cloudinary_upload'):
+                upload_result = cloudinary.uploader.upload(
+                    file,
+                    folder="obscura_images",
+                    use_filename=True,
+                    unique_filename=True
+                )
             
             image_url = upload_result['secure_url']
             thumbnail_url = upload_result.get('secure_url', image_url)
@@ -785,111 +873,68 @@ def upload_image():
         
         # 保存图片信息到数据库（生产环境）
         try:
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
-            cur = conn.cursor()
-            
-            # 为每个图片创建新的prediction记录
-            # 获取下一个可用的prediction ID
-            cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM predictions")
-            prediction_id_int = cur.fetchone()[0]
-            
-            logger.info(f"Creating new prediction record with ID: {prediction_id_int}")
-            
-            # 使用默认环境数据
-            environmental_data = {
-                'latitude': 51.5074,
-                'longitude': -0.1278,
-                'temperature': 15.0,
-                'humidity': 60.0,
-                'pressure': 1013.0,
-                'wind_speed': 0.0,
-                'weather_description': 'clear',
-                'timestamp': datetime.now().isoformat(),
-                'month': datetime.now().month,
-                'future_years': 0
-            }
+            with get_db_connection() as conn:
+                cur = conn.cursor()
+            
+                # 为每个图片创建新的prediction记录
+                # 获取下一个可用的prediction ID（advisory锁持有到提交）
+                prediction_id_int = _next_prediction_id(cur)
+            
+                logger.info(f"Creating new prediction record with ID: {prediction_id_int}")
+            
+                # 使用默认环境数据
+                environmental_data = {
+                    'latitude': 51.5074,
+                    'longitude': -0.1278,
+                    'temperature': 15.0,
+                    'humidity': 60.0,
+                    'pressure': 1013.0,
+                    'wind_speed': 0.0,
+                    'weather_description': 'clear',
+                    'timestamp': datetime.now().isoformat(),
+                    'month': datetime.now().month,
+                    'future_years': 0
+                }
             
-            # 🔧 修复：使用ML预测结果而不是fallback数据
-            # 先创建prediction记录，稍后更新为ML结果
-            initial_result_data = _create_fallback_result_data(environmental_data)
+                # 🔧 修复：使用ML预测结果而不是fallback数据
+                # 先创建prediction记录，稍后更新为ML结果
+                initial_result_data = _create_fallback_result_data(environmental_data)
             
-            # 创建prediction记录
-            cur.execute("""
-                INSERT INTO predictions (
-                    id, input_data, result_data, prompt, location, created_at
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s
-                ) ON CONFLICT (id) DO NOTHING
-            """, (
-                prediction_id_int,
-                json.dumps(environmental_data),
-                json.dumps(initial_result_data),
-                'SHAP-based environmental analysis for telescope image',
-                'Unknown Location',
-                datetime.now()
-            ))
-            logger.info(f"✅ Prediction record created with ID: {prediction_id_int}")
+                # 创建prediction记录
+                cur.execute("""
+                    INSERT INTO predictions (
+                        id, input_data, result_data, prompt, location, created_at
+                    ) VALUES (
+                        %s, %s, %s, %s, %s, %s
+                    ) ON CONFLICT (id) DO NOTHING
+                """, (
+                    prediction_id_int,
+                    json.dumps(environmental_data),
+                    json.dumps(initial_result_data),
+                    'SHAP-based environmental analysis for telescope image',
+                    'Unknown Location',
+                    datetime.now()
+                ))
+                logger.info(f"✅ Prediction record created with ID: {prediction_id_int}")
             
-            # 现在插入image记录
-            cur.execute("""
-                INSERT INTO images (url, thumbnail_url, description, prediction_id, created_at) 
-                VALUES (%s, %s, %s, %s, %s) 
-                RETURNING id, created_at
-            """, (image_url, thumbnail_url, description, prediction_id_int, datetime.now()))
+                # 现在插入image记录
+                cur.execute("""
+                    INSERT INTO images (url, thumbnail_url, description, prediction_id, created_at) 
+                    VALUES (%s, %s, %s, %s, %s) 
+                    RETURNING id, created_at
+                """, (image_url, thumbnail_url, description, prediction_id_int, datetime.now()))
             
-            result = cur.fetchone()
-            image_id, created_at = result
+                result = cur.fetchone()
+                image_id, created_at = result
             
-            conn.commit()
-            cur.close()
-            conn.close()
+                conn.commit()
+                cur.close()
             
             logger.info(f"Image record saved to database with ID: {image_id}")
             
-            # 🔧 修复：启动后台ML分析任务，更新prediction记录
-            import threading
-            
-            def run_ml_analysis():
-                try:
-                    logger.info(f"🔄 Starting ML analysis for image {image_id}")
-                    # 运行ML分析
-                    ml_result = generate_dynamic_image_analysis(image_id)
-                    
-                    if ml_result and ml_result.get('result_data'):
-                        # 更新prediction记录为ML结果
-                        try:
-                            conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                            cur = conn.cursor()
-                            
-                            cur.execute("""
-                                UPDATE predictions 
-                                SET result_data = %s, 
-                                    prompt = %s,
-                                    location = %s
-                                WHERE id = %s
-                            """, (
-                                json.dumps(ml_result['result_data']),
-                                ml_result.get('prompt', 'ML-based environmental analysis'),
-                                ml_result.get('location', 'Unknown Location'),
-                                prediction_id_int
-                            ))
-                            
-                            conn.commit()
-                            cur.close()
-                            conn.close()
-                            
-                            logger.info(f"✅ ML analysis completed and saved to database for image {image_id}")
-                            
-                        except Exception as db_error:
-                            logger.error(f"❌ Failed to update prediction record: {db_error}")
-                    
-                except Exception as e:
-                    logger.error(f"❌ ML analysis failed for image {image_id}: {e}")
-            
-            # 在后台线程中运行ML分析
-            analysis_thread = threading.Thread(target=run_ml_analysis)
-            analysis_thread.daemon = True
-            analysis_thread.start()
+            # 提交后台分析任务（生成ML分析并替换占位的prediction记录），上传请求立即返回
+            analysis_job_id = _enqueue_image_analysis('image_analysis', {'image_id': image_id, 'force': True})
+            _enqueue_image_derivatives(image_id, image_url)
         
         except Exception as e:
             logger.error(f"Database insert failed: {e}")
@@ -924,21 +969,13 @@ def upload_image():
                 
                 logger.info(f"Image stored locally with ID: {new_image_id}")
                 
-                # 启动后台分析任务
-                import threading
-                
-                def run_analysis():
-                    try:
-                        # 运行分析
-                        result = process_image_analysis(new_image_id, image_url, description, int(prediction_id))
-                        logger.info(f"📊 Analysis completed for image {new_image_id}: {result['status']}")
-                    except Exception as e:
-                        logger.error(f"❌ Background analysis failed: {e}")
-                
-                # 在后台线程中运行分析
-                analysis_thread = threading.Thread(target=run_analysis)
-                analysis_thread.daemon = True
-                analysis_thread.start()
+                # 提交后台分析任务
+                analysis_job_id = _enqueue_image_analysis('local_image_analysis', {
+                    'image_id': new_image_id,
+                    'image_url': image_url,
+                    'description': description,
+                    'prediction_id': int(prediction_id)
+                })
                 
                 # 构建图片数据用于WebSocket事件
                 image_data_fallback = {
@@ -957,7 +994,8 @@ def upload_image():
                     "success": True,
                     "image": image_data_fallback,
                     "message": "Image uploaded successfully (fallback local storage mode)",
-                    "analysis_status": "processing",
+                    "analysis_status": "processing" if analysis_job_id else "unavailable",
+                    "analysis_job_id": analysis_job_id,
                     "timestamp": datetime.now().isoformat()
                 }), 201
             else:
@@ -967,22 +1005,6 @@ def upload_image():
                     "timestamp": datetime.now().isoformat()
                 }), 500
         
-        # 启动后台分析任务（数据库模式）
-        import threading
-        
-        def run_analysis():
-            try:
-                # 运行分析
-                result = process_image_analysis(image_id, image_url, description, int(prediction_id))
-                logger.info(f"📊 Analysis completed for image {image_id}: {result['status']}")
-            except Exception as e:
-                logger.error(f"❌ Background analysis failed: {e}")
-        
-        # 在后台线程中运行分析
-        analysis_thread = threading.Thread(target=run_analysis)
-        analysis_thread.daemon = True
-        analysis_thread.start()
-        
         # 构建图片数据用于WebSocket事件
         image_data_main = {
             "id": image_id,
@@ -1001,7 +1023,8 @@ def upload_image():
             "success": True,
             "image": image_data_main,
             "message": "Image uploaded successfully",
-            "analysis_status": "processing",
+            "analysis_status": "processing" if analysis_job_id else "unavailable",
+            "analysis_job_id": analysis_job_id,
             "timestamp": datetime.now().isoformat()
         }), 201
         
@@ -1067,64 +1090,64 @@ def register_image():
         
         # 保存图片信息到数据库
         try:
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
-            cur = conn.cursor()
+            with get_db_connection() as conn:
+                cur = conn.cursor()
             
-            # 自动创建prediction记录（如果不存在）
-            # 检查prediction记录是否存在
-            cur.execute("SELECT id FROM predictions WHERE id = %s", (prediction_id,))
-            existing_prediction = cur.fetchone()
+                # 自动创建prediction记录（如果不存在）
+                # 检查prediction记录是否存在
+                cur.execute("SELECT id FROM predictions WHERE id = %s", (prediction_id,))
+                existing_prediction = cur.fetchone()
             
-            if not existing_prediction:
-                logger.info(f"Creating missing prediction record with ID: {prediction_id}")
+                if not existing_prediction:
+                    logger.info(f"Creating missing prediction record with ID: {prediction_id}")
                 
-                # 创建默认的prediction记录
+                    # 创建默认的prediction记录
+                    cur.execute("""
+                        INSERT INTO predictions (
+                            id, input_data, result_data, prompt, location, created_at
+                        ) VALUES (
+                            %s, %s, %s, %s, %s, %s
+                        ) ON CONFLICT (id) DO NOTHING
+                    """, (
+                        prediction_id,
+                        json.dumps({
+                            "temperature": 15.0,
+                            "humidity": 60.0,
+                            "location": "London, UK",
+                            "timestamp": datetime.now().isoformat()
+                        }),
+                        json.dumps({
+                            "temperature": 15.0,
+                            "humidity": 60.0,
+                            "confidence": 1.0,
+                            "climate_type": "temperate",
+                            "vegetation_index": 0.75,
+                            "predictions": {
+                    "short_term": "System generated placeholder",
+                    "long_term": "Stable conditions expected"
+                            }
+                        }),
+                        'System generated prediction for image registration',
+                        'London, UK',
+                        datetime.now()
+                    ))
+                    logger.info(f"✅ Default prediction record created with ID: {prediction_id}")
+            
+                # 现在插入image记录
                 cur.execute("""
-                    INSERT INTO predictions (
-                        id, input_data, result_data, prompt, location, created_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s
-                    ) ON CONFLICT (id) DO NOTHING
-                """, (
-                    prediction_id,
-                    json.dumps({
-                        "temperature": 15.0,
-                        "humidity": 60.0,
-                        "location": "London, UK",
-                        "timestamp": datetime.now().isoformat()
-                    }),
-                    json.dumps({
-                        "temperature": 15.0,
-                        "humidity": 60.0,
-                        "confidence": 1.0,
-                        "climate_type": "temperate",
-                        "vegetation_index": 0.75,
-                        "predictions": {
-                "short_term": "System generated placeholder",
-                "long_term": "Stable conditions expected"
-                        }
-                    }),
-                    'System generated prediction for image registration',
-                    'London, UK',
-                    datetime.now()
-                ))
-                logger.info(f"✅ Default prediction record created with ID: {prediction_id}")
-            
-            # 现在插入image记录
-            cur.execute("""
-                INSERT INTO images (url, thumbnail_url, description, prediction_id, created_at) 
-                VALUES (%s, %s, %s, %s, %s) 
-                RETURNING id, created_at
-            """, (image_url, thumbnail_url, description, prediction_id, datetime.now()))
+                    INSERT INTO images (url, thumbnail_url, description, prediction_id, created_at) 
+                    VALUES (%s, %s, %s, %s, %s) 
+                    RETURNING id, created_at
+                """, (image_url, thumbnail_url, description, prediction_id, datetime.now()))
             
-            result = cur.fetchone()
-            image_id, created_at = result
+                result = cur.fetchone()
+                image_id, created_at = result
             
-            conn.commit()
-            cur.close()
-            conn.close()
+                conn.commit()
+                cur.close()
             
             logger.info(f"Image registered in database with ID: {image_id}")
+            _enqueue_image_derivatives(image_id, image_url)
             
         except Exception as e:
             logger.error(f"Database insert failed: {e}")
@@ -1218,73 +1241,249 @@ def register_image():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+# 图库列表分页配置
+GALLERY_DEFAULT_LIMIT = 24
+GALLERY_MAX_LIMIT = 100
+GALLERY_FIELD_SETS = ('minimal', 'summary', 'full')
+
+_gallery_index_checked = False
+
+
+def _ensure_gallery_index(cur):
+    """确保(created_at, id)复合索引存在，支撑keyset分页（每个进程只检查一次）"""
+    global _gallery_index_checked
+    if _gallery_index_checked:
+        return
+    try:
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_images_created_at_id
+            ON images (created_at DESC, id DESC)
+        """)
+        cur.connection.commit()
+    except Exception as e:
+        cur.connection.rollback()
+        logger.warning(f"⚠️ Could not ensure gallery index: {e}")
+    _gallery_index_checked = True
+
+
+def _encode_gallery_cursor(created_at, image_id):
+    """将(created_at, id)编码为不透明游标"""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = f"{created_at}|{image_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_gallery_cursor(cursor):
+    """解析游标，格式错误时抛出ValueError"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, image_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(image_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _parse_gallery_params(args):
+    """解析limit/cursor/fields/all查询参数"""
+    fields = args.get('fields', 'summary').lower()
+    if fields not in GALLERY_FIELD_SETS:
+        raise ValueError(f"fields must be one of: {', '.join(GALLERY_FIELD_SETS)}")
+
+    # all=true 显式请求旧版完整导出（不分页、包含完整预测数据）
+    if args.get('all', '').lower() in ('1', 'true', 'yes'):
+        return None, None, 'full'
+
+    try:
+        limit = int(args.get('limit', GALLERY_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    limit = max(1, min(limit, GALLERY_MAX_LIMIT))
+
+    cursor = args.get('cursor')
+    cursor_key = _decode_gallery_cursor(cursor) if cursor else None
+    return limit, cursor_key, fields
+
+
+def _gallery_select_columns(fields):
+    """根据字段投影选择SQL列，summary只提取缩略图网格需要的JSON字段"""
+    base = "i.id, i.url, i.thumbnail_url, i.description, i.prediction_id, i.created_at"
+    if fields == 'minimal':
+        columns = base
+    elif fields == 'summary':
+        columns = base + """,
+                    p.location,
+                    p.input_data->>'latitude', p.input_data->>'longitude', p.input_data->>'location',
+                    p.result_data->>'city'"""
+    else:
+        columns = base + ", p.location, p.input_data, p.result_data"
+    # 图片版本放在最后一列，不影响其他列的位置
+    return columns + ", i.derivatives"
+
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _client_thumbnail_url(derivatives, url, thumbnail_url, preferences):
+    """按客户端偏好(size, prefer_webp, width)选择图片版本，没有版本时使用已有缩略图"""
+    if preferences[0] == 'original':
+        return url
+    rendition = select_rendition(derivatives, *preferences)
+    if rendition:
+        return rendition
+    # 所有版本都比请求宽度窄时使用原图（thumbnail_url已被替换为最小的small版本）
+    if derivatives and preferences[2]:
+        return url
+    return thumbnail_url or url
+
+
+def _build_gallery_item(row, fields, preferences=('small', False, None)):
+    """将查询行转换为API返回的图片对象（thumbnail_url按客户端偏好选择图片版本）"""
+    derivatives = row[-1]
+    image_data = {
+        "id": row[0],
+        "url": row[1],
+        "thumbnail_url": _client_thumbnail_url(derivatives, row[1], row[2], preferences),
+        "description": row[3],
+        "prediction_id": row[4],
+        "created_at": row[5].isoformat()
+    }
+
+    if fields == 'summary':
+        if any(value is not None for value in row[6:11]):
+            input_data = {}
+            if row[7] is not None:
+                input_data['latitude'] = _to_float(row[7])
+            if row[8] is not None:
+                input_data['longitude'] = _to_float(row[8])
+            if row[9] is not None:
+                input_data['location'] = row[9]
+            image_data["prediction"] = {
+                "location": row[6],
+                "input_data": input_data,
+                "result_data": {"city": row[10]} if row[10] is not None else {}
+            }
+    elif fields == 'full':
+        # 添加基本预测信息
+        if row[6] or row[7] or row[8]:  # 如果有预测数据
+            image_data["prediction"] = {
+                "location": row[6],
+                "input_data": row[7] or {},
+                "result_data": row[8] or {}
+            }
+        image_data["derivatives"] = derivatives
+
+    return image_data
+
+
+def _project_local_gallery_item(image_info, fields):
+    """对本地存储的图片应用相同的字段投影"""
+    if fields == 'minimal':
+        image_info.pop('prediction', None)
+    elif fields == 'summary' and 'prediction' in image_info:
+        prediction = image_info['prediction']
+        image_info['prediction'] = {
+            "location": prediction.get('location'),
+            "input_data": {"location": prediction['input_data'].get('location_name')},
+            "result_data": {"city": prediction['result_data'].get('city')}
+        }
+    return image_info
+
+
 @images_bp.route('', methods=['GET'])
 def get_images():
     """
-    获取图片列表API端点
-    
-    返回: 所有图片信息的JSON列表，包含基本预测信息
+    获取图片列表API端点（keyset分页）
+
+    查询参数:
+        limit: 每页数量，默认24，最大100
+        cursor: 上一页返回的next_cursor
+        fields: minimal | summary（默认）| full
+        all: true时返回旧版完整列表（不分页，包含完整预测数据）
+        size: thumbnail_url的图片版本 small（默认）| medium | large | original
+        width: 客户端显示宽度（像素），选择不小于该宽度的最小版本
+        format: webp | jpeg（默认按Accept头）
+
+    返回: 图片信息列表和下一页游标
     """
+    try:
+        limit, cursor_key, fields = _parse_gallery_params(request.args)
+        preferences = client_image_preferences(request.args, request.headers.get('Accept'))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
     images = []
+    next_cursor = None
+    database_ok = False
     
     # 首先尝试从数据库获取图片
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        # 联查图片和预测数据，获取基本信息
-        cur.execute("""
-            SELECT 
-                i.id, i.url, i.thumbnail_url, i.description, i.prediction_id, i.created_at,
-                p.location, p.input_data, p.result_data
-            FROM images i
-            LEFT JOIN predictions p ON i.prediction_id = p.id
-            ORDER BY i.created_at DESC
-        """)
-        
-        for row in cur.fetchall():
-            image_data = {
-                "id": row[0],
-                "url": row[1],
-                "thumbnail_url": row[2],
-                "description": row[3],
-                "prediction_id": row[4],
-                "created_at": row[5].isoformat()
-            }
-            
-            # 添加基本预测信息
-            if row[6] or row[7] or row[8]:  # 如果有预测数据
-                prediction_info = {
-                    "location": row[6],
-                    "input_data": row[7] or {},
-                    "result_data": row[8] or {}
-                }
-                image_data["prediction"] = prediction_info
-            
-            images.append(image_data)
-        
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            _ensure_gallery_index(cur)
+            ensure_derivatives_column(cur)
+
+            query = f"""
+                SELECT 
+                    {_gallery_select_columns(fields)}
+                FROM images i
+                LEFT JOIN predictions p ON i.prediction_id = p.id
+            """
+            params = []
+            if cursor_key:
+                query += " WHERE (i.created_at, i.id) < (%s, %s)"
+                params.extend(cursor_key)
+            query += " ORDER BY i.created_at DESC, i.id DESC"
+            if limit:
+                # 多取一行用于判断是否还有下一页
+                query += " LIMIT %s"
+                params.append(limit + 1)
+
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cur.close()
+
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_gallery_cursor(rows[-1][5], rows[-1][0])
+
+        images = [_build_gallery_item(row, fields, preferences) for row in rows]
+        database_ok = True
         
-        logger.info(f"Retrieved {len(images)} images from database with prediction data")
+        logger.info(f"Retrieved {len(images)} images from database (fields={fields}, limit={limit})")
         
     except Exception as e:
         logger.error(f"Error fetching images from database: {e}")
         # 数据库查询失败，将使用本地存储
         
-    # 如果数据库为空或查询失败，检查本地存储
-    if not images and LOCAL_IMAGES_STORE:
+    # 数据库查询失败或数据库为空（第一页）时检查本地存储；
+    # 带游标的空页表示已到最后一页，不能用本地mock图片充当数据库图库的下一页
+    use_local_store = not images and LOCAL_IMAGES_STORE and (not database_ok or not cursor_key)
+    if use_local_store:
         logger.info("Database returned no images, checking local storage")
         
         # 转换本地存储格式，添加mock prediction数据
+        local_images = []
         for image_id, image_data in LOCAL_IMAGES_STORE.items():
+            created_at = image_data['created_at']
+            if not isinstance(created_at, datetime):
+                created_at = datetime.fromisoformat(created_at)
             image_info = {
                 "id": image_data['id'],
                 "url": image_data['url'],
                 "thumbnail_url": image_data.get('thumbnail_url', image_data['url']),
                 "description": image_data['description'],
                 "prediction_id": image_data['prediction_id'],
-                "created_at": image_data['created_at'].isoformat() if isinstance(image_data['created_at'], datetime) else image_data['created_at']
+                "created_at": created_at
             }
             
             # 添加mock预测信息
@@ -1306,7 +1505,19 @@ def get_images():
             }
             image_info["prediction"] = mock_prediction
             
-            images.append(image_info)
+            local_images.append(image_info)
+
+        # 与数据库相同的排序和游标语义
+        local_images.sort(key=lambda item: (item['created_at'], item['id']), reverse=True)
+        if cursor_key:
+            local_images = [item for item in local_images if (item['created_at'], item['id']) < cursor_key]
+        if limit and len(local_images) > limit:
+            local_images = local_images[:limit]
+            next_cursor = _encode_gallery_cursor(local_images[-1]['created_at'], local_images[-1]['id'])
+
+        for image_info in local_images:
+            image_info['created_at'] = image_info['created_at'].isoformat()
+            images.append(_project_local_gallery_item(image_info, fields))
         
         logger.info(f"Retrieved {len(images)} images from local storage with mock prediction data")
     
@@ -1314,13 +1525,21 @@ def get_images():
     if not images:
         logger.info("No images found in database or local storage")
     
-    return jsonify({
+    response = jsonify({
         "success": True,
         "images": images,
         "count": len(images),
-        "source": "database_with_predictions" if images and not LOCAL_IMAGES_STORE else "local_storage_with_mock" if LOCAL_IMAGES_STORE else "empty",
+        "limit": limit,
+        "fields": fields,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None,
+        "source": "local_storage_with_mock" if use_local_store else "database_with_predictions" if images else "empty",
         "timestamp": datetime.now().isoformat()
     })
+    # thumbnail_url取决于Accept头（WebP）
+    response.vary.add('Accept')
+    return response
+
 
 @images_bp.route('/<int:image_id>', methods=['GET'])
 def get_image_detail(image_id):
@@ -1330,44 +1549,43 @@ def get_image_detail(image_id):
     返回: 图片信息及关联的预测数据
     """
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
         
-        # 联查图片和预测数据
-        cur.execute("""
-            SELECT 
-                i.id, i.url, i.thumbnail_url, i.description, i.created_at,
-                p.id as prediction_id, p.input_data, p.result_data, p.prompt, p.location
-            FROM images i
-            LEFT JOIN predictions p ON i.prediction_id = p.id
-            WHERE i.id = %s
-        """, (image_id,))
+            # 联查图片和预测数据
+            cur.execute("""
+                SELECT 
+                    i.id, i.url, i.thumbnail_url, i.description, i.created_at,
+                    p.id as prediction_id, p.input_data, p.result_data, p.prompt, p.location
+                FROM images i
+                LEFT JOIN predictions p ON i.prediction_id = p.id
+                WHERE i.id = %s
+            """, (image_id,))
         
-        row = cur.fetchone()
-        if not row:
-            return jsonify({
-                "success": False,
-                "error": "Image not found",
-                "timestamp": datetime.now().isoformat()
-            }), 404
+            row = cur.fetchone()
+            if not row:
+                return jsonify({
+                    "success": False,
+                    "error": "Image not found",
+                    "timestamp": datetime.now().isoformat()
+                }), 404
         
-        image_detail = {
-            "id": row[0],
-            "url": row[1],
-            "thumbnail_url": row[2],
-            "description": row[3],
-            "created_at": row[4].isoformat(),
-            "prediction": {
-                "id": row[5],
-                "input_data": row[6],
-                "result_data": row[7],
-                "prompt": row[8],
-                "location": row[9]
-            } if row[5] else None
-        }
+            image_detail = {
+                "id": row[0],
+                "url": row[1],
+                "thumbnail_url": row[2],
+                "description": row[3],
+                "created_at": row[4].isoformat(),
+                "prediction": {
+                    "id": row[5],
+                    "input_data": row[6],
+                    "result_data": row[7],
+                    "prompt": row[8],
+                    "location": row[9]
+                } if row[5] else None
+            }
         
-        cur.close()
-        conn.close()
+            cur.close()
         
         return jsonify({
             "success": True,
@@ -1442,30 +1660,34 @@ def get_image_analysis(image_id):
     返回: 图片的深度分析数据，包括环境预测、置信度等
     """
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        # 查询图片和完整预测数据
-        cur.execute("""
-            SELECT 
-                i.id, i.url, i.thumbnail_url, i.description, i.created_at,
-                p.id as prediction_id, p.input_data, p.result_data, p.prompt, p.location, p.created_at as prediction_created_at
-            FROM images i
-            LEFT JOIN predictions p ON i.prediction_id = p.id
-            WHERE i.id = %s
-        """, (image_id,))
+        with get_db_connection() as conn:
+            cur = conn.cursor()
         
-        row = cur.fetchone()
-        if not row:
-            return jsonify({
-                "success": False,
-                "error": "Image not found",
-                "timestamp": datetime.now().isoformat()
-            }), 404
+            # 查询图片和完整预测数据
+            cur.execute("""
+                SELECT 
+                    i.id, i.url, i.thumbnail_url, i.description, i.created_at,
+                    p.id as prediction_id, p.input_data, p.result_data, p.prompt, p.location, p.created_at as prediction_created_at
+                FROM images i
+                LEFT JOIN predictions p ON i.prediction_id = p.id
+                WHERE i.id = %s
+            """, (image_id,))
         
-        # 解析预测结果数据
+            row = cur.fetchone()
+            if not row:
+                return jsonify({
+                    "success": False,
+                    "error": "Image not found",
+                    "timestamp": datetime.now().isoformat()
+                }), 404
+        
+            cur.close()
+        
+        # 解析预测结果数据（尚未生成分析时生成一次并写回，同一图片的并发请求只生成一次）
         result_data = row[7] if row[7] else {}
         input_data = row[6] if row[6] else {}
+        if not _is_complete_analysis(result_data):
+            result_data, _ = get_or_generate_image_analysis(image_id, result_data=result_data)
         
         # 构建分析响应数据
         analysis_data = {
@@ -1500,9 +1722,6 @@ def get_image_analysis(image_id):
             }
         }
         
-        cur.close()
-        conn.close()
-        
         return jsonify({
             "success": True,
             "analysis": analysis_data,
@@ -1541,169 +1760,87 @@ def get_image_shap_analysis(image_id):
     """
     获取图片的SHAP分析数据API端点
     
-    优先从predictions.result_data读取已存储的分析结果
+    优先从predictions.result_data读取已存储的分析结果；
+    不存在时生成一次并写回，之后的读取直接使用存储的结果
     """
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        # 查询图片和关联的预测数据
-        cur.execute("""
-            SELECT 
-                i.id, i.url, i.description,
-                p.input_data, p.result_data, p.location
-            FROM images i
-            LEFT JOIN predictions p ON i.prediction_id = p.id
-            WHERE i.id = %s
-        """, (image_id,))
-        
-        row = cur.fetchone()
-        if not row:
-            return jsonify({
-                "success": False,
-                "error": "Image not found",
-                "timestamp": datetime.now().isoformat()
-            }), 404
-        
-        # 提取数据
-        input_data = row[3] if row[3] else {}
-        result_data = row[4] if row[4] else {}
-        location = row[5] if row[5] else "Unknown Location"
-        
-        cur.close()
-        conn.close()
-        
-        # 检查result_data中是否已有完整的SHAP分析结果
-        if result_data and 'ai_story' in result_data and 'climate_score' in result_data:
-            logger.info(f"✅ Retrieved stored SHAP analysis for image {image_id}")
-            
-            # 构建SHAP分析数据结构
-            shap_analysis_data = {
-                "climate_score": result_data.get('climate_score', 0.5),
-                "geographic_score": result_data.get('geographic_score', 0.5),
-                "economic_score": result_data.get('economic_score', 0.5),
-                "final_score": result_data.get('final_score', 0.5),
-                "city": result_data.get('city', 'Unknown'),
-                "shap_analysis": result_data.get('shap_analysis', {}),
-                "confidence": result_data.get('confidence', 1.0)
-            }
-            
-            # 转换为层次化结构
-            enhanced_shap_analysis = transform_to_hierarchical_shap_data(shap_analysis_data)
-            
-            # 验证数据完整性
-            validation_result = validate_hierarchical_shap_data(enhanced_shap_analysis)
-            
-            return jsonify({
-                "success": True,
-                "data": {
-                    **enhanced_shap_analysis,
-                    'ai_story': result_data.get('ai_story'),
-                    "integration_metadata": {
-                        "analysis_timestamp": result_data.get('analysis_metadata', {}).get('generated_at', datetime.now().isoformat()),
-                        "model_version": result_data.get('analysis_metadata', {}).get('model_version', 'shap_v1.0.0'),
-                        "analysis_source": "stored_in_predictions",
-                        "note": "Pre-generated SHAP analysis from image upload",
-                        "data_format_version": "1.2.0",
-                        "fallback_used": result_data.get('analysis_metadata', {}).get('fallback_used', False)
-                    },
-                    "data_validation": validation_result
-                },
-                "timestamp": datetime.now().isoformat(),
-                "mode": "stored_analysis"
-            }), 200
-        
-        # 如果没有存储的完整分析结果，回退到实时生成
-        logger.info(f"🔄 No complete SHAP analysis found, generating fallback for image {image_id}")
-        
-        # 尝试从predictions表获取数据（新的存储方式）
-        try:
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        with get_db_connection() as conn:
             cur = conn.cursor()
-            
+        
+            # 查询图片和关联的预测数据
             cur.execute("""
-                SELECT p.result_data, p.created_at 
+                SELECT 
+                    i.id, i.url, i.description,
+                    p.input_data, p.result_data, p.location
                 FROM images i
                 LEFT JOIN predictions p ON i.prediction_id = p.id
                 WHERE i.id = %s
             """, (image_id,))
-            
-            analysis_row = cur.fetchone()
-            
-            if analysis_row and analysis_row[0]:
-                # 返回存储的分析结果
-                result_data = analysis_row[0]
-                created_at = analysis_row[1]
-                
-                logger.info(f"✅ Retrieved analysis from predictions table for image {image_id}")
-                
-                cur.close()
-                conn.close()
-                
-                # 转换为层次化结构
-                enhanced_shap_analysis = transform_to_hierarchical_shap_data(result_data)
-                
-                # 验证数据完整性
-                validation_result = validate_hierarchical_shap_data(enhanced_shap_analysis)
-                
+        
+            row = cur.fetchone()
+            if not row:
                 return jsonify({
-                    "success": True,
-                    "data": {
-                        **enhanced_shap_analysis,
-                        "integration_metadata": {
-                "analysis_timestamp": created_at.isoformat(),
-                "model_version": result_data.get('analysis_metadata', {}).get('model_version', 'unknown'),
-                "analysis_source": "predictions_table",
-                "note": "Retrieved from predictions table",
-                "data_format_version": "1.2.0"
-                        },
-                        "data_validation": validation_result
-                    },
-                    "timestamp": datetime.now().isoformat(),
-                    "mode": "stored_analysis"
-                }), 200
-            
-            cur.close()
-            conn.close()
-            
-        except Exception as db_error:
-            logger.warning(f"⚠️ Predictions table query failed: {db_error}")
+                    "success": False,
+                    "error": "Image not found",
+                    "timestamp": datetime.now().isoformat()
+                }), 404
         
-        # 最终回退：生成实时分析
-        logger.info(f"🔄 Generating real-time analysis for image {image_id}")
+            # 提取数据
+            input_data = row[3] if row[3] else {}
+            result_data = row[4] if row[4] else {}
+            location = row[5] if row[5] else "Unknown Location"
         
-        # 生成新的SHAP分析数据
-        shap_data = generate_shap_analysis_data(image_id, row[2])
+            cur.close()
         
-        # 生成AI故事
-        story_data = generate_ai_environmental_story(shap_data)
+        # 没有完整的SHAP分析结果时生成并写回predictions.result_data（同一图片的并发请求只生成一次）
+        analysis_source = "stored_in_predictions"
+        if not _is_complete_analysis(result_data):
+            logger.info(f"🔄 No complete SHAP analysis found, generating for image {image_id}")
+            result_data, source = get_or_generate_image_analysis(image_id, result_data=result_data)
+            if _is_fallback_analysis(result_data):
+                analysis_source = "fallback_not_persisted"
+            elif source != 'stored':
+                analysis_source = "generated_on_demand"
+        else:
+            logger.info(f"✅ Retrieved stored SHAP analysis for image {image_id}")
+        
+        # 构建SHAP分析数据结构
+        shap_analysis_data = {
+            "climate_score": result_data.get('climate_score', 0.5),
+            "geographic_score": result_data.get('geographic_score', 0.5),
+            "economic_score": result_data.get('economic_score', 0.5),
+            "final_score": result_data.get('final_score', 0.5),
+            "city": result_data.get('city', 'Unknown'),
+            "shap_analysis": result_data.get('shap_analysis', {}),
+            "confidence": result_data.get('confidence', 1.0)
+        }
         
         # 转换为层次化结构
-        enhanced_shap_analysis = transform_to_hierarchical_shap_data(shap_data)
+        enhanced_shap_analysis = transform_to_hierarchical_shap_data(shap_analysis_data)
         
         # 验证数据完整性
         validation_result = validate_hierarchical_shap_data(enhanced_shap_analysis)
         
-        # 构建完整的响应数据
-        real_time_analysis = {
-            **enhanced_shap_analysis,
-            'ai_story': story_data,
-            "integration_metadata": {
-                "analysis_timestamp": datetime.now().isoformat(),
-                "model_version": "real_time_v1.2",
-                "analysis_source": "generated_on_demand",
-                "note": "Generated real-time SHAP analysis",
-                "data_format_version": "1.2.0",
-                "warning": "This analysis is generated each time and may vary"
-            },
-            "data_validation": validation_result
-        }
-        
         return jsonify({
             "success": True,
-            "data": real_time_analysis,
+            "data": {
+                **enhanced_shap_analysis,
+                'ai_story': result_data.get('ai_story'),
+                "integration_metadata": {
+                    "analysis_timestamp": result_data.get('analysis_metadata', {}).get('generated_at', datetime.now().isoformat()),
+                    "model_version": result_data.get('analysis_metadata', {}).get('model_version', 'shap_v1.0.0'),
+                    "analysis_source": analysis_source,
+                    "note": {
+                        "stored_in_predictions": "Pre-generated SHAP analysis from image upload",
+                        "fallback_not_persisted": "Fallback analysis (model unavailable), regenerated on next request"
+                    }.get(analysis_source, "Generated on first request and persisted to predictions"),
+                    "data_format_version": "1.2.0",
+                    "fallback_used": result_data.get('analysis_metadata', {}).get('fallback_used', False)
+                },
+                "data_validation": validation_result
+            },
             "timestamp": datetime.now().isoformat(),
-            "mode": "real_time_generation"
+            "mode": "stored_analysis"
         }), 200
         
     except Exception as e:
@@ -1768,197 +1905,246 @@ def get_image_shap_analysis(image_id):
             "timestamp": datetime.now().isoformat()
         }), 500
 
+# 下载响应的浏览器/CDN缓存时间（秒）
+IMAGE_DOWNLOAD_MAX_AGE = int(os.getenv('IMAGE_DOWNLOAD_MAX_AGE', 86400))
+
+def _download_filename(image_id, description, content_type='image/jpeg'):
+    """清理文件名，移除所有无效字符"""
+    import re
+    import mimetypes
+    
+    safe_description = re.sub(r'[^\w\s-]', '', description or f"obscura_image_{image_id}")
+    safe_description = re.sub(r'\s+', '_', safe_description.strip())
+    extension = mimetypes.guess_extension(content_type) or '.jpg'
+    if extension in ('.jpe', '.jpeg'):
+        extension = '.jpg'
+    return f"{safe_description[:50]}{extension}"  # 限制长度
+
+def _resolve_download_source(image_id):
+    """
+    查询图片URL和描述
+
+    Returns:
+        (image_url, description)；图片不存在时返回None。
+        数据库不可用时使用本地存储。
+    """
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT url, description FROM images WHERE id = %s", (image_id,))
+            row = cur.fetchone()
+            cur.close()
+        return (row[0], row[1]) if row else None
+    
+    except Exception as e:
+        # 数据库不可用时的备用方案
+        database_issues = [
+            "nodename nor servname provided",
+            "could not translate host name",
+            "relation \"images\" does not exist",
+            "does not exist"
+        ]
+        if not any(issue in str(e) for issue in database_issues):
+            raise
+        
+        logger.warning(f"Database unavailable for download, checking local storage: {e}")
+        local_image = LOCAL_IMAGES_STORE.get(image_id)
+        return (local_image['url'], local_image['description']) if local_image else None
+
+def _stream_image_download(image_id, image_url, description):
+    """不使用缓存时直接从存储流式代理（复用连接池会话）"""
+    from flask import Response
+    
+    with timed(EXTERNAL_REQUEST_SECONDS, 'cloudinary_fetch'):
+        response = get_http_session().get(image_url, stream=True, timeout=30)
+    if response.status_code != 200:
+        logger.error(f"Failed to fetch image from Cloudinary: {response.status_code}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to fetch image from storage",
+            "timestamp": datetime.now().isoformat()
+        }), 500
+    
+    content_type = response.headers.get('Content-Type', 'image/jpeg').split(';')[0].strip()
+    
+    # 创建流式响应
+    def generate():
+        for chunk in response.iter_content(chunk_size=8192):
+            if chunk:
+                yield chunk
+    
+    logger.info(f"Image download streaming for ID: {image_id}")
+    
+    return Response(
+        generate(),
+        content_type=content_type,
+        headers={
+            'Content-Disposition': f'attachment; filename="{_download_filename(image_id, description, content_type)}"',
+            'Cache-Control': 'no-cache'
+        }
+    )
+
 @images_bp.route('/<int:image_id>/download', methods=['GET'])
 def download_image(image_id):
     """
     图片下载API端点
     
-    返回: 图片文件流供直接下载
+    返回: 图片文件供直接下载
+    图片字节缓存在本地磁盘（图片ID + URL哈希），支持ETag/Last-Modified条件请求和Range请求
     """
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        # 查询图片URL
-        cur.execute("SELECT url, description FROM images WHERE id = %s", (image_id,))
-        row = cur.fetchone()
-        
-        if not row:
+        source = _resolve_download_source(image_id)
+        if source is None:
             return jsonify({
                 "success": False,
                 "error": "Image not found",
                 "timestamp": datetime.now().isoformat()
             }), 404
         
-        image_url = row[0]
-        description = row[1] or f"obscura_image_{image_id}"
+        image_url, description = source
+        description = description or f"obscura_image_{image_id}"
         
-        cur.close()
-        conn.close()
+        if not image_cache_enabled():
+            return _stream_image_download(image_id, image_url, description)
         
-        # 从Cloudinary获取图片文件流
-        import requests
-        response = requests.get(image_url, stream=True, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch image from Cloudinary: {response.status_code}")
-            return jsonify({
-                "success": False,
-                "error": "Failed to fetch image from storage",
-                "timestamp": datetime.now().isoformat()
-            }), 500
+        for attempt in range(2):
+            try:
+                cached = get_image_cache().get(image_id, image_url)
+            except ImageTooLargeError as e:
+                logger.warning(f"{e}; streaming without cache")
+                return _stream_image_download(image_id, image_url, description)
+            except requests.RequestException as e:
+                logger.error(f"Failed to fetch image from Cloudinary: {e}")
+                return jsonify({
+                    "success": False,
+                    "error": "Failed to fetch image from storage",
+                    "timestamp": datetime.now().isoformat()
+                }), 502
+            
+            try:
+                response = send_file(
+                    cached['path'],
+                    mimetype=cached['content_type'],
+                    as_attachment=True,
+                    download_name=_download_filename(image_id, description, cached['content_type']),
+                    conditional=True,
+                    etag=cached['etag'],
+                    last_modified=cached['last_modified'],
+                    max_age=IMAGE_DOWNLOAD_MAX_AGE
+                )
+                break
+            except FileNotFoundError:
+                # 命中后、打开前文件被淘汰（其他请求或共享缓存目录的进程），再次get会重新下载
+                logger.warning(f"Cached image {image_id} evicted before send, refetching (attempt {attempt + 1})")
+        else:
+            return _stream_image_download(image_id, image_url, description)
+        # 同一URL的图片内容不变，允许浏览器和CDN缓存
+        response.cache_control.public = True
+        response.headers['X-Image-Cache'] = cached['cache_status'].upper()
         
-        # 设置下载响应头
-        from flask import Response
-        import re
-        
-        # 清理文件名，移除所有无效字符
-        safe_description = re.sub(r'[^\w\s-]', '', description or f"obscura_image_{image_id}")
-        safe_description = re.sub(r'\s+', '_', safe_description.strip())
-        filename = f"{safe_description[:50]}.jpg"  # 限制长度
-        
-        # 创建流式响应
-        def generate():
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    yield chunk
-        
-        logger.info(f"Image download streaming for ID: {image_id}")
-        
-        return Response(
-            generate(),
-            content_type='image/jpeg',
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"',
-                'Content-Type': 'image/jpeg',
-                'Cache-Control': 'no-cache'
-            }
-        )
+        logger.info(f"Image download served for ID: {image_id} (cache {cached['cache_status']}, status {response.status_code})")
+        return response
         
     except Exception as e:
         logger.error(f"Error downloading image: {e}")
-        
-        # 数据库不可用时的备用方案
-        database_issues = [
-            "nodename nor servname provided",
-            "could not translate host name",
-            "relation \"images\" does not exist",
-            "does not exist"
-        ]
-        
-        is_database_issue = any(issue in str(e) for issue in database_issues)
-        
-        if is_database_issue:
-            # 检查本地存储
-            if image_id in LOCAL_IMAGES_STORE:
-                local_image = LOCAL_IMAGES_STORE[image_id]
-                image_url = local_image['url']
-                description = local_image['description'] or f"obscura_image_{image_id}"
-                
-                try:
-                    import requests
-                    response = requests.get(image_url, stream=True, timeout=30)
-                    
-                    if response.status_code == 200:
-                        # 清理文件名，移除所有无效字符
-                        safe_description = re.sub(r'[^\w\s-]', '', description or f"obscura_image_{image_id}")
-                        safe_description = re.sub(r'\s+', '_', safe_description.strip())
-                        filename = f"{safe_description[:50]}.jpg"  # 限制长度
-                        
-                        def generate():
-                            for chunk in response.iter_content(chunk_size=8192):
-                                if chunk:
-                                    yield chunk
-                        
-                        logger.info(f"Image download streaming from local storage for ID: {image_id}")
-                        
-                        from flask import Response
-                        return Response(
-                            generate(),
-                            content_type='image/jpeg',
-                            headers={
-                                'Content-Disposition': f'attachment; filename="{filename}"',
-                                'Content-Type': 'image/jpeg',
-                                'Cache-Control': 'no-cache'
-                            }
-                        )
-                except Exception as fallback_error:
-                    logger.error(f"Fallback download failed: {fallback_error}")
-        
         return jsonify({
             "success": False,
             "error": "Failed to download image",
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@images_bp.route('/download-cache/stats', methods=['GET'])
+def download_cache_stats():
+    """获取图片下载缓存统计（命中率、占用空间、淘汰次数）"""
+    return jsonify({
+        'success': True,
+        'message': '图片下载缓存统计获取成功',
+        'data': get_image_cache_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @images_bp.route('/navigation/<int:image_id>', methods=['GET'])
 def get_image_navigation(image_id):
     """
     获取图片导航信息API端点
+
+    查询参数:
+        size / width / format: thumbnail_url的图片版本，与图库接口相同
     
     返回: 上一张和下一张图片的信息
     """
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
+        preferences = client_image_preferences(request.args, request.headers.get('Accept'))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            ensure_derivatives_column(cur)
         
-        # 获取当前图片的创建时间
-        cur.execute("SELECT created_at FROM images WHERE id = %s", (image_id,))
-        current_row = cur.fetchone()
+            # 获取当前图片的创建时间
+            cur.execute("SELECT created_at FROM images WHERE id = %s", (image_id,))
+            current_row = cur.fetchone()
         
-        if not current_row:
-            return jsonify({
-                "success": False,
-                "error": "Current image not found",
-                "timestamp": datetime.now().isoformat()
-            }), 404
+            if not current_row:
+                return jsonify({
+                    "success": False,
+                    "error": "Current image not found",
+                    "timestamp": datetime.now().isoformat()
+                }), 404
         
-        current_created_at = current_row[0]
+            current_created_at = current_row[0]
         
-        # 获取上一张图片（更早的）
-        cur.execute("""
-            SELECT id, url, thumbnail_url, description 
-            FROM images 
-            WHERE created_at < %s 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        """, (current_created_at,))
-        prev_row = cur.fetchone()
-        
-        # 获取下一张图片（更晚的）
-        cur.execute("""
-            SELECT id, url, thumbnail_url, description 
-            FROM images 
-            WHERE created_at > %s 
-            ORDER BY created_at ASC 
-            LIMIT 1
-        """, (current_created_at,))
-        next_row = cur.fetchone()
+            # 获取上一张图片（更早的）
+            cur.execute("""
+                SELECT id, url, thumbnail_url, description, derivatives 
+                FROM images 
+                WHERE created_at < %s 
+                ORDER BY created_at DESC 
+                LIMIT 1
+            """, (current_created_at,))
+            prev_row = cur.fetchone()
+        
+            # 获取下一张图片（更晚的）
+            cur.execute("""
+                SELECT id, url, thumbnail_url, description, derivatives 
+                FROM images 
+                WHERE created_at > %s 
+                ORDER BY created_at ASC 
+                LIMIT 1
+            """, (current_created_at,))
+            next_row = cur.fetchone()
         
-        cur.close()
-        conn.close()
+            cur.close()
         
         navigation_data = {
             "current_id": image_id,
             "previous": {
                 "id": prev_row[0],
                 "url": prev_row[1],
-                "thumbnail_url": prev_row[2],
+                "thumbnail_url": _client_thumbnail_url(prev_row[4], prev_row[1], prev_row[2], preferences),
                 "description": prev_row[3]
             } if prev_row else None,
             "next": {
                 "id": next_row[0],
                 "url": next_row[1],
-                "thumbnail_url": next_row[2],
+                "thumbnail_url": _client_thumbnail_url(next_row[4], next_row[1], next_row[2], preferences),
                 "description": next_row[3]
             } if next_row else None
         }
         
-        return jsonify({
+        response = jsonify({
             "success": True,
             "navigation": navigation_data,
             "timestamp": datetime.now().isoformat()
-        }), 200
+        })
+        response.vary.add('Accept')
+        return response, 200
         
     except Exception as e:
         logger.error(f"Error fetching navigation data: {e}")
@@ -2408,20 +2594,19 @@ def generate_dynamic_image_analysis(image_id, local_image_data=None):
     # 🔧 修复：从数据库获取真实的用户输入坐标
     # 而不是基于image_id随机选择城市
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
         
-        # 查询图片关联的预测记录，获取真实的用户输入坐标
-        cur.execute("""
-            SELECT p.input_data, p.location
-            FROM images i
-            LEFT JOIN predictions p ON i.prediction_id = p.id
-            WHERE i.id = %s
-        """, (image_id,))
+            # 查询图片关联的预测记录，获取真实的用户输入坐标
+            cur.execute("""
+                SELECT p.input_data, p.location
+                FROM images i
+                LEFT JOIN predictions p ON i.prediction_id = p.id
+                WHERE i.id = %s
+            """, (image_id,))
         
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+            row = cur.fetchone()
+            cur.close()
         
         if row and row[0]:
             # 从预测记录中获取真实的用户输入坐标
@@ -2473,15 +2658,11 @@ def generate_dynamic_image_analysis(image_id, local_image_data=None):
         logger.info(f"🔮 Generating real ML prediction for image {image_id} at {location_name}")
         
         # 导入SHAP模型
-        from api.routes.shap_predict import get_shap_model
+        from api.routes.shap_predict import get_shap_model, predict_with_explanation
         model = get_shap_model()
         
-        # 直接调用模型预测
-        shap_result = model.predict_environmental_scores(
-            latitude=latitude,
-            longitude=longitude,
-            month=current_month
-        )
+        # 模型预测 + TreeSHAP解释（按预测缓存键缓存）
+        shap_result, _ = predict_with_explanation(model, latitude, longitude, current_month)
         
         if shap_result.get('success'):
             shap_data = shap_result
@@ -2625,6 +2806,7 @@ def generate_dynamic_image_analysis(image_id, local_image_data=None):
                 "generated_at": datetime.now().isoformat(),
                 "model_version": "fallback_v1.0.0",
                 "api_source": "fallback_algorithm", 
+                "fallback_used": True,
                 "location": location_name,
                 "image_id": image_id,
                 "ml_models_used": [],
@@ -2635,6 +2817,231 @@ def generate_dynamic_image_analysis(image_id, local_image_data=None):
         "location": location_name
     }
 
+def _is_fallback_analysis(result_data):
+    """是否为模型或环境数据不可用时生成的回退结果（随机种子得分、模拟温湿度）"""
+    metadata = (result_data or {}).get('analysis_metadata') or {}
+    return bool(metadata.get('fallback_used')) or metadata.get('api_source') == 'fallback_algorithm'
+
+def _is_complete_analysis(result_data):
+    """result_data中是否已有完整的分析结果（SHAP得分 + AI故事；回退结果不算完整，下次读取时重新生成）"""
+    return (bool(result_data) and 'ai_story' in result_data and 'climate_score' in result_data
+            and not _is_fallback_analysis(result_data))
+
+def _load_image_result_data(image_id):
+    """
+    读取图片关联预测记录的result_data（images/predictions主键查询）
+
+    Returns:
+        (prediction_id, result_data)；图片不存在时返回None
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT i.prediction_id, p.result_data
+            FROM images i
+            LEFT JOIN predictions p ON i.prediction_id = p.id
+            WHERE i.id = %s
+        """, (image_id,))
+        row = cur.fetchone()
+        cur.close()
+    return row
+
+def _persist_image_analysis(image_id, prediction_id, existing_result_data, analysis):
+    """
+    把动态分析结果写回predictions.result_data（与已有字段合并）
+    图片还没有关联的预测记录时新建一条并关联到图片
+
+    Returns:
+        合并后的result_data
+    """
+    result_data = {**(existing_result_data or {}), **analysis.get('result_data', {})}
+    prompt = analysis.get('prompt', 'ML-based environmental analysis')
+    location = analysis.get('location', 'Unknown Location')
+
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        if prediction_id:
+            cur.execute("""
+                UPDATE predictions
+                SET result_data = %s, prompt = %s, location = %s
+                WHERE id = %s
+            """, (json.dumps(result_data), prompt, location, prediction_id))
+        else:
+            prediction_id = _next_prediction_id(cur)
+            cur.execute("""
+                INSERT INTO predictions (id, input_data, result_data, prompt, location, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (prediction_id, json.dumps(analysis.get('input_data', {})), json.dumps(result_data),
+                  prompt, location, datetime.now()))
+            cur.execute("""
+                UPDATE images SET prediction_id = %s
+                WHERE id = %s AND prediction_id IS NULL
+            """, (prediction_id, image_id))
+        conn.commit()
+        cur.close()
+
+    logger.info(f"✅ Dynamic analysis persisted to predictions.result_data for image {image_id} (prediction {prediction_id})")
+    return result_data
+
+def _generate_and_persist_image_analysis(image_id, force=False):
+    """单次生成: 重新检查已持久化的结果（可能刚由其他进程写入），否则生成并写回"""
+    prediction_id, existing_result_data = None, None
+    try:
+        row = _load_image_result_data(image_id)
+        if row:
+            prediction_id, existing_result_data = row
+            if not force and _is_complete_analysis(existing_result_data):
+                return existing_result_data, 'stored'
+    except Exception as db_error:
+        logger.warning(f"⚠️ Could not re-check stored analysis for image {image_id}: {db_error}")
+
+    analysis = generate_dynamic_image_analysis(image_id)
+
+    # 回退结果只返回给本次调用方，不写回（否则一次临时故障会让假数据永久保留）
+    if _is_fallback_analysis(analysis.get('result_data')):
+        logger.warning(f"⚠️ Fallback analysis for image {image_id} not persisted, will regenerate on next request")
+        return analysis.get('result_data', {}), 'fallback'
+
+    try:
+        return _persist_image_analysis(image_id, prediction_id, existing_result_data, analysis), 'generated'
+    except Exception as db_error:
+        logger.error(f"❌ Failed to persist analysis for image {image_id}: {db_error}")
+        return analysis.get('result_data', {}), 'generated'
+
+def get_or_generate_image_analysis(image_id, result_data=None, force=False):
+    """
+    读取图片的完整分析结果；不存在时生成并写回predictions.result_data
+
+    同一image_id的并发请求只执行一次生成（模型推理 + DeepSeek故事），
+    其余请求等待并共享结果；写回后之后的读取都是一次主键查询。
+
+    Args:
+        image_id: 图片ID
+        result_data: 调用方已读取的result_data（避免重复查询）
+        force: 忽略已存储的结果重新生成（上传后用ML结果替换占位数据）
+
+    Returns:
+        (result_data, source)  source: 'stored' / 'generated' / 'fallback' / 'shared'
+    """
+    if not force:
+        if result_data is None:
+            row = _load_image_result_data(image_id)
+            result_data = row[1] if row else None
+        if _is_complete_analysis(result_data):
+            return result_data, 'stored'
+
+    (result_data, source), shared = get_single_flight('image_analysis').do(
+        image_id, _generate_and_persist_image_analysis, image_id, force
+    )
+    return result_data, ('shared' if shared else source)
+
+def _run_image_analysis_job(payload):
+    """后台任务: 生成图片分析并写回predictions.result_data（得到回退结果时抛出异常，由任务队列退避重试）"""
+    result_data, source = get_or_generate_image_analysis(payload['image_id'], force=payload.get('force', False))
+    if _is_fallback_analysis(result_data):
+        raise RuntimeError(f"Only fallback analysis available for image {payload['image_id']}")
+    emit_image_updated_event(payload['image_id'], rooms=(image_room(payload['image_id']),), analysis_ready=True)
+    return {
+        'image_id': payload['image_id'],
+        'source': source,
+        'final_score': result_data.get('final_score')
+    }
+
+def _run_local_image_analysis_job(payload):
+    """后台任务: 本地存储模式（数据库不可用）下的图片分析"""
+    result = process_image_analysis(payload['image_id'], payload['image_url'],
+                                    payload['description'], payload['prediction_id'])
+    if result.get('status') != 'completed':
+        raise RuntimeError(result.get('error', 'Image analysis failed'))
+    emit_image_updated_event(payload['image_id'], rooms=(image_room(payload['image_id']),), analysis_ready=True)
+    return {'image_id': payload['image_id'], 'status': result['status']}
+
+def _store_derivative_in_cloudinary(image_id):
+    """返回把图片版本上传到Cloudinary（与原图同一账户）的存储函数"""
+    def store(size, image_format, data, content_type):
+        import cloudinary.uploader
+        with timed(EXTERNAL_REQUEST_SECONDS, 'cloudinary_upload'):
+            upload_result = cloudinary.uploader.upload(
+                io.BytesIO(data),
+                folder="obscura_images/derivatives",
+                public_id=f"image_{image_id}_{size}_{image_format}",
+                overwrite=True,
+                resource_type="image"
+            )
+        return upload_result['secure_url']
+    return store
+
+def _read_original_image(image_id, image_url):
+    """读取原图字节（优先使用下载缓存，同时为下载接口预热）"""
+    if image_cache_enabled():
+        for _ in range(2):
+            try:
+                with open(get_image_cache().get(image_id, image_url)['path'], 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                # 打开前被淘汰，再次get会重新下载
+                continue
+    response = get_http_session().get(image_url, timeout=float(os.getenv('IMAGE_FETCH_TIMEOUT', 30)))
+    response.raise_for_status()
+    return response.content
+
+def _run_image_derivatives_job(payload):
+    """后台任务: 生成图片的多尺寸版本，记录到images.derivatives，并用small JPEG作为缩略图"""
+    image_id = payload['image_id']
+    data = _read_original_image(image_id, payload['image_url'])
+    derivatives = create_derivatives(data, _store_derivative_in_cloudinary(image_id))
+
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        ensure_derivatives_column(cur)
+        cur.execute("""
+            UPDATE images SET derivatives = %s, thumbnail_url = %s
+            WHERE id = %s AND url = %s
+        """, (json.dumps(derivatives), derivatives['small']['jpeg'], image_id, payload['image_url']))
+        updated = cur.rowcount
+        conn.commit()
+        cur.close()
+
+    if updated:
+        emit_image_updated_event(image_id, thumbnail_url=derivatives['small']['jpeg'], derivatives=derivatives)
+    return {'image_id': image_id, 'updated': bool(updated),
+            'sizes': {size: [entry['width'], entry['height']] for size, entry in derivatives.items()}}
+
+register_job_handler('image_analysis', _run_image_analysis_job)
+register_job_handler('local_image_analysis', _run_local_image_analysis_job)
+register_job_handler('image_derivatives', _run_image_derivatives_job)
+
+def _warmup_image_cache():
+    """预热: 创建图片获取连接池，加载下载缓存索引"""
+    get_http_session()
+    if not image_cache_enabled():
+        return {'image_cache': 'disabled'}
+    stats = get_image_cache().get_stats()
+    return {'cached_files': stats['files'], 'size_bytes': stats['size_bytes']}
+
+register_warmup_step('image_cache', _warmup_image_cache, required=False)
+
+def _enqueue_image_analysis(job_type, payload):
+    """提交图片分析任务（按图片去重），返回任务ID；任务队列不可用时返回None"""
+    try:
+        job_id, created = enqueue_job(job_type, payload, dedup_key=f"{job_type}:{payload['image_id']}")
+        logger.info(f"📥 Analysis job #{job_id} {'queued' if created else 'already active'} for image {payload['image_id']}")
+        return job_id
+    except Exception as e:
+        logger.error(f"❌ Failed to enqueue analysis job for image {payload['image_id']}: {e}")
+        return None
+
+def _enqueue_image_derivatives(image_id, image_url):
+    """提交图片版本生成任务（按图片去重），返回任务ID；任务队列不可用时返回None"""
+    try:
+        job_id, created = enqueue_job('image_derivatives', {'image_id': image_id, 'image_url': image_url},
+                                      dedup_key=f"image_derivatives:{image_id}")
+        logger.info(f"📥 Derivatives job #{job_id} {'queued' if created else 'already active'} for image {image_id}")
+        return job_id
+    except Exception as e:
+        logger.error(f"❌ Failed to enqueue derivatives job for image {image_id}: {e}")
+        return None
+
 @images_bp.route('/<int:image_id>/refresh-story', methods=['POST'])
 def refresh_image_story(image_id):
     """
@@ -2651,7 +3058,8 @@ def refresh_image_story(image_id):
             image_id=image_id,
             image_url=f"placeholder_url_{image_id}",
             description=f"Force refresh analysis for image {image_id}",
-            prediction_id=None
+            prediction_id=None,
+            force_unique=True
         )
         
         if analysis_result and analysis_result.get('status') == 'completed':
@@ -2678,37 +3086,81 @@ def refresh_image_story(image_id):
             "error": str(e)
         }), 500
 
+def _generate_refresh_story(result_data, attempts=3):
+    """批量刷新使用的故事生成: 先占用批量预算再等待共享令牌，DeepSeek请求失败时退避重试，不使用备用故事"""
+    for attempt in range(1, attempts + 1):
+        try:
+            _get_deepseek_bulk_rate_limiter().acquire()
+            return request_deepseek_story(result_data)
+        except Exception:
+            if attempt == attempts:
+                raise
+            time.sleep(2 ** attempt)
+
+def _run_story_refresh_job(payload):
+    """后台任务: 执行（或从检查点继续）批量故事刷新"""
+    run = run_story_refresh(payload['run_id'], _generate_refresh_story, heartbeat=heartbeat_job)
+    return {key: run[key] for key in ('id', 'status', 'total', 'processed', 'succeeded', 'failed', 'skipped')}
+
+register_job_handler('story_refresh', _run_story_refresh_job)
+
+def _enqueue_story_refresh(run_id):
+    """提交批量刷新任务（按刷新记录去重）"""
+    job_id, _ = enqueue_job('story_refresh', {'run_id': run_id}, dedup_key=f"story_refresh:{run_id}")
+    set_story_refresh_job(run_id, job_id)
+    return job_id
+
+def _bounded_int(value, default, minimum, maximum):
+    return max(minimum, min(maximum, int(value if value is not None else default)))
+
 @images_bp.route('/refresh-all-stories', methods=['POST'])
+@require_admin_token
 def refresh_all_stories():
     """
-    🔄 强制重新生成所有图片的AI故事（危险操作，仅限管理员）
+    🔄 批量重新生成图片的AI故事（危险操作，需要X-Admin-Token管理员令牌）
+    
+    请求体（均可选）:
+        image_ids, since, until, location, only_missing: 筛选条件
+        concurrency: 并发LLM请求数（默认STORY_REFRESH_CONCURRENCY）
+        batch_size: 每次提交的图片数（默认STORY_REFRESH_BATCH_SIZE）
+    
+    在后台任务中执行，返回刷新记录ID；进度通过GET /refresh-all-stories/<run_id>查询。
+    每分钟LLM请求数由DEEPSEEK_RPM限制。
     """
     try:
-        logger.info("🔄 Starting bulk story refresh operation")
+        if not os.getenv('DEEPSEEK_API_KEY'):
+            return jsonify({
+                "success": False,
+                "error": "DEEPSEEK_API_KEY is not configured; bulk refresh would only produce fallback stories"
+            }), 400
         
-        # 获取所有图片ID
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
+        data = request.get_json(silent=True) or {}
+        try:
+            filters = parse_story_refresh_filters(data)
+            concurrency = _bounded_int(data.get('concurrency'), os.getenv('STORY_REFRESH_CONCURRENCY', 4), 1, 16)
+            batch_size = _bounded_int(data.get('batch_size'), os.getenv('STORY_REFRESH_BATCH_SIZE', 20), 1, 500)
+        except (TypeError, ValueError) as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         
-        # 获取所有图片ID
-        cur.execute("SELECT id FROM images ORDER BY id")
-        image_ids = [row[0] for row in cur.fetchall()]
+        run = create_story_refresh_run(filters, concurrency, batch_size)
+        run['job_id'] = _enqueue_story_refresh(run['id'])
         
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        logger.info(f"✅ Found {len(image_ids)} images to refresh")
+        logger.info(f"🔄 Bulk story refresh #{run['id']} queued for {run['total']} images (job #{run['job_id']})")
         
         return jsonify({
             "success": True,
-            "message": f"Ready to refresh stories for {len(image_ids)} images",
+            "message": f"Story refresh queued for {run['total']} images",
             "data": {
-                "total_images": len(image_ids),
-                "refresh_timestamp": datetime.now().isoformat(),
-                "note": "Stories will be regenerated when images are next viewed"
+                "run_id": run['id'],
+                "job_id": run['job_id'],
+                "total_images": run['total'],
+                "filters": filters,
+                "concurrency": concurrency,
+                "batch_size": batch_size,
+                "status_url": f"/api/v1/images/refresh-all-stories/{run['id']}",
+                "refresh_timestamp": datetime.now().isoformat()
             }
-        })
+        }), 202
         
     except Exception as e:
         logger.error(f"❌ Error in bulk story refresh: {e}")
@@ -2716,3 +3168,58 @@ def refresh_all_stories():
             "success": False,
             "error": str(e)
         }), 500
+
+@images_bp.route('/refresh-all-stories/<int:run_id>', methods=['GET'])
+@require_admin_token
+def get_story_refresh_status(run_id):
+    """
+    📊 批量故事刷新进度（已处理/成功/失败/跳过数量、检查点、预计剩余时间）
+    """
+    try:
+        run = get_story_refresh_run(run_id)
+        if run is None:
+            return jsonify({"success": False, "error": f"Story refresh run {run_id} not found"}), 404
+        
+        return jsonify({"success": True, "data": run})
+        
+    except Exception as e:
+        logger.error(f"❌ Error getting story refresh run {run_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@images_bp.route('/refresh-all-stories/<int:run_id>/resume', methods=['POST'])
+@require_admin_token
+def resume_story_refresh(run_id):
+    """
+    ▶️ 从检查点继续中断的批量故事刷新（任务重试次数用尽后手动继续）
+    """
+    try:
+        run = get_story_refresh_run(run_id)
+        if run is None:
+            return jsonify({"success": False, "error": f"Story refresh run {run_id} not found"}), 404
+        if run['status'] == 'completed':
+            return jsonify({"success": False, "error": f"Story refresh run {run_id} is already completed"}), 409
+        
+        job_id = _enqueue_story_refresh(run_id)
+        logger.info(f"▶️ Bulk story refresh #{run_id} resumed after image {run['last_image_id']} (job #{job_id})")
+        
+        return jsonify({
+            "success": True,
+            "message": f"Story refresh {run_id} resumed from checkpoint",
+            "data": {
+                "run_id": run_id,
+                "job_id": job_id,
+                "last_image_id": run['last_image_id'],
+                "processed": run['processed'],
+                "total_images": run['total']
+            }
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"❌ Error resuming story refresh run {run_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务API端点
+查询上传后分析任务的状态、尝试次数和计时
+"""
+
+from flask import Blueprint, jsonify
+from datetime import datetime
+import logging
+
+from api.utils.job_queue import get_job_queue, get_job_stats
+
+logger = logging.getLogger(__name__)
+
+# 创建蓝图
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/v1/jobs')
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """获取单个任务的状态"""
+    try:
+        job = get_job_queue().get(job_id)
+        if job is None:
+            return jsonify({
+                'success': False,
+                'message': f'任务不存在: {job_id}',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'message': '任务状态获取成功',
+            'data': job,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"❌ 获取任务状态失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取任务状态失败: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@jobs_bp.route('/stats', methods=['GET'])
+def job_stats():
+    """获取任务队列统计（各状态任务数、最早排队任务的等待时间、工作线程状态）"""
+    try:
+        return jsonify({
+            'success': True,
+            'message': '任务队列统计获取成功',
+            'data': get_job_stats(),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"❌ 获取任务队列统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取任务队列统计失败: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
@@ -12,7 +12,6 @@ import os
 import traceback
 from pathlib import Path
 import numpy as np
-import joblib
 
 # 添加项目根目录到路径
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -20,15 +19,14 @@ sys.path.insert(0, project_root)
 
 from api.schemas import validate_ml_input
 from api.utils import validate_json_input, ml_prediction_response, error_response
+from api.utils.startup_profile import register_deferred_loader, load_deferred
+from api.utils.warmup import register_warmup_step
 
 logger = logging.getLogger(__name__)
 
 # 创建蓝图
 ml_bp = Blueprint('ml_predict', __name__, url_prefix='/api/v1/ml')
 
-# 全局模型实例
-_environmental_model = None
-
 class LocalEnvironmentalPredictor:
     """本地环境预测器 - 加载pkl模型文件"""
     
@@ -143,11 +141,48 @@ class LocalEnvironmentalPredictor:
     
     def predict(self, latitude, longitude, month=None, future_years=0):
         """进行预测"""
-        if month is None:
-            month = datetime.now().month
+        result = self.predict_batch([{
+            'latitude': latitude,
+            'longitude': longitude,
+            'month': month,
+            'future_years': future_years
+        }])[0]
+        
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def predict_batch(self, locations):
+        """
+        批量预测：构建N×8特征矩阵，每个模型只调用一次predict
         
-        # 准备特征
-        features, closest_city = self.prepare_features(latitude, longitude, month, future_years)
+        Returns:
+            与输入顺序一致的列表，元素为预测结果字典；输入无效的行为对应的异常对象
+        """
+        results = [None] * len(locations)
+        rows, feature_rows = [], []
+        
+        # 准备特征（逐行隔离无效输入）
+        for i, location in enumerate(locations):
+            try:
+                latitude = float(location['latitude'])
+                longitude = float(location['longitude'])
+                month = location.get('month')
+                if month is None:
+                    month = datetime.now().month
+                future_years = location.get('future_years', 0)
+                
+                features, closest_city = self.prepare_features(latitude, longitude, month, future_years)
+                feature_rows.append(features[0])
+                rows.append((i, latitude, longitude, month, future_years, closest_city))
+            except Exception as e:
+                results[i] = e
+        
+        if not rows:
+            return results
+        
+        features = np.vstack(feature_rows)
+        temperatures = humidities = pressures = None
         
         # 进行预测
         if self.model_loaded and self.temperature_model and hasattr(self.temperature_model, 'predict'):
@@ -158,19 +193,25 @@ class LocalEnvironmentalPredictor:
                     processed_features = self.scaler.transform(features)
                 
                 # 使用训练好的模型预测温度
-                temperature = float(self.temperature_model.predict(processed_features)[0])
+                temperatures = np.asarray(self.temperature_model.predict(processed_features), dtype=float)
                 
-                # 使用训练好的模型预测湿度（如果存在）
+                # 使用训练好的模型预测湿度和气压（如果存在）
                 if self.humidity_model and hasattr(self.humidity_model, 'predict'):
-                    humidity = float(self.humidity_model.predict(processed_features)[0])
-                else:
-                    humidity = self._predict_humidity(temperature, month)
-                
-                # 使用训练好的模型预测气压（如果存在）
+                    humidities = np.asarray(self.humidity_model.predict(processed_features), dtype=float)
                 if self.pressure_model and hasattr(self.pressure_model, 'predict'):
-                    pressure = float(self.pressure_model.predict(processed_features)[0])
-                else:
-                    pressure = self._predict_pressure(latitude, temperature)
+                    pressures = np.asarray(self.pressure_model.predict(processed_features), dtype=float)
+                
+                logger.info(f"✅ 使用训练模型批量预测成功: {len(rows)}个位置")
+                
+            except Exception as e:
+                logger.warning(f"⚠️ 模型预测失败，使用降级方法: {e}")
+                temperatures = humidities = pressures = None
+        
+        for row, (i, latitude, longitude, month, future_years, closest_city) in enumerate(rows):
+            if temperatures is not None:
+                temperature = float(temperatures[row])
+                humidity = float(humidities[row]) if humidities is not None else self._predict_humidity(temperature, month)
+                pressure = float(pressures[row]) if pressures is not None else self._predict_pressure(latitude, temperature)
                 
                 # 未来预测调整（基于训练代码的逻辑）
                 if future_years > 0:
@@ -185,37 +226,27 @@ class LocalEnvironmentalPredictor:
                 
                 confidence = 0.95
                 model_type = "trained_sklearn"
-                
-                logger.info(f"✅ 使用训练模型预测成功: T={temperature:.1f}°C, H={humidity:.1f}%, P={pressure:.1f}hPa")
-                
-            except Exception as e:
-                logger.warning(f"⚠️ 模型预测失败，使用降级方法: {e}")
+            else:
+                # 使用降级预测
                 temperature = self._fallback_predict(latitude, longitude, month, future_years)
                 humidity = self._predict_humidity(temperature, month)
                 pressure = self._predict_pressure(latitude, temperature)
                 confidence = 0.75
                 model_type = "fallback"
-        else:
-            # 使用降级预测
-            temperature = self._fallback_predict(latitude, longitude, month, future_years)
-            humidity = self._predict_humidity(temperature, month)
-            pressure = self._predict_pressure(latitude, temperature)
-            confidence = 0.75
-            model_type = "fallback"
-        
-        # 构建预测结果
-        result = {
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 1),
-            'pressure': round(pressure, 1),
-            'closest_city': closest_city,
-            'prediction_confidence': confidence,
-            'model_version': self.version,
-            'predicted_at': datetime.now().isoformat(),
-            'model_type': model_type
-        }
+            
+            # 构建预测结果
+            results[i] = {
+                'temperature': round(temperature, 2),
+                'humidity': round(humidity, 1),
+                'pressure': round(pressure, 1),
+                'closest_city': closest_city,
+                'prediction_confidence': confidence,
+                'model_version': self.version,
+                'predicted_at': datetime.now().isoformat(),
+                'model_type': model_type
+            }
         
-        return result
+        return results
     
     def _predict_humidity(self, temperature, month):
         """基于温度和月份预测湿度"""
@@ -249,32 +280,46 @@ class LocalEnvironmentalPredictor:
         
         return base_temp + month_adj + future_adj
 
-def get_environmental_model():
-    """获取环境预测模型实例"""
-    global _environmental_model
-    
-    if _environmental_model is None:
-        try:
-            # 直接加载pkl模型文件
-            model_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'simple_environmental_model.pkl')
+def _load_environmental_model():
+    """加载环境预测模型（延迟加载器，joblib在这里才导入）"""
+    try:
+        # 直接加载pkl模型文件
+        model_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'simple_environmental_model.pkl')
+        
+        if os.path.exists(model_path):
+            import joblib
+            model_data = joblib.load(model_path)
             
-            if os.path.exists(model_path):
-                # 加载模型
-                model_data = joblib.load(model_path)
-                
-                # 创建模型包装器
-                _environmental_model = LocalEnvironmentalPredictor(model_data)
-                logger.info("✅ 环境预测模型已加载")
-            else:
-                logger.warning("⚠️ 模型文件不存在，使用降级预测")
-                _environmental_model = LocalEnvironmentalPredictor(None)
-                
-        except Exception as e:
-            logger.error(f"❌ 模型加载失败: {e}")
-            traceback.print_exc()
-            _environmental_model = LocalEnvironmentalPredictor(None)
-    
-    return _environmental_model
+            # 创建模型包装器
+            logger.info("✅ 环境预测模型已加载")
+            return LocalEnvironmentalPredictor(model_data)
+
+        logger.warning("⚠️ 模型文件不存在，使用降级预测")
+        return LocalEnvironmentalPredictor(None)
+            
+    except Exception as e:
+        logger.error(f"❌ 模型加载失败: {e}")
+        traceback.print_exc()
+        return LocalEnvironmentalPredictor(None)
+
+register_deferred_loader('environmental_model', _load_environmental_model)
+
+def get_environmental_model():
+    """获取环境预测模型实例（第一次调用时加载）"""
+    return load_deferred('environmental_model')
+
+def _warmup_environmental_model():
+    """预热: 加载环境预测模型并对各城市中心跑一个合成批次"""
+    model = load_deferred('environmental_model', trigger='warmup')
+    locations = [{'latitude': center['lat'], 'longitude': center['lon'], 'month': 6}
+                 for center in model.city_centers.values()]
+    results = model.predict_batch(locations)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+    return {'batch_size': len(results), 'model_loaded': model.temperature_model is not None}
+
+register_warmup_step('environmental_model', _warmup_environmental_model)
 
 @ml_bp.route('/predict', methods=['POST'])
 def predict():
@@ -466,32 +511,26 @@ def predict_batch():
         if not model:
             return error_response("Environmental model not available", 503)
         
-        # 批量预测
+        # 批量预测（一次构建特征矩阵，每个模型只调用一次）
+        predictions = model.predict_batch(locations)
         results = []
-        for i, location in enumerate(locations):
-            try:
-                lat = float(location['latitude'])
-                lon = float(location['longitude'])
-                month = location.get('month', datetime.now().month)
-                future_years = location.get('future_years', 0)
-                
-                prediction = model.predict(lat, lon, month, future_years)
-                
-                results.append({
-                    "index": i,
-                    "success": True,
-                    "prediction": prediction,
-                    "input": location,
-                    "closest_city": _get_closest_city(lat, lon)
-                })
-                
-            except Exception as e:
+        for i, (location, prediction) in enumerate(zip(locations, predictions)):
+            if isinstance(prediction, Exception):
                 results.append({
                     "index": i,
                     "success": False,
-                    "error": str(e),
+                    "error": str(prediction),
                     "input": location
                 })
+                continue
+            
+            results.append({
+                "index": i,
+                "success": True,
+                "prediction": prediction,
+                "input": location,
+                "closest_city": _get_closest_city(float(location['latitude']), float(location['longitude']))
+            })
         
         # 统计结果
         successful = sum(1 for r in results if r['success'])
@@ -23,44 +23,29 @@ sys.path.insert(0, project_root)
 from utils.score_normalizer import get_score_normalizer
 
 # 🔧 修复：确保能够正确找到ML_Models模块
-try:
-    # 尝试从项目根目录加载ML_Models
-    import importlib.util
-    ml_models_path = os.path.join(project_root, 'ML_Models')
-    if os.path.exists(ml_models_path) and ml_models_path not in sys.path:
-        sys.path.insert(0, ml_models_path)
-        print(f"✅ 已添加ML_Models路径到sys.path: {ml_models_path}")
-    
-    # 验证混合模型包装器路径
-    hybrid_wrapper_path = os.path.join(project_root, 'ML_Models', 'models', 'shap_deployment', 'hybrid_model_wrapper.py')
-    if os.path.exists(hybrid_wrapper_path):
-        print(f"✅ 混合模型包装器文件存在: {hybrid_wrapper_path}")
-    else:
-        print(f"❌ 混合模型包装器文件不存在: {hybrid_wrapper_path}")
-        
-except Exception as e:
-    print(f"⚠️ 路径设置过程中出现警告: {e}")
+ml_models_path = os.path.join(project_root, 'ML_Models')
+if os.path.exists(ml_models_path) and ml_models_path not in sys.path:
+    sys.path.insert(0, ml_models_path)
 
-# 条件导入混合SHAP模型包装器
-try:
-    from ML_Models.models.shap_deployment.hybrid_model_wrapper import get_hybrid_shap_model
-    SHAP_AVAILABLE = True
-    print("✅ HybridSHAPModelWrapper导入成功")
-except ImportError as e:
-    print(f"⚠️ 混合SHAP模型不可用: {e}")
-    SHAP_AVAILABLE = False
-    get_hybrid_shap_model = None
+# 混合SHAP模型包装器在第一次使用（或预热）时才导入，这里只检查文件是否存在
+hybrid_wrapper_path = os.path.join(project_root, 'ML_Models', 'models', 'shap_deployment', 'hybrid_model_wrapper.py')
+SHAP_AVAILABLE = os.path.exists(hybrid_wrapper_path)
 
 from api.utils import ml_prediction_response, error_response
+from api.utils.inference_batcher import get_micro_batch_dispatcher, get_micro_batch_stats, micro_batching_enabled
+from api.utils.prediction_cache import (
+    get_prediction_cache, get_prediction_cache_stats, prediction_cache_enabled,
+    get_explanation_cache, get_explanation_cache_stats
+)
+from api.utils.story_cache import get_story_cache_stats
+from api.utils.startup_profile import register_deferred_loader, load_deferred
+from api.utils.warmup import register_warmup_step, get_warmup_status
 
 logger = logging.getLogger(__name__)
 
 # 创建蓝图
 shap_bp = Blueprint('shap_predict', __name__, url_prefix='/api/v1/shap')
 
-# 全局SHAP模型实例
-_shap_model = None
-
 def validate_json_input(request):
     """通用JSON输入验证函数"""
     try:
@@ -75,32 +60,98 @@ def validate_json_input(request):
     except Exception as e:
         return error_response(f"JSON解析错误: {str(e)}", status_code=400, error_code="json_parse_error")
 
+def predict_with_explanation(model, latitude, longitude, month=None):
+    """
+    带TreeSHAP解释的预测，按预测缓存键缓存解释结果
+
+    Returns:
+        (预测结果字典（含shap_analysis）, 缓存状态 'HIT'/'MISS'/None)
+    """
+    cache = get_explanation_cache() if prediction_cache_enabled() else None
+    if cache is not None:
+        cache_key = cache.make_key(latitude, longitude, month or datetime.now().month, model.model_version)
+        result = cache.get(cache_key)
+        if result is not None:
+            result['coordinates'].update({'lat': latitude, 'lon': longitude})
+            return result, 'HIT'
+
+    result = model.predict_environmental_scores(
+        latitude=latitude,
+        longitude=longitude,
+        month=month,
+        analyze_shap=True
+    )
+
+    # 只缓存成功计算出SHAP值的结果
+    if cache is not None and result.get('success') and 'error' not in result.get('shap_analysis', {'error': True}):
+        cache.set(cache_key, result)
+    return result, ('MISS' if cache is not None else None)
+
+def _load_shap_model():
+    """导入混合模型包装器并加载SHAP模型（延迟加载器）"""
+    global SHAP_AVAILABLE
+
+    try:
+        from ML_Models.models.shap_deployment.hybrid_model_wrapper import get_hybrid_shap_model
+    except ImportError as e:
+        SHAP_AVAILABLE = False
+        logger.warning(f"⚠️ 混合SHAP模型不可用: {e}")
+        raise RuntimeError(f"混合SHAP模型不可用，可能缺少依赖包: {e}")
+
+    try:
+        # 🔧 修复：使用混合模型包装器，指定正确的模型路径
+        models_path = os.path.join(project_root, "ML_Models", "models", "shap_deployment", "trained_models_66")
+        model = get_hybrid_shap_model(models_path)
+        logger.info("✅ 混合SHAP模型包装器初始化成功")
+
+        # 验证模型状态
+        logger.info(f"📊 SHAP模型状态: {model.get_model_status()}")
+    except Exception as e:
+        logger.error(f"❌ SHAP模型初始化失败: {e}")
+        raise
+
+    return model
+
+register_deferred_loader('shap_model', _load_shap_model)
+
 def get_shap_model():
-    """获取混合SHAP模型实例 (单例模式)"""
-    global _shap_model
-    
+    """获取混合SHAP模型实例 (单例模式，第一次调用时加载)"""
     if not SHAP_AVAILABLE:
         raise RuntimeError("混合SHAP模型不可用，可能缺少依赖包")
-    
-    if _shap_model is None:
-        try:
-            # 🔧 修复：使用混合模型包装器，指定正确的模型路径
-            import os
-            models_path = os.path.join(project_root, "ML_Models", "models", "shap_deployment", "trained_models_66")
-            _shap_model = get_hybrid_shap_model(models_path)
-            print("✅ 混合SHAP模型包装器初始化成功")
-            
-            # 验证模型状态
-            status = _shap_model.get_model_status()
-            print(f"📊 SHAP模型状态: {status}")
-            
-        except Exception as e:
-            print(f"❌ SHAP模型初始化失败: {e}")
-            logger.error(f"❌ SHAP模型初始化失败: {e}")
-            _shap_model = None
-            raise
-    
-    return _shap_model
+    return load_deferred('shap_model')
+
+def _warmup_shap_model():
+    """
+    预热: 加载混合模型，用各城市中心的合成批次跑一遍RandomForest和LSTM（含TreeSHAP解释器），
+    再加载预测瓦片、归一化器和微批处理调度器
+    """
+    if not SHAP_AVAILABLE:
+        return {'skipped': 'hybrid SHAP model not available'}
+
+    model = load_deferred('shap_model', trigger='warmup')
+    locations = [{'latitude': center['lat'], 'longitude': center['lon'], 'month': 6, 'name': city}
+                 for city, center in model.city_centers.items()]
+
+    # analyze_shap=True 绕过预测瓦片，保证每个模型都执行一次前向计算
+    results = model.predict_batch(locations, analyze_shap=True)
+    failed = [result for result in results if not result.get('success')]
+    if failed:
+        raise RuntimeError(f"合成批次预测失败: {failed[0].get('error')}")
+
+    # 普通预测路径（加载预测瓦片）
+    model.predict_batch(locations[:1])
+    get_score_normalizer()
+    if micro_batching_enabled():
+        get_micro_batch_dispatcher(model)
+
+    return {
+        'models_loaded': list(model.loaded_models.keys()),
+        'batch_size': len(results),
+        'tree_shap_loaded': model.get_tree_explainer() is not None,
+        'model_version': model.model_version
+    }
+
+register_warmup_step('shap_model', _warmup_shap_model)
 
 @shap_bp.route('/debug/files', methods=['GET'])
 def debug_files():
@@ -232,37 +283,61 @@ def predict():
             logger.error(f"❌ 模型获取失败: {e}")
             return _fallback_prediction_response(request, fallback_reason=f"model_error: {str(e)}")
         
-        # 进行预测
         start_time = datetime.now()
-        result = model.predict_environmental_scores(
-            latitude=latitude,
-            longitude=longitude,
-            month=month
-        )
+        
+        # 查询预测缓存（坐标吸附到网格，月份缺省为当前月份）
+        result = None
+        cache_status = None
+        cache = get_prediction_cache() if prediction_cache_enabled() else None
+        if cache is not None:
+            cache_key = cache.make_key(latitude, longitude, month or datetime.now().month, model.model_version)
+            result = cache.get(cache_key)
+            cache_status = 'HIT' if result is not None else 'MISS'
+        
+        if result is not None:
+            result['coordinates'].update({'lat': latitude, 'lon': longitude})
+        else:
+            # 进行预测（并发请求经由微批处理合并为一次批量前向计算）
+            if micro_batching_enabled():
+                result = get_micro_batch_dispatcher(model).predict(latitude, longitude, month)
+            else:
+                result = model.predict_environmental_scores(
+                    latitude=latitude,
+                    longitude=longitude,
+                    month=month
+                )
+            
+            # 检查预测是否成功
+            if 'error' in result:
+                logger.warning(f"⚠️ 预测返回错误，使用降级处理: {result['error']}")
+                return _fallback_prediction_response(request, fallback_reason=f"prediction_error: {result['error']}")
+            
+            if cache is not None:
+                cache.set(cache_key, result)
         
         # 计算响应时间
         response_time = (datetime.now() - start_time).total_seconds()
         
-        # 检查预测是否成功
-        if 'error' in result:
-            logger.warning(f"⚠️ 预测返回错误，使用降级处理: {result['error']}")
-            return _fallback_prediction_response(request, fallback_reason=f"prediction_error: {result['error']}")
-        
         # 添加API元信息
         result['api_info'] = {
             'endpoint': '/api/v1/shap/predict',
             'version': 'v1.0.0',
             'response_time_seconds': response_time,
             'model_type': 'SHAP Environmental Framework',
+            'model_version': model.model_version,
+            'cache': cache_status or 'DISABLED',
             'fallback_used': False
         }
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'message': "SHAP环境预测成功",
             'data': result,
             'response_time_seconds': response_time
         })
+        if cache_status:
+            response.headers['X-Prediction-Cache'] = cache_status
+        return response
         
     except Exception as e:
         logger.error(f"❌ SHAP预测API错误: {e}")
@@ -405,14 +480,9 @@ def analyze():
         # 获取模型实例
         model = get_shap_model()
         
-        # 进行详细分析
+        # 进行详细分析（TreeSHAP解释按预测缓存键缓存）
         start_time = datetime.now()
-        result = model.predict_environmental_scores(
-            latitude=latitude,
-            longitude=longitude,
-            month=month,
-            analyze_shap=True
-        )
+        result, cache_status = predict_with_explanation(model, latitude, longitude, month)
         
         if 'error' in result:
             return error_response(f"分析失败: {result['error']}", status_code=500)
@@ -442,15 +512,19 @@ def analyze():
                 'analysis_depth': analysis_depth,
                 'analysis_time': datetime.now().isoformat(),
                 'response_time_seconds': (datetime.now() - start_time).total_seconds(),
-                'normalization_applied': True
+                'normalization_applied': True,
+                'explanation_cache': cache_status or 'DISABLED'
             }
         }
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'message': 'SHAP深度分析完成',
             'data': analysis_result
         })
+        if cache_status:
+            response.headers['X-Explanation-Cache'] = cache_status
+        return response
         
     except Exception as e:
         logger.error(f"❌ SHAP分析API错误: {e}")
@@ -547,12 +621,7 @@ def visualize():
         model = get_shap_model()
         
         # 获取预测和SHAP数据
-        result = model.predict_environmental_scores(
-            latitude=latitude,
-            longitude=longitude,
-            month=month,
-            analyze_shap=True
-        )
+        result, _ = predict_with_explanation(model, latitude, longitude, month)
         
         if 'error' in result:
             return error_response(f"可视化数据生成失败: {result['error']}", status_code=500)
@@ -587,6 +656,46 @@ def model_status():
         logger.error(f"❌ 获取SHAP模型状态错误: {e}")
         return error_response(f"状态获取失败: {str(e)}", status_code=500)
 
+@shap_bp.route('/batcher/stats', methods=['GET'])
+def batcher_stats():
+    """获取微批处理调度器统计（队列深度、批量大小分布、排队延迟）"""
+    return jsonify({
+        'success': True,
+        'message': '微批处理统计获取成功',
+        'data': get_micro_batch_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@shap_bp.route('/cache/stats', methods=['GET'])
+def prediction_cache_stats():
+    """获取预测缓存、SHAP解释缓存和故事缓存统计（命中率、条目数、淘汰次数）"""
+    return jsonify({
+        'success': True,
+        'message': '预测缓存统计获取成功',
+        'data': {**get_prediction_cache_stats(), 'explanations': get_explanation_cache_stats(),
+                 'stories': get_story_cache_stats()},
+        'timestamp': datetime.now().isoformat()
+    })
+
+@shap_bp.route('/tiles/stats', methods=['GET'])
+def prediction_tiles_stats():
+    """获取预测瓦片状态（覆盖城市、网格大小、瓦片年龄、命中次数）"""
+    try:
+        from ML_Models.models.shap_deployment.prediction_tiles import get_prediction_tile_store
+        tile_store = get_prediction_tile_store()
+        data = tile_store.get_stats() if tile_store else {}
+        data['enabled'] = tile_store is not None
+        
+        return jsonify({
+            'success': True,
+            'message': '预测瓦片统计获取成功',
+            'data': data,
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"❌ 获取预测瓦片统计失败: {e}")
+        return error_response(f"预测瓦片统计获取失败: {str(e)}", status_code=500)
+
 @shap_bp.route('/health', methods=['GET'])
 def health_check():
     """SHAP服务健康检查"""
@@ -597,7 +706,8 @@ def health_check():
         # 检查关键组件
         health_status = {
             'service_status': 'healthy',
-            'model_loaded': len(status.get('loaded_cities', [])) > 0,
+            'model_loaded': status.get('models_loaded', 0) > 0,
+            'warmed_up': get_warmup_status()['ready'],
             'manifest_loaded': status.get('manifest_loaded', False),
             'available_cities': status.get('available_cities', []),
             'timestamp': datetime.now().isoformat()
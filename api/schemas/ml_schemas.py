@@ -4,9 +4,10 @@
 ML API Schemas - 机器学习API的输入输出数据格式定义
 """
 
-import jsonschema
 from typing import Dict, Any
 
+# jsonschema在第一次校验时才导入（缩短冷启动）
+
 # ML预测API输入Schema
 ML_PREDICT_INPUT_SCHEMA = {
     "type": "object",
@@ -57,6 +58,7 @@ ML_PREDICT_OUTPUT_SCHEMA = {
 
 def validate_ml_input(data: Dict[str, Any]) -> bool:
     """验证ML API输入数据"""
+    import jsonschema
     try:
         jsonschema.validate(data, ML_PREDICT_INPUT_SCHEMA)
         return True
@@ -65,6 +67,7 @@ def validate_ml_input(data: Dict[str, Any]) -> bool:
 
 def validate_ml_output(data: Dict[str, Any]) -> bool:
     """验证ML API输出数据"""
+    import jsonschema
     try:
         jsonschema.validate(data, ML_PREDICT_OUTPUT_SCHEMA)
         return True
@@ -12,6 +12,9 @@ class GalleryApp {
         this.currentFilter = 'all';
         this.currentView = 'masonry';
         this.isLoading = false;
+        this.nextCursor = null;
+        this.hasMore = false;
+        this.pageSize = 24;
         this.imageModal = null;
         this.init();
     }
@@ -22,7 +25,6 @@ class GalleryApp {
     init() {
         this.setupEventListeners();
         this.loadImages();
-        this.updateStats();
         console.log('🖼️ Gallery System Initialized');
     }
 
@@ -58,7 +60,7 @@ class GalleryApp {
     }
 
     /**
-     * Load images from API
+     * Load the first page of images from API
      */
     async loadImages() {
         if (this.isLoading) return;
@@ -67,11 +69,12 @@ class GalleryApp {
         this.showLoadingState();
 
         try {
-            const response = await fetch('/api/v1/images');
-            const data = await response.json();
+            const data = await this.fetchImagePage(null);
 
             if (data.success) {
                 this.images = data.images || [];
+                this.nextCursor = data.next_cursor || null;
+                this.hasMore = Boolean(data.has_more);
                 this.applyFilter();
                 this.hideLoadingState();
                 this.updateStats();
@@ -91,6 +94,67 @@ class GalleryApp {
         }
     }
 
+    /**
+     * Fetch one page of gallery images (keyset pagination)
+     */
+    async fetchImagePage(cursor) {
+        const params = new URLSearchParams({ limit: this.pageSize, fields: 'summary' });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        const response = await fetch(`/api/v1/images?${params.toString()}`);
+        return response.json();
+    }
+
+    /**
+     * Load the next page of images and append it to the gallery
+     */
+    async loadMoreImages() {
+        if (this.isLoading || !this.hasMore || !this.nextCursor) return;
+
+        this.isLoading = true;
+
+        try {
+            const data = await this.fetchImagePage(this.nextCursor);
+
+            if (data.success) {
+                this.images = this.images.concat(data.images || []);
+                this.nextCursor = data.next_cursor || null;
+                this.hasMore = Boolean(data.has_more);
+                this.applyFilter();
+            } else {
+                throw new Error(data.error || 'Failed to load more images');
+            }
+
+        } catch (error) {
+            console.error('Failed to load more images:', error);
+        } finally {
+            this.isLoading = false;
+        }
+    }
+
+    /**
+     * Apply a coalesced images_delta pushed over WebSocket (no gallery refetch)
+     */
+    applyDelta(delta) {
+        if (delta.reset) {
+            this.loadImages();
+            return;
+        }
+
+        const removed = new Set(delta.removed || []);
+        const updates = new Map((delta.updated || []).map(change => [change.id, change]));
+        const knownIds = new Set(this.images.map(image => image.id));
+        const added = (delta.added || []).filter(image => !knownIds.has(image.id));
+
+        this.images = added.concat(this.images)
+            .filter(image => !removed.has(image.id))
+            .map(image => updates.has(image.id) ? { ...image, ...updates.get(image.id) } : image);
+
+        this.applyFilter();
+        this.updateStats();
+    }
+
     /**
      * Apply current filter to images
      */
@@ -402,19 +466,33 @@ class GalleryApp {
         const totalPredictionsElement = document.getElementById('total-predictions');
         const locationsExploredElement = document.getElementById('locations-explored');
 
+        // The image list is paginated, so totals come from the stats endpoint
+        let totalImages = this.images.length;
+        let uniquePredictions = new Set(this.images.map(img => img.prediction_id)).size;
+
+        try {
+            const response = await fetch('/api/gallery/stats');
+            const data = await response.json();
+            if (data.success && data.stats) {
+                totalImages = data.stats.total_images;
+                uniquePredictions = data.stats.unique_predictions;
+            }
+        } catch (error) {
+            console.warn('Gallery stats unavailable, using loaded page:', error);
+        }
+
         if (totalImagesElement) {
-            totalImagesElement.textContent = this.images.length;
+            totalImagesElement.textContent = totalImages;
         }
 
         // Get unique prediction IDs for prediction count
         if (totalPredictionsElement) {
-            const uniquePredictions = new Set(this.images.map(img => img.prediction_id));
-            totalPredictionsElement.textContent = uniquePredictions.size;
+            totalPredictionsElement.textContent = uniquePredictions;
         }
 
         // Placeholder for locations (would need additional data)
         if (locationsExploredElement) {
-            locationsExploredElement.textContent = Math.min(this.images.length, 12);
+            locationsExploredElement.textContent = Math.min(totalImages, 12);
         }
     }
 
@@ -493,6 +571,7 @@ class GalleryApp {
             if (scrollTop + clientHeight >= scrollHeight - 1000) {
                 isScrolling = true;
                 // Load more images if available
+                this.loadMoreImages();
                 setTimeout(() => {
                     isScrolling = false;
                 }, 1000);
@@ -10,6 +10,8 @@ class WebSocketClient {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.reconnectDelay = 3000; // 3秒
+        this.rooms = this.roomsForPage(window.location.pathname);
+        this.lastSeq = {};
         
         this.init();
     }
@@ -69,6 +71,30 @@ class WebSocketClient {
         }
     }
 
+    /**
+     * 根据当前页面决定订阅的房间（图库: gallery，详情页: image:<id>）
+     */
+    roomsForPage(path) {
+        if (path === '/gallery' || path === '/') {
+            return ['gallery'];
+        }
+        const matches = path.match(/\/image\/(\d+)/);
+        return matches ? [`image:${matches[1]}`] : [];
+    }
+
+    /**
+     * 订阅房间（连接和重连后都需要重新订阅）
+     */
+    subscribeRooms() {
+        this.rooms.forEach(room => {
+            this.socket.emit('subscribe', { room }, (ack) => {
+                if (ack && !ack.success) {
+                    console.warn(`⚠️ Failed to subscribe to ${room}:`, ack.error);
+                }
+            });
+        });
+    }
+
     /**
      * 设置事件监听器
      */
@@ -78,6 +104,7 @@ class WebSocketClient {
             this.isConnected = true;
             this.reconnectAttempts = 0;
             console.log('✅ WebSocket connected');
+            this.subscribeRooms();
             this.showConnectionStatus('connected');
         });
 
@@ -94,10 +121,10 @@ class WebSocketClient {
             this.showConnectionStatus('error');
         });
 
-        // 监听新图片上传事件
-        this.socket.on('new_image_uploaded', (data) => {
-            console.log('📸 New image uploaded:', data);
-            this.handleNewImageUploaded(data);
+        // 监听合并后的图片增量事件（新增 / 更新 / 删除）
+        this.socket.on('images_delta', (delta) => {
+            console.log('📸 Images delta:', delta);
+            this.handleImagesDelta(delta);
         });
 
         // 重连尝试
@@ -120,23 +147,36 @@ class WebSocketClient {
     }
 
     /**
-     * 处理新图片上传事件
+     * 处理图片增量事件：直接应用到当前页面，不重新请求整个图库
      */
-    handleNewImageUploaded(data) {
-        // 显示通知
-        this.showNotification(`New environmental vision uploaded: ${data.description}`, 'info');
+    handleImagesDelta(delta) {
+        // 重连后可能收到重复的批次
+        if (delta.seq <= (this.lastSeq[delta.room] || 0)) {
+            return;
+        }
+        this.lastSeq[delta.room] = delta.seq;
+
+        if (delta.room === 'gallery') {
+            const added = delta.added || [];
+            if (window.galleryApp && window.galleryApp.applyDelta) {
+                window.galleryApp.applyDelta(delta);
+            } else if (added.length > 0 || delta.reset) {
+                this.refreshGallery();
+            }
 
-        // 根据当前页面决定如何响应
-        const currentPath = window.location.pathname;
+            if (added.length === 1) {
+                this.showNotification(`New environmental vision uploaded: ${added[0].description}`, 'info');
+            } else if (added.length > 1) {
+                this.showNotification(`${added.length} new environmental visions uploaded`, 'info');
+            }
+            return;
+        }
 
-        if (currentPath === '/gallery' || currentPath === '/') {
-            // 在Gallery页面，重新加载图片列表
-            this.refreshGallery();
-        } else {
-            // 在其他页面，显示提示用户可以前往Gallery查看
-            this.showNotification('New image available in gallery!', 'update', () => {
-                window.location.href = '/gallery';
-            });
+        // 详情页：当前图片的分析完成后重新加载分析数据
+        const analysisReady = (delta.updated || []).some(change => change.analysis_ready);
+        if (analysisReady && window.imageDetailPage && window.imageDetailPage.loadImageData) {
+            window.imageDetailPage.loadImageData();
+            this.showNotification('Environmental analysis updated', 'update');
         }
     }
 
@@ -145,9 +185,9 @@ class WebSocketClient {
      */
     refreshGallery() {
         // 检查是否存在Gallery相关的刷新函数
-        if (typeof window.galleryPage !== 'undefined' && window.galleryPage.loadImages) {
+        if (typeof window.galleryApp !== 'undefined' && window.galleryApp && window.galleryApp.loadImages) {
             // 如果存在Gallery实例，调用其刷新方法
-            window.galleryPage.loadImages();
+            window.galleryApp.loadImages();
             console.log('🔄 Gallery refreshed via instance method');
         } else {
             // 否则重新加载整个页面
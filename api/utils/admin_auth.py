@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Admin Auth - 管理员令牌校验
+
+危险或付费的操作（批量刷新AI故事等）要求请求带有管理员令牌:
+    X-Admin-Token: <ADMIN_TOKEN> 请求头，或 ?token=<ADMIN_TOKEN> 查询参数
+
+配置项:
+    ADMIN_TOKEN: 管理员令牌（未设置时受保护的接口返回404）
+"""
+
+import os
+import hmac
+from datetime import datetime
+from functools import wraps
+from typing import Optional
+
+from flask import jsonify, request
+
+
+def admin_token() -> Optional[str]:
+    """管理员令牌（ADMIN_TOKEN，未设置时返回None）"""
+    return os.getenv('ADMIN_TOKEN') or None
+
+
+def admin_token_valid(token: Optional[str]) -> bool:
+    """令牌是否与ADMIN_TOKEN一致（未设置ADMIN_TOKEN时始终为False）"""
+    expected = admin_token()
+    return bool(expected and token) and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def require_admin_token(view):
+    """管理员令牌校验装饰器（X-Admin-Token 请求头或 ?token= 参数；未设置ADMIN_TOKEN时返回404）"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not admin_token():
+            return jsonify({
+                'success': False,
+                'error': 'Not available (ADMIN_TOKEN is not configured)',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        if not admin_token_valid(request.headers.get('X-Admin-Token') or request.args.get('token')):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid or missing admin token',
+                'timestamp': datetime.now().isoformat()
+            }), 401
+        return view(*args, **kwargs)
+    return wrapper
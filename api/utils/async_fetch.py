@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Async Fetch Engine - 环境数据并发获取引擎
+
+一次特征构建中，各数据源（Archive / Flood / Air Quality）相互独立，
+这里用asyncio并发发送请求，并用按主机划分的令牌桶限流（rate_limiter.py）替代固定的sleep间隔。
+Flask视图是同步的，通过run_sync()在同步代码中调用。
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Any
+from urllib.parse import urlparse
+
+import requests
+
+from api.utils.metrics import EXTERNAL_REQUEST_SECONDS, timed
+from api.utils.rate_limiter import RateLimiter, get_rate_limiter
+
+# httpx为可选依赖，不可用时退化为在线程中执行requests
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def _host_rate_limiter(url: str) -> RateLimiter:
+    """按主机名划分的限速器（所有请求共享，保证同一主机的总请求速率）"""
+    rate = float(os.getenv('ENV_DATA_RATE_PER_HOST', 3))
+    burst = int(float(os.getenv('ENV_DATA_BURST_PER_HOST', 3)))
+    return get_rate_limiter(f"open_meteo:{urlparse(url).netloc}", rate * 60, burst)
+
+
+async def _acquire(url: str):
+    """异步等待目标主机的令牌"""
+    await _host_rate_limiter(url).acquire_async()
+
+
+# 同步调用方所在线程已有运行中的事件循环时，使用后台循环线程执行协程
+_background_loop = None
+_background_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_background_loop.run_forever, name='async-fetch-loop', daemon=True)
+            thread.start()
+        return _background_loop
+
+
+def run_sync(coro):
+    """在同步代码（Flask视图、后台线程）中执行协程并返回结果"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    future = asyncio.run_coroutine_threadsafe(coro, _get_background_loop())
+    return future.result()
+
+
+async def _get_json(client, url: str, timeout: float) -> Dict[str, Any]:
+    """限流后发送GET请求并解析JSON"""
+    await _acquire(url)
+
+    if client is not None:
+        with timed(EXTERNAL_REQUEST_SECONDS, 'open_meteo'):
+            response = await client.get(url, timeout=timeout)
+            response.raise_for_status()
+        return response.json()
+
+    def _blocking_get():
+        with timed(EXTERNAL_REQUEST_SECONDS, 'open_meteo'):
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+        return response.json()
+
+    return await asyncio.to_thread(_blocking_get)
+
+
+async def fetch_range_series_async(collector, lat: float, lon: float,
+                                   start_date: str, end_date: str) -> Dict[str, Optional[Dict]]:
+    """
+    并发获取各API族的区间日序列
+
+    返回结构与RealTimeEnvironmentalDataCollector.fetch_range_series相同
+    """
+    requests_by_family = collector._range_requests(lat, lon, start_date, end_date)
+
+    async def fetch_family(client, family, base_url, params, parser):
+        query = {
+            'latitude': lat,
+            'longitude': lon,
+            'start_date': start_date,
+            'end_date': end_date,
+            **params,
+            'timezone': 'UTC'
+        }
+        url = collector._build_url(base_url, query)
+        try:
+            data = await _get_json(client, url, collector.range_timeout)
+            series = parser(data)
+            logger.info(f"区间数据获取成功: {family} {start_date}~{end_date} ({len(series)}天)")
+            return family, series
+        except Exception as e:
+            logger.warning(f"区间数据获取失败 {family} {start_date}~{end_date}: {e}")
+            return family, None
+
+    async def gather_all(client):
+        tasks = [
+            fetch_family(client, family, base_url, params, parser)
+            for family, (base_url, params, parser) in requests_by_family.items()
+        ]
+        return dict(await asyncio.gather(*tasks))
+
+    if HTTPX_AVAILABLE:
+        async with httpx.AsyncClient() as client:
+            return await gather_all(client)
+    return await gather_all(None)
+
+
+async def fetch_daily_records_async(collector, lat: float, lon: float, dates: List[str]) -> Dict[str, Dict]:
+    """
+    并发获取多个日期的单日数据（逐日模式）
+
+    复用收集器的单日获取方法，每个数据源请求前按主机获取令牌，替代固定的1秒间隔
+    """
+    archive_url = collector.open_meteo_archive_url
+    flood_url = collector.open_meteo_flood_url
+    air_quality_url = collector.open_meteo_air_quality_url
+
+    async def fetch_meteorological(date):
+        await _acquire(archive_url)
+        return await asyncio.to_thread(collector.fetch_daily_meteorological_data, lat, lon, date)
+
+    async def fetch_geospatial(date):
+        # 地理数据包含Archive和Flood两个请求
+        await _acquire(archive_url)
+        await _acquire(flood_url)
+        return await asyncio.to_thread(collector.fetch_daily_geospatial_data, lat, lon, date)
+
+    async def fetch_air_quality(date):
+        await _acquire(air_quality_url)
+        return await asyncio.to_thread(collector.fetch_daily_air_quality_data, lat, lon, date)
+
+    async def fetch_date(date):
+        meteo_data, geo_data, air_quality_data = await asyncio.gather(
+            fetch_meteorological(date), fetch_geospatial(date), fetch_air_quality(date)
+        )
+        return date, {**meteo_data, **geo_data, **air_quality_data}
+
+    unique_dates = list(dict.fromkeys(dates))
+    return dict(await asyncio.gather(*(fetch_date(date) for date in unique_dates)))
+
+
+def fetch_range_series_concurrently(collector, lat: float, lon: float,
+                                    start_date: str, end_date: str) -> Dict[str, Optional[Dict]]:
+    """fetch_range_series_async的同步包装"""
+    return run_sync(fetch_range_series_async(collector, lat, lon, start_date, end_date))
+
+
+def fetch_daily_records_concurrently(collector, lat: float, lon: float, dates: List[str]) -> Dict[str, Dict]:
+    """fetch_daily_records_async的同步包装"""
+    return run_sync(fetch_daily_records_async(collector, lat, lon, dates))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Database Pool - 应用级PostgreSQL连接池
+
+在create_app()中初始化，所有蓝图通过get_db_connection()上下文管理器借用连接，
+避免每个请求都重新建立TCP/TLS连接和数据库认证。
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+try:
+    import psycopg2
+    from psycopg2 import pool as pg_pool
+    POSTGRESQL_AVAILABLE = True
+except ImportError:
+    POSTGRESQL_AVAILABLE = False
+
+from api.utils.metrics import DB_QUERY_SECONDS, DB_CHECKOUT_SECONDS, metrics_enabled, observe
+
+logger = logging.getLogger(__name__)
+
+# 按语句类型统计执行时间
+_STATEMENT_TYPES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'CREATE', 'ALTER')
+
+
+def _statement_type(query) -> str:
+    if isinstance(query, bytes):
+        query = query[:32].decode('utf-8', 'ignore')
+    if not isinstance(query, str):
+        return 'OTHER'
+    verb = query.lstrip()[:8].split(None, 1)
+    verb = verb[0].upper() if verb else ''
+    return verb if verb in _STATEMENT_TYPES else 'OTHER'
+
+
+if POSTGRESQL_AVAILABLE:
+    class TimedCursor(psycopg2.extensions.cursor):
+        """记录语句执行时间的游标（启用指标时作为借出连接的默认cursor_factory）"""
+
+        def execute(self, query, vars=None):
+            start_time = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                observe(DB_QUERY_SECONDS, time.perf_counter() - start_time, _statement_type(query))
+
+        def executemany(self, query, vars_list):
+            start_time = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                observe(DB_QUERY_SECONDS, time.perf_counter() - start_time, _statement_type(query))
+
+
+class PoolTimeoutError(Exception):
+    """等待连接池空闲连接超时"""
+
+
+class DatabasePool:
+    """带借出健康检查和监控统计的线程安全连接池"""
+
+    def __init__(self, database_url: str, min_size: int = 1, max_size: int = 10,
+                 checkout_timeout: float = 10.0, ping_interval: float = 30.0):
+        """
+        初始化连接池
+
+        Args:
+            database_url: PostgreSQL连接串
+            min_size: 最小保持连接数
+            max_size: 最大连接数
+            checkout_timeout: 等待空闲连接的最长时间（秒）
+            ping_interval: 连接空闲超过该时间后，借出前执行SELECT 1检查（秒）
+        """
+        self.database_url = database_url
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+
+        self._pool = pg_pool.ThreadedConnectionPool(min_size, max_size, database_url)
+        # ThreadedConnectionPool在耗尽时直接抛错，用信号量实现排队等待
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'checkout_failures': 0,
+            'health_check_failures': 0,
+            'connections_replaced': 0,
+            'in_use': 0,
+            'max_in_use': 0,
+            'wait_time_total_seconds': 0.0,
+            'wait_time_max_seconds': 0.0,
+        }
+
+        logger.info(f"✅ 数据库连接池已创建: min={min_size}, max={max_size}")
+
+    def _is_healthy(self, conn) -> bool:
+        """借出前检查连接是否可用"""
+        if conn.closed:
+            return False
+
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.ping_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ 连接健康检查失败，将替换连接: {e}")
+            return False
+
+    def getconn(self):
+        """从池中借出一个健康的连接"""
+        wait_start = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._stats_lock:
+                self._stats['checkout_failures'] += 1
+            raise PoolTimeoutError(f"等待数据库连接超时 ({self.checkout_timeout}s)")
+
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                with self._stats_lock:
+                    self._stats['health_check_failures'] += 1
+                    self._stats['connections_replaced'] += 1
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            with self._stats_lock:
+                self._stats['checkout_failures'] += 1
+            raise
+
+        wait_time = time.monotonic() - wait_start
+        with self._stats_lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['max_in_use'] = max(self._stats['max_in_use'], self._stats['in_use'])
+            self._stats['wait_time_total_seconds'] += wait_time
+            self._stats['wait_time_max_seconds'] = max(self._stats['wait_time_max_seconds'], wait_time)
+
+        return conn
+
+    def putconn(self, conn, broken: bool = False):
+        """归还连接，未结束的事务会被回滚"""
+        try:
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+
+            if broken or conn.closed:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+
+            self._pool.putconn(conn, close=broken or conn.closed)
+        finally:
+            with self._stats_lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def closeall(self):
+        """关闭所有连接"""
+        self._pool.closeall()
+        self._last_used.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池监控数据"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        checkouts = stats['checkouts']
+        stats['wait_time_avg_seconds'] = stats['wait_time_total_seconds'] / checkouts if checkouts else 0.0
+        stats['min_size'] = self.min_size
+        stats['max_size'] = self.max_size
+        stats['checkout_timeout_seconds'] = self.checkout_timeout
+        return stats
+
+
+# 全局连接池实例（由create_app初始化，后台线程同样可以使用）
+_db_pool: Optional[DatabasePool] = None
+
+
+def init_db_pool(app=None) -> Optional[DatabasePool]:
+    """
+    根据环境变量创建连接池
+
+    配置项:
+        DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_INTERVAL
+    """
+    global _db_pool
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url or not POSTGRESQL_AVAILABLE:
+        logger.warning("⚠️ 未配置DATABASE_URL或psycopg2不可用，跳过连接池初始化")
+        return None
+
+    if _db_pool is None:
+        _db_pool = DatabasePool(
+            database_url,
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            checkout_timeout=float(os.getenv("DB_POOL_TIMEOUT", 10)),
+            ping_interval=float(os.getenv("DB_POOL_PING_INTERVAL", 30)),
+        )
+
+    if app is not None:
+        app.extensions['db_pool'] = _db_pool
+
+    return _db_pool
+
+
+def get_db_pool() -> Optional[DatabasePool]:
+    """获取全局连接池（未初始化时返回None）"""
+    return _db_pool
+
+
+@contextmanager
+def get_db_connection():
+    """
+    借用数据库连接的上下文管理器
+
+    正常退出时调用方负责commit，异常时自动回滚；
+    连接池未初始化时退化为直接连接，保持原有行为。
+    """
+    if _db_pool is None:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn.cursor_factory = TimedCursor if metrics_enabled() else None
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return
+
+    checkout_start = time.perf_counter()
+    conn = _db_pool.getconn()
+    observe(DB_CHECKOUT_SECONDS, time.perf_counter() - checkout_start)
+    conn.cursor_factory = TimedCursor if metrics_enabled() else None
+    broken = False
+    try:
+        yield conn
+    except psycopg2.InterfaceError:
+        broken = True
+        raise
+    except psycopg2.OperationalError:
+        broken = True
+        raise
+    finally:
+        _db_pool.putconn(conn, broken=broken)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """获取连接池统计信息，用于监控端点"""
+    if _db_pool is None:
+        return {'enabled': False}
+
+    stats = _db_pool.get_stats()
+    stats['enabled'] = True
+    return stats
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event Bus - 合并批量、按房间推送的SocketIO图片事件
+
+上传请求只把事件放入内存队列（不阻塞在广播上），后台线程等待一个短窗口后
+把同一房间的事件合并为一条 images_delta 推送:
+    {'seq', 'room', 'added': [图片...], 'updated': [{'id', 变化的字段...}], 'removed': [id...],
+     'reset': bool, 'server_time'}
+客户端直接应用增量（插入新图片、合并字段、删除），不需要重新请求整个图库；
+reset为true时（例如管理员清空图库）客户端重新加载。
+
+房间:
+- gallery: 图库页面（新图片、缩略图更新、删除）
+- image:<id>: 图片详情页（该图片的分析完成、图片版本更新）
+客户端连接后发送 subscribe / unsubscribe 事件（{'room': 'gallery'}）加入或离开房间。
+
+批量大小、发布到推送的延迟和推送耗时记录在 /metrics。
+
+配置项:
+    EVENT_BATCH_WINDOW_MS: 合并窗口（默认250ms）
+    EVENT_QUEUE_MAX: 待推送事件上限（默认1000，超出时丢弃最旧的事件）
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from api.utils.metrics import EVENT_BATCH_SIZE, EVENT_DELIVERY_SECONDS, EVENT_FANOUT_SECONDS, observe, timed
+
+logger = logging.getLogger(__name__)
+
+DELTA_EVENT = 'images_delta'
+
+GALLERY_ROOM = 'gallery'
+
+_ROOM_PATTERN = re.compile(r'^(gallery|image:\d+)$')
+
+
+def image_room(image_id) -> str:
+    """图片详情页的房间名"""
+    return f"image:{image_id}"
+
+
+def valid_room(room: Any) -> bool:
+    """客户端只能订阅gallery和image:<id>房间"""
+    return isinstance(room, str) and bool(_ROOM_PATTERN.match(room))
+
+
+def _room_type(room: str) -> str:
+    return room.split(':', 1)[0]
+
+
+class EventBus:
+    """按房间合并事件的异步推送器"""
+
+    def __init__(self, window_seconds: float = 0.25, max_queue: int = 1000):
+        self.window_seconds = window_seconds
+        self.socketio = None
+        # (房间, 类型, 数据, 发布时间)
+        self._pending = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # 序号从当前毫秒时间开始，服务重启后仍然递增（客户端按序号丢弃重复批次）
+        self._seq = int(time.time() * 1000)
+        self._stats = {'published': 0, 'dropped': 0, 'batches': 0, 'deltas_sent': 0, 'errors': 0}
+
+    def attach(self, socketio):
+        """绑定SocketIO实例并启动推送线程"""
+        self.socketio = socketio
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-bus', daemon=True)
+                self._thread.start()
+
+    def publish(self, kind: str, data: Any, rooms: Iterable[str] = (GALLERY_ROOM,)):
+        """
+        放入待推送队列（立即返回）
+
+        Args:
+            kind: added / updated / removed / reset
+            data: added为图片对象，updated为{'id', 变化的字段}，removed为图片ID，reset为None
+            rooms: 目标房间
+        """
+        if self.socketio is None:
+            return
+        now = time.perf_counter()
+        with self._cond:
+            for room in rooms:
+                if len(self._pending) == self._pending.maxlen:
+                    self._stats['dropped'] += 1
+                self._pending.append((room, kind, data, now))
+                self._stats['published'] += 1
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # 合并窗口：窗口内到达的事件一起推送
+            time.sleep(self.window_seconds)
+            with self._cond:
+                batch = list(self._pending)
+                self._pending.clear()
+            try:
+                self._flush(batch)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.error(f"❌ 事件推送失败: {e}")
+
+    @staticmethod
+    def build_deltas(batch) -> Dict[str, Dict[str, Any]]:
+        """把一批事件按房间合并为增量（同一图片的多次更新合并为一条，删除覆盖之前的新增和更新）"""
+        deltas = {}
+        for room, kind, data, published_at in batch:
+            delta = deltas.setdefault(room, {'added': {}, 'updated': {}, 'removed': [], 'reset': False,
+                                             'published_at': published_at})
+            if kind == 'reset':
+                delta.update(added={}, updated={}, removed=[], reset=True)
+            elif kind == 'added':
+                delta['added'][data['id']] = dict(data)
+            elif kind == 'updated':
+                image_id = data['id']
+                if image_id in delta['added']:
+                    delta['added'][image_id].update(data)
+                else:
+                    delta['updated'].setdefault(image_id, {}).update(data)
+            elif kind == 'removed':
+                delta['added'].pop(data, None)
+                delta['updated'].pop(data, None)
+                delta['removed'].append(data)
+        return deltas
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        deltas = self.build_deltas(batch)
+        self._stats['batches'] += 1
+
+        for room, delta in deltas.items():
+            self._seq += 1
+            payload = {
+                'seq': self._seq,
+                'room': room,
+                # 新图片按时间倒序（与图库排序一致）
+                'added': sorted(delta['added'].values(), key=lambda image: image.get('created_at') or '', reverse=True),
+                'updated': list(delta['updated'].values()),
+                'removed': delta['removed'],
+                'reset': delta['reset'],
+                'server_time': datetime.now().isoformat()
+            }
+            room_type = _room_type(room)
+            with timed(EVENT_FANOUT_SECONDS, room_type):
+                self.socketio.emit(DELTA_EVENT, payload, to=room)
+            observe(EVENT_DELIVERY_SECONDS, time.perf_counter() - delta['published_at'], room_type)
+            observe(EVENT_BATCH_SIZE, len(payload['added']) + len(payload['updated']) + len(payload['removed']),
+                    room_type)
+            self._stats['deltas_sent'] += 1
+
+        logger.info(f"📡 已推送 {len(batch)} 个事件 → {len(deltas)} 个房间")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update(pending=len(self._pending), window_ms=round(self.window_seconds * 1000),
+                     attached=self.socketio is not None)
+        return stats
+
+
+def register_socket_handlers(socketio):
+    """注册房间订阅事件处理器"""
+    from flask_socketio import join_room, leave_room
+
+    @socketio.on('subscribe')
+    def _subscribe(data):
+        room = (data or {}).get('room')
+        if not valid_room(room):
+            return {'success': False, 'error': 'invalid room'}
+        join_room(room)
+        return {'success': True, 'room': room}
+
+    @socketio.on('unsubscribe')
+    def _unsubscribe(data):
+        room = (data or {}).get('room')
+        if valid_room(room):
+            leave_room(room)
+        return {'success': True, 'room': room}
+
+
+# 单例实例
+_event_bus = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus() -> EventBus:
+    """
+    获取事件总线单例（未绑定SocketIO时publish不做任何事）
+
+    配置项:
+        EVENT_BATCH_WINDOW_MS, EVENT_QUEUE_MAX
+    """
+    global _event_bus
+    if _event_bus is None:
+        with _event_bus_lock:
+            if _event_bus is None:
+                _event_bus = EventBus(
+                    window_seconds=float(os.getenv('EVENT_BATCH_WINDOW_MS', 250)) / 1000,
+                    max_queue=int(os.getenv('EVENT_QUEUE_MAX', 1000))
+                )
+    return _event_bus
+
+
+def init_event_bus(socketio):
+    """绑定SocketIO实例、注册订阅处理器并启动推送线程"""
+    register_socket_handlers(socketio)
+    bus = get_event_bus()
+    bus.attach(socketio)
+    logger.info(f"📡 事件总线已启动: 合并窗口{bus.window_seconds * 1000:.0f}ms，房间 gallery / image:<id>")
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image Cache - 图片下载的本地磁盘LRU缓存
+
+下载接口原来每次都从Cloudinary流式代理。这里把图片字节缓存到本地磁盘:
+- 键: 图片ID + URL哈希（图片URL变化时自动使用新条目）
+- 容量: 按总字节数限制，超出时按最近访问时间淘汰（访问时间记录在文件mtime中，重启后保留）
+- ETag: 图片内容的SHA-1，配合send_file支持条件请求和Range请求
+- 未命中时使用带连接池和重试的HTTP会话获取，同一图片并发未命中只下载一次
+多个进程可以共享同一个缓存目录（每个进程维护自己的索引，文件被其他进程淘汰时视为未命中）。
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api.utils.single_flight import get_single_flight
+from api.utils.metrics import EXTERNAL_REQUEST_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
+# 访问时间（mtime）更新的最小间隔，避免每次命中都写文件系统元数据
+TOUCH_INTERVAL_SECONDS = 60
+
+
+class ImageTooLargeError(ValueError):
+    """上游图片超过单个文件的缓存上限"""
+
+
+class ImageDiskCache:
+    """线程安全的磁盘LRU图片缓存"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024,
+                 max_file_bytes: int = 25 * 1024 * 1024, timeout: float = 30.0,
+                 session: requests.Session = None):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总字节数上限
+            max_file_bytes: 单个图片的字节数上限（更大的图片不缓存）
+            timeout: 上游请求超时（秒）
+            session: 获取图片使用的HTTP会话（默认使用连接池会话）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.timeout = timeout
+        self.session = session or get_http_session()
+
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'fetch_errors': 0, 'bytes_fetched': 0}
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+        logger.info(f"ImageDiskCache初始化完成: {self.cache_dir}, {len(self._index)}个文件, "
+                    f"{self._total_bytes / 1e6:.1f}/{max_bytes / 1e6:.0f}MB")
+
+    @staticmethod
+    def make_key(image_id: int, url: str) -> str:
+        """缓存键: 图片ID + URL哈希"""
+        return f"{image_id}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}"
+
+    def _data_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.bin"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _load_index(self):
+        """扫描缓存目录，按文件访问时间（mtime）重建LRU顺序"""
+        entries = []
+        for meta_path in self.cache_dir.glob('*.json'):
+            key = meta_path.stem
+            data_path = self._data_path(key)
+            try:
+                meta = json.loads(meta_path.read_text())
+                entries.append((data_path.stat().st_mtime, key, meta))
+            except (OSError, ValueError):
+                self._remove_files(key)
+
+        for _, key, meta in sorted(entries, key=lambda entry: entry[0]):
+            self._index[key] = meta
+            self._total_bytes += meta['size']
+
+        # 清理没有元数据的数据文件（旧版本先移入数据文件再写元数据）
+        for data_path in self.cache_dir.glob('*.bin'):
+            if not self._meta_path(data_path.stem).exists():
+                try:
+                    data_path.unlink()
+                except OSError:
+                    pass
+
+        # 清理中断的下载
+        for tmp_path in self.cache_dir.glob('.tmp-*'):
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+    def _remove_files(self, key: str):
+        for path in (self._data_path(key), self._meta_path(key)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """淘汰最久未访问的文件直到总大小不超过上限（调用方持有锁）"""
+        while self._total_bytes > self.max_bytes and self._index:
+            key, meta = self._index.popitem(last=False)
+            self._total_bytes -= meta['size']
+            self._remove_files(key)
+            self._stats['evictions'] += 1
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """命中时返回元数据并更新访问顺序；文件已不存在时移除索引"""
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                return None
+            data_path = self._data_path(key)
+            try:
+                accessed_at = data_path.stat().st_mtime
+            except FileNotFoundError:
+                # 已被共享同一目录的其他进程淘汰
+                del self._index[key]
+                self._total_bytes -= meta['size']
+                return None
+            self._index.move_to_end(key)
+
+        if time.time() - accessed_at > TOUCH_INTERVAL_SECONDS:
+            try:
+                os.utime(data_path)
+            except OSError:
+                pass
+        return meta
+
+    def _fetch(self, key: str, url: str) -> Dict[str, Any]:
+        """从上游下载到临时文件，计算ETag后原子地移入缓存"""
+        meta = self._lookup(key)
+        if meta is not None:
+            return meta
+
+        tmp_path = self.cache_dir / f".tmp-{uuid.uuid4().hex}"
+        digest = hashlib.sha1()
+        size = 0
+        try:
+            with timed(EXTERNAL_REQUEST_SECONDS, 'cloudinary_fetch'), \
+                    self.session.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', 'image/jpeg').split(';')[0].strip()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            raise ImageTooLargeError(f"图片超过缓存上限 {self.max_file_bytes} bytes: {url}")
+                        digest.update(chunk)
+                        f.write(chunk)
+
+            meta = {
+                'url': url,
+                'size': size,
+                'etag': digest.hexdigest(),
+                'content_type': content_type,
+                'fetched_at': time.time()
+            }
+            # 先写元数据再移入数据文件：中断时只会留下没有数据文件的元数据，重建索引时清理
+            self._meta_path(key).write_text(json.dumps(meta))
+            os.replace(tmp_path, self._data_path(key))
+        except Exception:
+            with self._lock:
+                self._stats['fetch_errors'] += 1
+            try:
+                tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous['size']
+            self._index[key] = meta
+            self._total_bytes += size
+            self._stats['bytes_fetched'] += size
+            self._evict()
+
+        logger.info(f"📥 图片已缓存: {key} ({size / 1024:.0f}KB)")
+        return meta
+
+    def get(self, image_id: int, url: str) -> Dict[str, Any]:
+        """
+        获取缓存的图片（未命中时下载）
+
+        Returns:
+            元数据字典: path, size, etag, content_type, last_modified,
+            cache_status ('hit' / 'miss' / 'shared'：并发未命中共享同一次下载)
+            返回的文件在打开前可能被淘汰，调用方打开时遇到FileNotFoundError应重新调用get（会重新下载）
+        Raises:
+            requests.RequestException: 上游获取失败
+            ImageTooLargeError: 图片超过单个文件的缓存上限
+        """
+        key = self.make_key(image_id, url)
+        meta = self._lookup(key)
+        with self._lock:
+            self._stats['hits' if meta is not None else 'misses'] += 1
+
+        cache_status = 'hit'
+        if meta is None:
+            meta, shared = get_single_flight('image_cache').do(key, self._fetch, key, url)
+            cache_status = 'shared' if shared else 'miss'
+
+        return {
+            **meta,
+            'path': str(self._data_path(key)),
+            'last_modified': datetime.fromtimestamp(meta['fetched_at']),
+            'cache_status': cache_status
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中率、占用空间等统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['files'] = len(self._index)
+            stats['size_bytes'] = self._total_bytes
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['max_bytes'] = self.max_bytes
+        stats['cache_dir'] = str(self.cache_dir)
+        return stats
+
+
+# 单例实例
+_http_session = None
+_http_session_lock = threading.Lock()
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    获取图片获取使用的HTTP会话单例（连接池复用，连接错误和5xx自动重试）
+
+    配置项:
+        IMAGE_FETCH_POOL_SIZE
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                pool_size = int(os.getenv('IMAGE_FETCH_POOL_SIZE', 16))
+                retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                              allowed_methods=frozenset(['GET', 'HEAD']))
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+
+def image_cache_enabled() -> bool:
+    """是否启用图片下载缓存（IMAGE_CACHE_ENABLED，默认启用）"""
+    return os.getenv('IMAGE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_image_cache() -> ImageDiskCache:
+    """
+    获取图片下载缓存单例
+
+    配置项:
+        IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB, IMAGE_CACHE_MAX_FILE_MB, IMAGE_FETCH_TIMEOUT
+    """
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageDiskCache(
+                    cache_dir=os.getenv('IMAGE_CACHE_DIR', os.path.expanduser('~/.cache/obscura/images')),
+                    max_bytes=int(float(os.getenv('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024),
+                    max_file_bytes=int(float(os.getenv('IMAGE_CACHE_MAX_FILE_MB', 25)) * 1024 * 1024),
+                    timeout=float(os.getenv('IMAGE_FETCH_TIMEOUT', 30))
+                )
+    return _image_cache
+
+
+def get_image_cache_stats() -> Dict[str, Any]:
+    """获取图片下载缓存统计（未创建时返回initialized=False）"""
+    if _image_cache is None:
+        return {'enabled': image_cache_enabled(), 'initialized': False}
+
+    stats = _image_cache.get_stats()
+    stats['enabled'] = image_cache_enabled()
+    stats['initialized'] = True
+    return stats
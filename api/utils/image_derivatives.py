@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image Derivatives - 上传时生成多尺寸缩略图（WebP / JPEG）
+
+图库网格原来为每个格子下载完整尺寸的原图。上传后由后台任务:
+1. 读取原图，在独立的工作进程中用Pillow生成small / medium / large三种尺寸的WebP和JPEG
+   （CPU密集的缩放和编码不占用Web进程的GIL）。工作进程以 python -m api.utils.image_derivatives
+   启动，只导入本模块，不会像spawn进程池那样重新执行 app.py（create_app、任务线程、预热）
+2. 由调用方提供的存储函数保存每个版本（生产环境与原图一起保存在Cloudinary）
+3. 版本URL记录在images.derivatives（JSONB），thumbnail_url更新为small JPEG
+
+图库和导航接口按客户端的size/width参数和Accept头选择合适的版本。
+"""
+
+import io
+import os
+import sys
+import pickle
+import logging
+import threading
+import subprocess
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 各尺寸的最长边（像素）
+DERIVATIVE_SIZES = {'small': 320, 'medium': 768, 'large': 1600}
+
+DERIVATIVE_FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+DERIVATIVE_QUALITY = {'webp': 80, 'jpeg': 85}
+
+# 客户端可以请求的尺寸（original表示原图）
+CLIENT_SIZES = tuple(DERIVATIVE_SIZES) + ('original',)
+
+
+def render_derivatives(data: bytes, sizes: Dict[str, int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    生成各尺寸、各格式的图片版本（在工作进程中执行）
+
+    不放大小于目标尺寸的原图；JPEG版本把透明背景合成到白色上。
+
+    Returns:
+        {尺寸: {'width', 'height', 'webp': bytes, 'jpeg': bytes}}
+    """
+    from PIL import Image, ImageOps
+
+    sizes = sizes or DERIVATIVE_SIZES
+    with Image.open(io.BytesIO(data)) as source:
+        source.seek(0)  # 动图只取第一帧
+        image = ImageOps.exif_transpose(source)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    renditions = {}
+    for name, max_edge in sorted(sizes.items(), key=lambda item: -item[1]):
+        rendition = image.copy()
+        rendition.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        webp = io.BytesIO()
+        rendition.save(webp, 'WEBP', quality=DERIVATIVE_QUALITY['webp'], method=4)
+
+        if has_alpha:
+            background = Image.new('RGB', rendition.size, (255, 255, 255))
+            background.paste(rendition, mask=rendition.getchannel('A'))
+            rendition = background
+        jpeg = io.BytesIO()
+        rendition.save(jpeg, 'JPEG', quality=DERIVATIVE_QUALITY['jpeg'], optimize=True, progressive=True)
+
+        renditions[name] = {
+            'width': rendition.width,
+            'height': rendition.height,
+            'webp': webp.getvalue(),
+            'jpeg': jpeg.getvalue()
+        }
+        # 下一个更小的尺寸从当前版本缩放，减少计算量
+        image = rendition if not has_alpha else image
+
+    return renditions
+
+
+def create_derivatives(data: bytes, store: Callable[[str, str, bytes, str], str],
+                       timeout: float = 120.0) -> Dict[str, Dict[str, Any]]:
+    """
+    生成并保存图片的所有版本
+
+    Args:
+        data: 原图字节
+        store: store(尺寸, 格式, 字节, content_type) → URL
+        timeout: 工作进程渲染超时（秒）
+
+    Raises:
+        RuntimeError: 工作进程失败
+        subprocess.TimeoutExpired: 渲染超时
+
+    Returns:
+        记录到images.derivatives的字典: {尺寸: {'width', 'height', 'webp': url, 'jpeg': url}}
+    """
+    renditions = render_in_worker(data, timeout=timeout)
+
+    derivatives = {}
+    for name, rendition in renditions.items():
+        entry = {'width': rendition['width'], 'height': rendition['height']}
+        for fmt, content_type in DERIVATIVE_FORMATS.items():
+            entry[fmt] = store(name, fmt, rendition[fmt], content_type)
+        derivatives[name] = entry
+
+    sizes = ', '.join(f"{name}={len(r['webp']) // 1024}KB/{len(r['jpeg']) // 1024}KB" for name, r in renditions.items())
+    logger.info(f"🖼️ 图片版本已生成: {sizes} (原图{len(data) // 1024}KB)")
+    return derivatives
+
+
+def select_rendition(derivatives: Optional[Dict[str, Any]], size: str = 'small',
+                     prefer_webp: bool = False, width: int = None) -> Optional[str]:
+    """
+    为客户端选择合适的图片版本URL
+
+    Args:
+        derivatives: images.derivatives
+        size: small / medium / large / original
+        prefer_webp: 客户端支持WebP
+        width: 客户端显示宽度（像素），指定时选择最长边不小于该宽度的最小版本
+
+    Returns:
+        版本URL；没有版本、请求原图或没有不小于width的版本时返回None（调用方使用原图URL）
+    """
+    if not derivatives or size == 'original':
+        return None
+
+    if width:
+        candidates = [name for name, max_edge in sorted(DERIVATIVE_SIZES.items(), key=lambda item: item[1])
+                      if max_edge >= width and name in derivatives]
+        if not candidates:
+            return None
+        size = candidates[0]
+
+    entry = derivatives.get(size)
+    if not entry:
+        return None
+    return entry.get('webp' if prefer_webp else 'jpeg') or entry.get('jpeg')
+
+
+def client_image_preferences(args, accept_header: str, default_size: str = 'small'):
+    """
+    解析客户端的图片偏好: size / width查询参数和Accept头
+
+    Returns:
+        (size, prefer_webp, width)
+    Raises:
+        ValueError: 参数无效
+    """
+    size = args.get('size', default_size).lower()
+    if size not in CLIENT_SIZES:
+        raise ValueError(f"size must be one of: {', '.join(CLIENT_SIZES)}")
+
+    width = args.get('width')
+    if width is not None:
+        try:
+            width = max(1, int(width))
+        except ValueError:
+            raise ValueError("width must be an integer")
+
+    image_format = args.get('format', '').lower()
+    prefer_webp = image_format == 'webp' or (image_format != 'jpeg' and 'image/webp' in (accept_header or ''))
+    return size, prefer_webp, width
+
+
+_derivatives_column_checked = False
+
+
+def ensure_derivatives_column(cur):
+    """确保images.derivatives列存在（每个进程只检查一次）"""
+    global _derivatives_column_checked
+    if _derivatives_column_checked:
+        return
+    try:
+        cur.execute("ALTER TABLE images ADD COLUMN IF NOT EXISTS derivatives JSONB")
+        cur.connection.commit()
+    except Exception as e:
+        cur.connection.rollback()
+        logger.warning(f"⚠️ Could not ensure images.derivatives column: {e}")
+    _derivatives_column_checked = True
+
+
+def render_in_worker(data: bytes, timeout: float = 120.0) -> Dict[str, Dict[str, Any]]:
+    """
+    在独立的工作进程中执行render_derivatives（原图从stdin传入，结果以pickle从stdout返回）
+
+    Raises:
+        RuntimeError: 工作进程非零退出
+        subprocess.TimeoutExpired: 渲染超时（工作进程会被终止）
+    """
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [project_root, os.environ.get('PYTHONPATH')])))
+    with get_worker_slots():
+        completed = subprocess.run(
+            [sys.executable, '-m', 'api.utils.image_derivatives'],
+            input=data, capture_output=True, timeout=timeout, cwd=project_root, env=env
+        )
+    if completed.returncode != 0:
+        error = (completed.stderr.decode('utf-8', 'replace').strip().splitlines() or ['worker failed'])[-1]
+        raise RuntimeError(f"Image derivative worker failed: {error}")
+    return pickle.loads(completed.stdout)
+
+
+# 单例实例
+_worker_slots = None
+_worker_slots_lock = threading.Lock()
+
+
+def get_worker_slots() -> threading.BoundedSemaphore:
+    """
+    获取限制同时运行的渲染工作进程数量的信号量单例
+
+    配置项:
+        IMAGE_DERIVATIVE_WORKERS
+    """
+    global _worker_slots
+    if _worker_slots is None:
+        with _worker_slots_lock:
+            if _worker_slots is None:
+                workers = max(1, int(os.getenv('IMAGE_DERIVATIVE_WORKERS', 1)))
+                _worker_slots = threading.BoundedSemaphore(workers)
+                logger.info(f"✅ 图片渲染工作进程上限: {workers}个")
+    return _worker_slots
+
+
+def _worker_main():
+    """工作进程入口: 从stdin读取原图，把各版本以pickle写到stdout"""
+    renditions = render_derivatives(sys.stdin.buffer.read())
+    sys.stdout.buffer.write(pickle.dumps(renditions, protocol=pickle.HIGHEST_PROTOCOL))
+    sys.stdout.buffer.flush()
+
+
+if __name__ == '__main__':
+    _worker_main()
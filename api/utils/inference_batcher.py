@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inference Micro-Batcher - 混合模型推理微批处理调度器
+
+并发请求各自在调用线程中准备特征，然后把66维特征向量提交到调度队列；
+后台线程在时间窗口内（或达到最大批量时）收集请求，执行一次批量RF+LSTM前向计算，
+再把结果分发回各个等待的请求。
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 批量大小直方图的分桶上界
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _PendingRequest:
+    """等待批量推理结果的单个请求"""
+
+    __slots__ = ('features', 'enqueued_at', 'done', 'scores', 'error')
+
+    def __init__(self, features: np.ndarray):
+        self.features = features
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.scores = None
+        self.error = None
+
+
+class MicroBatchDispatcher:
+    """对HybridSHAPModelWrapper.predict_features_batch的微批处理调度器"""
+
+    def __init__(self, model, window_ms: float = 5.0, max_batch_size: int = 64,
+                 request_timeout: float = 30.0):
+        """
+        初始化调度器
+
+        Args:
+            model: 提供predict_features_batch()的混合模型包装器
+            window_ms: 收集请求的时间窗口（毫秒）
+            max_batch_size: 单次前向计算的最大批量
+            request_timeout: 请求等待结果的最长时间（秒）
+        """
+        self.model = model
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.request_timeout = request_timeout
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        # 监控统计
+        self._stats_lock = threading.Lock()
+        self._requests_total = 0
+        self._batches_total = 0
+        self._errors_total = 0
+        self._batch_size_histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._queue_latencies = deque(maxlen=1000)
+        self._inference_times = deque(maxlen=1000)
+
+        logger.info(f"MicroBatchDispatcher初始化完成: window={window_ms}ms, max_batch={max_batch_size}")
+
+    def _ensure_worker(self):
+        """首次提交时启动后台线程（兼容多进程服务器fork之后再启动）"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='shap-micro-batcher', daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self):
+        """阻塞等待第一个请求，然后在时间窗口内尽量收集更多请求"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_seconds
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        """后台线程主循环"""
+        while True:
+            batch = self._collect_batch()
+            started_at = time.monotonic()
+
+            try:
+                features_matrix = np.vstack([request.features for request in batch])
+                scores = self.model.predict_features_batch(features_matrix)
+                for row, request in enumerate(batch):
+                    request.scores = {dimension: values[row:row + 1] for dimension, values in scores.items()}
+            except Exception as e:
+                logger.error(f"❌ 微批推理失败 (batch={len(batch)}): {e}")
+                for request in batch:
+                    request.error = e
+                with self._stats_lock:
+                    self._errors_total += 1
+
+            inference_time = time.monotonic() - started_at
+            self._record_batch(batch, started_at, inference_time)
+
+            for request in batch:
+                request.done.set()
+
+    def _record_batch(self, batch, started_at: float, inference_time: float):
+        """记录批量大小和排队延迟"""
+        size = len(batch)
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), BATCH_SIZE_BUCKETS[-1])
+        with self._stats_lock:
+            self._batches_total += 1
+            self._requests_total += size
+            self._batch_size_histogram[bucket] += 1
+            self._inference_times.append(inference_time)
+            for request in batch:
+                self._queue_latencies.append(started_at - request.enqueued_at)
+
+    def submit(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        提交一个66维特征向量并等待批量推理结果
+
+        Returns:
+            {维度: 长度为1的得分数组}，与predict_features_batch的单行结果一致
+        """
+        self._ensure_worker()
+        request = _PendingRequest(np.asarray(features, dtype=float).reshape(1, -1))
+        self._queue.put(request)
+
+        if not request.done.wait(self.request_timeout):
+            raise TimeoutError(f"微批推理等待超时 ({self.request_timeout}s)")
+        if request.error is not None:
+            raise request.error
+        return request.scores
+
+    def predict(self, latitude: float, longitude: float, month: Optional[int] = None) -> Dict[str, Any]:
+        """
+        单点预测（经由微批处理）
+
+        返回结构与HybridSHAPModelWrapper.predict_environmental_scores一致
+        """
+        model = self.model
+        location = {'latitude': latitude, 'longitude': longitude, 'month': month}
+
+        try:
+            latitude, longitude, month = model._normalize_location(location, None)
+            # 瓦片覆盖的位置直接插值，不进入推理队列
+            tile_result = model._predict_from_tiles(latitude, longitude, month)
+            if tile_result is not None:
+                return tile_result
+            # 特征准备涉及网络请求，在调用线程中完成，不占用推理线程
+            features = model._prepare_features(latitude, longitude, month)
+            scores = self.submit(features)
+            economic_score = model._calculate_economic_score(latitude, longitude, month)
+            result = model._build_result(latitude, longitude, month, scores, 0, economic_score)
+            result['prediction_source'] = 'live'
+            return result
+        except Exception as e:
+            logger.error(f"❌ 微批预测失败: {e}")
+            return model._failed_result(location, e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度器监控数据"""
+        with self._stats_lock:
+            latencies = np.array(self._queue_latencies) if self._queue_latencies else np.zeros(1)
+            inference_times = np.array(self._inference_times) if self._inference_times else np.zeros(1)
+            batches = self._batches_total
+
+            return {
+                'window_ms': self.window_seconds * 1000.0,
+                'max_batch_size': self.max_batch_size,
+                'queue_depth': self._queue.qsize(),
+                'worker_alive': self._worker is not None and self._worker.is_alive(),
+                'requests_total': self._requests_total,
+                'batches_total': batches,
+                'errors_total': self._errors_total,
+                'avg_batch_size': self._requests_total / batches if batches else 0.0,
+                'batch_size_histogram': {f"le_{bucket}": count for bucket, count in self._batch_size_histogram.items()},
+                'queue_latency_ms': {
+                    'avg': float(latencies.mean() * 1000),
+                    'p50': float(np.percentile(latencies, 50) * 1000),
+                    'p95': float(np.percentile(latencies, 95) * 1000),
+                    'max': float(latencies.max() * 1000)
+                },
+                'inference_time_ms': {
+                    'avg': float(inference_times.mean() * 1000),
+                    'max': float(inference_times.max() * 1000)
+                }
+            }
+
+
+# 单例实例
+_dispatcher_instance = None
+_dispatcher_lock = threading.Lock()
+
+
+def micro_batching_enabled() -> bool:
+    """是否启用微批处理（SHAP_MICRO_BATCH_ENABLED，默认启用）"""
+    return os.getenv('SHAP_MICRO_BATCH_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_micro_batch_dispatcher(model) -> MicroBatchDispatcher:
+    """
+    获取微批处理调度器单例
+
+    配置项:
+        SHAP_MICRO_BATCH_WINDOW_MS, SHAP_MICRO_BATCH_MAX_SIZE, SHAP_MICRO_BATCH_TIMEOUT
+    """
+    global _dispatcher_instance
+    if _dispatcher_instance is None:
+        with _dispatcher_lock:
+            if _dispatcher_instance is None:
+                _dispatcher_instance = MicroBatchDispatcher(
+                    model,
+                    window_ms=float(os.getenv('SHAP_MICRO_BATCH_WINDOW_MS', 5)),
+                    max_batch_size=int(os.getenv('SHAP_MICRO_BATCH_MAX_SIZE', 64)),
+                    request_timeout=float(os.getenv('SHAP_MICRO_BATCH_TIMEOUT', 30))
+                )
+    return _dispatcher_instance
+
+
+def get_micro_batch_stats() -> Dict[str, Any]:
+    """获取调度器统计（未创建时返回enabled=False）"""
+    if _dispatcher_instance is None:
+        return {'enabled': micro_batching_enabled(), 'initialized': False}
+
+    stats = _dispatcher_instance.get_stats()
+    stats['enabled'] = micro_batching_enabled()
+    stats['initialized'] = True
+    return stats
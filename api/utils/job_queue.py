@@ -0,0 +1,577 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Job Queue - 持久化的后台任务队列
+
+上传后的SHAP分析和故事生成不再由每个请求各自启动线程，而是写入analysis_jobs表：
+- 存储: PostgreSQL（FOR UPDATE SKIP LOCKED认领任务）；未配置数据库时使用本地SQLite
+- 去重: 同一dedup_key（例如同一张图片）同时只有一个排队中/运行中的任务
+- 重试: 失败后按指数退避重新排队，超过最大尝试次数标记为failed
+- 租约: 运行中的任务超过租约时间（工作进程重启或任务卡死）会被重新排队
+- 计时: 记录排队等待时间、每次尝试的运行时间和总耗时
+- 执行: 固定大小的工作线程池，与请求线程分开调节
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from api.utils.db_pool import get_db_connection, POSTGRESQL_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+# 排队中/运行中的任务参与去重
+ACTIVE_STATUSES = ('queued', 'running')
+
+JOB_COLUMNS = ('id', 'job_type', 'dedup_key', 'payload', 'status', 'attempts', 'max_attempts',
+               'run_after', 'locked_by', 'locked_at', 'result', 'last_error', 'timings',
+               'created_at', 'started_at', 'finished_at', 'updated_at')
+
+
+class JobQueue:
+    """analysis_jobs表上的任务队列（PostgreSQL或SQLite）"""
+
+    def __init__(self, backend: str = 'postgres', sqlite_path: str = None, max_attempts: int = 3,
+                 retry_base_seconds: float = 5.0, retry_max_seconds: float = 300.0,
+                 lease_seconds: float = 600.0):
+        """
+        初始化任务队列
+
+        Args:
+            backend: 'postgres' 或 'sqlite'
+            sqlite_path: SQLite数据库文件路径（backend为sqlite时使用）
+            max_attempts: 默认最大尝试次数
+            retry_base_seconds: 重试退避基数（第n次失败后等待 base × 2^(n-1) 秒）
+            retry_max_seconds: 重试退避上限
+            lease_seconds: 运行中任务的租约时间，超过后视为工作线程丢失并重新排队
+        """
+        if backend not in ('postgres', 'sqlite'):
+            raise ValueError(f"不支持的任务队列存储: {backend}")
+
+        self.backend = backend
+        self.sqlite_path = sqlite_path
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lease_seconds = lease_seconds
+
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+        if backend == 'sqlite':
+            Path(sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+
+        logger.info(f"JobQueue初始化完成: backend={backend}, max_attempts={max_attempts}, lease={lease_seconds}s")
+
+    # ------------------------------------------------------------------
+    # 存储
+
+    @contextmanager
+    def _connect(self):
+        """借用连接（PostgreSQL使用连接池，SQLite每个线程一个连接）"""
+        if self.backend == 'postgres':
+            with get_db_connection() as conn:
+                yield conn
+            return
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.sqlite_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _sql(self, sql: str) -> str:
+        """PostgreSQL占位符转换为SQLite占位符"""
+        return sql if self.backend == 'postgres' else sql.replace('%s', '?')
+
+    def _timestamp(self, value: datetime):
+        """PostgreSQL直接保存datetime，SQLite保存ISO字符串（字典序即时间序）"""
+        return value if self.backend == 'postgres' else value.isoformat()
+
+    def _json(self, value) -> Optional[str]:
+        return json.dumps(value) if value is not None else None
+
+    def _execute(self, sql: str, params: Tuple = ()):
+        """执行单条语句并提交，返回所有结果行"""
+        self._ensure_schema()
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(sql), params)
+            rows = cur.fetchall() if cur.description else []
+            conn.commit()
+            cur.close()
+        return rows
+
+    def _ensure_schema(self):
+        """创建analysis_jobs表和索引（每个进程只执行一次）"""
+        if self._schema_ready:
+            return
+
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+
+            if self.backend == 'postgres':
+                id_column, json_type, time_type = 'SERIAL PRIMARY KEY', 'JSONB', 'TIMESTAMP'
+            else:
+                id_column, json_type, time_type = 'INTEGER PRIMARY KEY AUTOINCREMENT', 'TEXT', 'TEXT'
+
+            statements = [
+                f"""
+                CREATE TABLE IF NOT EXISTS analysis_jobs (
+                    id {id_column},
+                    job_type TEXT NOT NULL,
+                    dedup_key TEXT,
+                    payload {json_type} NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    run_after {time_type} NOT NULL,
+                    locked_by TEXT,
+                    locked_at {time_type},
+                    result {json_type},
+                    last_error TEXT,
+                    timings {json_type},
+                    created_at {time_type} NOT NULL,
+                    started_at {time_type},
+                    finished_at {time_type},
+                    updated_at {time_type} NOT NULL
+                )
+                """,
+                # 部分唯一索引: 同一dedup_key同时只有一个活动任务
+                """
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_analysis_jobs_active_dedup
+                ON analysis_jobs (dedup_key) WHERE status IN ('queued', 'running')
+                """,
+                """
+                CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status_run_after
+                ON analysis_jobs (status, run_after)
+                """
+            ]
+
+            with self._connect() as conn:
+                cur = conn.cursor()
+                for statement in statements:
+                    cur.execute(statement)
+                conn.commit()
+                cur.close()
+
+            self._schema_ready = True
+            logger.info(f"✅ analysis_jobs表已就绪 ({self.backend})")
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        """结果行转换为任务字典（JSON字段解析，时间转换为ISO字符串）"""
+        job = dict(zip(JOB_COLUMNS, row))
+        for field in ('payload', 'result', 'timings'):
+            if isinstance(job[field], str):
+                job[field] = json.loads(job[field])
+        for field in ('run_after', 'locked_at', 'created_at', 'started_at', 'finished_at', 'updated_at'):
+            if isinstance(job[field], datetime):
+                job[field] = job[field].isoformat()
+        return job
+
+    # ------------------------------------------------------------------
+    # 队列操作
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any], dedup_key: str = None,
+                max_attempts: int = None) -> Tuple[int, bool]:
+        """
+        提交任务
+
+        Returns:
+            (任务ID, 是否新建)；同一dedup_key已有排队中/运行中的任务时返回该任务
+        """
+        now = datetime.now()
+        for _ in range(2):
+            rows = self._execute("""
+                INSERT INTO analysis_jobs (job_type, dedup_key, payload, status, max_attempts,
+                                           run_after, timings, created_at, updated_at)
+                VALUES (%s, %s, %s, 'queued', %s, %s, %s, %s, %s)
+                ON CONFLICT (dedup_key) WHERE status IN ('queued', 'running') DO NOTHING
+                RETURNING id
+            """, (job_type, dedup_key, json.dumps(payload), max_attempts or self.max_attempts,
+                  self._timestamp(now), json.dumps({'attempts': []}), self._timestamp(now), self._timestamp(now)))
+            if rows:
+                logger.info(f"📥 任务已提交: #{rows[0][0]} {job_type} ({dedup_key or '无去重键'})")
+                return rows[0][0], True
+
+            rows = self._execute("""
+                SELECT id FROM analysis_jobs
+                WHERE dedup_key = %s AND status IN ('queued', 'running')
+                ORDER BY id DESC LIMIT 1
+            """, (dedup_key,))
+            if rows:
+                logger.info(f"🔁 任务去重: {dedup_key} 已有活动任务 #{rows[0][0]}")
+                return rows[0][0], False
+            # 活动任务恰好在两次查询之间结束，重新提交
+
+        raise RuntimeError(f"任务提交失败: {job_type} ({dedup_key})")
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """认领一个到期的排队任务（标记为running并增加尝试次数），没有时返回None"""
+        now = self._timestamp(datetime.now())
+        skip_locked = 'FOR UPDATE SKIP LOCKED' if self.backend == 'postgres' else ''
+        rows = self._execute(f"""
+            UPDATE analysis_jobs
+            SET status = 'running', attempts = attempts + 1, locked_by = %s, locked_at = %s,
+                started_at = COALESCE(started_at, %s), updated_at = %s
+            WHERE id = (
+                SELECT id FROM analysis_jobs
+                WHERE status = 'queued' AND run_after <= %s
+                ORDER BY run_after, id
+                LIMIT 1
+                {skip_locked}
+            )
+            RETURNING {', '.join(JOB_COLUMNS)}
+        """, (worker_id, now, now, now, now))
+        return self._row_to_job(rows[0]) if rows else None
+
+    def _record_attempt(self, job: Dict[str, Any], run_seconds: float, error: str = None) -> Dict[str, Any]:
+        """在任务计时中追加一次尝试"""
+        timings = dict(job.get('timings') or {})
+        attempts = list(timings.get('attempts', []))
+        attempts.append({'attempt': job['attempts'], 'run_seconds': round(run_seconds, 3), 'error': error})
+        timings['attempts'] = attempts
+        timings['run_seconds_total'] = round(sum(a['run_seconds'] for a in attempts), 3)
+        if 'queue_wait_seconds' not in timings and job.get('started_at'):
+            started_at = datetime.fromisoformat(job['started_at'])
+            timings['queue_wait_seconds'] = round((started_at - datetime.fromisoformat(job['created_at'])).total_seconds(), 3)
+        return timings
+
+    def complete(self, job: Dict[str, Any], result: Dict[str, Any], run_seconds: float) -> bool:
+        """标记任务成功（租约已被其他工作线程接管时返回False）"""
+        now = datetime.now()
+        timings = self._record_attempt(job, run_seconds)
+        timings['total_seconds'] = round((now - datetime.fromisoformat(job['created_at'])).total_seconds(), 3)
+        rows = self._execute("""
+            UPDATE analysis_jobs
+            SET status = 'succeeded', result = %s, timings = %s, locked_by = NULL,
+                finished_at = %s, updated_at = %s
+            WHERE id = %s AND status = 'running' AND locked_by = %s
+            RETURNING id
+        """, (self._json(result), json.dumps(timings), self._timestamp(now), self._timestamp(now),
+              job['id'], job['locked_by']))
+        return bool(rows)
+
+    def renew_lease(self, job: Dict[str, Any]) -> bool:
+        """延长运行中任务的租约（长时间任务定期调用；租约已被接管时返回False）"""
+        now = self._timestamp(datetime.now())
+        rows = self._execute("""
+            UPDATE analysis_jobs
+            SET locked_at = %s, updated_at = %s
+            WHERE id = %s AND status = 'running' AND locked_by = %s
+            RETURNING id
+        """, (now, now, job['id'], job['locked_by']))
+        return bool(rows)
+
+    def retry_delay(self, attempts: int) -> float:
+        """第attempts次失败后的退避时间（带25%随机抖动）"""
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** max(0, attempts - 1)))
+        return delay * (1 + random.uniform(0, 0.25))
+
+    def fail(self, job: Dict[str, Any], error: str, run_seconds: float) -> str:
+        """
+        记录一次失败: 未达到最大尝试次数时按退避时间重新排队，否则标记为failed
+
+        Returns:
+            任务的新状态
+        """
+        now = datetime.now()
+        timings = self._record_attempt(job, run_seconds, error)
+        exhausted = job['attempts'] >= job['max_attempts']
+        status = 'failed' if exhausted else 'queued'
+        run_after = now if exhausted else now + timedelta(seconds=self.retry_delay(job['attempts']))
+        if exhausted:
+            timings['total_seconds'] = round((now - datetime.fromisoformat(job['created_at'])).total_seconds(), 3)
+
+        self._execute("""
+            UPDATE analysis_jobs
+            SET status = %s, last_error = %s, timings = %s, run_after = %s, locked_by = NULL,
+                finished_at = %s, updated_at = %s
+            WHERE id = %s AND status = 'running' AND locked_by = %s
+        """, (status, error[:2000], json.dumps(timings), self._timestamp(run_after),
+              self._timestamp(now) if exhausted else None, self._timestamp(now), job['id'], job['locked_by']))
+        return status
+
+    def requeue_stale(self) -> int:
+        """把租约过期的运行中任务重新排队（或在尝试次数用尽时标记为failed）"""
+        now = datetime.now()
+        expired_before = now - timedelta(seconds=self.lease_seconds)
+        rows = self._execute("""
+            UPDATE analysis_jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                finished_at = CASE WHEN attempts >= max_attempts THEN %s ELSE NULL END,
+                last_error = 'lease expired: worker lost or job exceeded timeout',
+                locked_by = NULL, run_after = %s, updated_at = %s
+            WHERE status = 'running' AND locked_at < %s
+            RETURNING id
+        """, (self._timestamp(now), self._timestamp(now), self._timestamp(now), self._timestamp(expired_before)))
+        if rows:
+            logger.warning(f"⚠️ {len(rows)}个任务租约过期，已重新排队或标记为失败: {[r[0] for r in rows]}")
+        return len(rows)
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """查询任务状态"""
+        rows = self._execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM analysis_jobs WHERE id = %s", (job_id,))
+        return self._row_to_job(rows[0]) if rows else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各状态任务数量和最早的到期排队任务"""
+        rows = self._execute("SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status")
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({status: count for status, count in rows})
+
+        oldest = self._execute("SELECT MIN(created_at) FROM analysis_jobs WHERE status = 'queued'")[0][0]
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+
+        return {
+            'backend': self.backend,
+            'counts': counts,
+            'oldest_queued_age_seconds': (datetime.now() - oldest).total_seconds() if oldest else 0.0,
+            'max_attempts': self.max_attempts,
+            'lease_seconds': self.lease_seconds
+        }
+
+
+# 任务类型 → 处理函数
+_job_handlers: Dict[str, Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = {}
+
+
+# 当前工作线程正在执行的任务（供处理函数续租）
+_current_job = threading.local()
+
+
+def register_job_handler(job_type: str, handler: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]):
+    """注册任务处理函数: handler(payload) → 结果字典；抛出异常表示本次尝试失败"""
+    _job_handlers[job_type] = handler
+
+
+class JobWorkerPool:
+    """固定大小的任务工作线程池"""
+
+    def __init__(self, job_queue: JobQueue, workers: int = 2, poll_interval: float = 2.0):
+        """
+        Args:
+            job_queue: 任务队列
+            workers: 工作线程数（分析吞吐量与请求线程分开调节）
+            poll_interval: 没有到期任务时的轮询间隔（秒）；本进程提交任务会立即唤醒
+        """
+        self.queue = job_queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.worker_prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'processed': 0, 'succeeded': 0, 'retried': 0, 'failed': 0, 'lease_lost': 0, 'busy': 0}
+
+    def start(self):
+        """启动工作线程（重复调用无效）"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, args=(f"{self.worker_prefix}-{i}",),
+                                          name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"✅ 任务工作线程池已启动: {self.workers}个线程")
+
+    def stop(self, timeout: float = 5.0):
+        """停止工作线程（正在执行的任务完成后退出）"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wake(self):
+        """有新任务时唤醒空闲的工作线程"""
+        self._wakeup.set()
+
+    def _sweep_stale(self):
+        """定期回收租约过期的任务（每1/4租约时间最多执行一次）"""
+        with self._lock:
+            if time.monotonic() - self._last_sweep < self.queue.lease_seconds / 4:
+                return
+            self._last_sweep = time.monotonic()
+        self.queue.requeue_stale()
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                self._sweep_stale()
+                job = self.queue.claim(worker_id)
+            except Exception as e:
+                logger.error(f"❌ 任务认领失败: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._execute(job)
+
+    def _execute(self, job: Dict[str, Any]):
+        handler = _job_handlers.get(job['job_type'])
+        with self._lock:
+            self._stats['busy'] += 1
+
+        start_time = time.monotonic()
+        try:
+            if handler is None:
+                raise LookupError(f"未注册的任务类型: {job['job_type']}")
+            _current_job.job = job
+            result = handler(job['payload'])
+            run_seconds = time.monotonic() - start_time
+            if self.queue.complete(job, result, run_seconds):
+                outcome = 'succeeded'
+                logger.info(f"✅ 任务#{job['id']} {job['job_type']}完成: 第{job['attempts']}次尝试, {run_seconds:.2f}s")
+            else:
+                outcome = 'lease_lost'
+                logger.warning(f"⚠️ 任务#{job['id']}执行超过租约时间({run_seconds:.1f}s)，结果未写入")
+        except Exception as e:
+            run_seconds = time.monotonic() - start_time
+            try:
+                status = self.queue.fail(job, f"{type(e).__name__}: {e}", run_seconds)
+            except Exception as db_error:
+                logger.error(f"❌ 任务#{job['id']}失败状态写入失败（租约到期后会重新排队）: {db_error}")
+                status = 'queued'
+            outcome = 'failed' if status == 'failed' else 'retried'
+            logger.warning(f"⚠️ 任务#{job['id']} {job['job_type']}第{job['attempts']}次尝试失败 ({outcome}): {e}")
+        finally:
+            _current_job.job = None
+            with self._lock:
+                self._stats['busy'] -= 1
+
+        with self._lock:
+            self._stats['processed'] += 1
+            self._stats[outcome] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['alive'] = sum(1 for thread in self._threads if thread.is_alive())
+        stats['poll_interval_seconds'] = self.poll_interval
+        return stats
+
+
+# 单例实例
+_job_queue = None
+_job_queue_lock = threading.Lock()
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def job_workers_enabled() -> bool:
+    """本进程是否运行任务工作线程（JOB_WORKERS_ENABLED，默认启用）"""
+    return os.getenv('JOB_WORKERS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_job_queue() -> JobQueue:
+    """
+    获取任务队列单例
+
+    配置项:
+        JOB_QUEUE_BACKEND (auto/postgres/sqlite，auto时有DATABASE_URL则使用PostgreSQL),
+        JOB_QUEUE_SQLITE_PATH, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS,
+        JOB_RETRY_MAX_SECONDS, JOB_LEASE_SECONDS
+    """
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                backend = os.getenv('JOB_QUEUE_BACKEND', 'auto').lower()
+                if backend == 'auto':
+                    backend = 'postgres' if os.getenv('DATABASE_URL') and POSTGRESQL_AVAILABLE else 'sqlite'
+                _job_queue = JobQueue(
+                    backend=backend,
+                    sqlite_path=os.getenv('JOB_QUEUE_SQLITE_PATH',
+                                          os.path.expanduser('~/.cache/obscura/jobs.sqlite')),
+                    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 3)),
+                    retry_base_seconds=float(os.getenv('JOB_RETRY_BASE_SECONDS', 5)),
+                    retry_max_seconds=float(os.getenv('JOB_RETRY_MAX_SECONDS', 300)),
+                    lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', 600))
+                )
+    return _job_queue
+
+
+def get_job_worker_pool() -> JobWorkerPool:
+    """
+    获取任务工作线程池单例
+
+    配置项:
+        JOB_WORKERS, JOB_POLL_INTERVAL
+    """
+    global _worker_pool
+    if _worker_pool is None:
+        with _worker_pool_lock:
+            if _worker_pool is None:
+                _worker_pool = JobWorkerPool(
+                    get_job_queue(),
+                    workers=int(os.getenv('JOB_WORKERS', 2)),
+                    poll_interval=float(os.getenv('JOB_POLL_INTERVAL', 2.0))
+                )
+    return _worker_pool
+
+
+def start_job_workers() -> Optional[JobWorkerPool]:
+    """启动本进程的任务工作线程（未启用时返回None）"""
+    if not job_workers_enabled():
+        logger.info("ℹ️ 本进程未启用任务工作线程 (JOB_WORKERS_ENABLED=false)")
+        return None
+    pool = get_job_worker_pool()
+    pool.start()
+    return pool
+
+
+def enqueue_job(job_type: str, payload: Dict[str, Any], dedup_key: str = None) -> Tuple[int, bool]:
+    """提交任务并唤醒本进程的工作线程"""
+    job_id, created = get_job_queue().enqueue(job_type, payload, dedup_key=dedup_key)
+    pool = start_job_workers()
+    if pool is not None:
+        pool.wake()
+    return job_id, created
+
+
+def heartbeat_job() -> bool:
+    """
+    在任务处理函数中续租当前任务
+
+    Returns:
+        租约是否仍属于本工作线程；不在任务中调用时返回True。
+        返回False时任务已被重新排队，处理函数应停止执行。
+    """
+    job = getattr(_current_job, 'job', None)
+    if job is None:
+        return True
+    return get_job_queue().renew_lease(job)
+
+
+def get_job_stats() -> Dict[str, Any]:
+    """任务队列和工作线程池统计"""
+    stats = get_job_queue().get_stats()
+    stats['workers'] = _worker_pool.get_stats() if _worker_pool is not None else {'started': False}
+    return stats
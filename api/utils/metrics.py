@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metrics - 进程内延迟直方图与Prometheus文本格式导出
+
+- 每个直方图按标签组合维护固定桶的计数、总和和次数（observe只做一次二分查找和一次加锁累加）
+- HTTP请求按 blueprint / endpoint / method / status 记录（endpoint为路由名，不是URL，避免标签爆炸）
+- 数据库语句、数据库连接借出、模型前向计算、外部HTTP调用（Cloudinary、DeepSeek、Open-Meteo）、
+  故事生成和SocketIO事件推送分别有各自的直方图
+- /metrics 以Prometheus文本格式导出（p95/p99由Prometheus的histogram_quantile计算）；
+  /metrics?format=json 返回按桶估算的p50/p95/p99，便于直接查看
+- METRICS_ENABLED=false 时timed()返回共享的空上下文管理器，请求钩子不注册，几乎没有开销
+
+多进程部署时每个进程各自统计。
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Any, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的默认桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+_NOOP = nullcontext()
+
+
+def metrics_enabled() -> bool:
+    """是否启用指标采集（METRICS_ENABLED，默认启用）"""
+    return _enabled
+
+
+def set_metrics_enabled(enabled: bool):
+    """运行时开关指标采集（用于基准测试；已注册的请求钩子在禁用时直接返回）"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+class Histogram:
+    """线程安全的带标签直方图"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值元组 → [各桶计数..., +Inf桶计数, 总和]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        """记录一次观测值（标签值按labelnames顺序传入）"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def quantile(self, q: float, series: List[float]) -> float:
+        """按桶线性插值估算分位数（与Prometheus的histogram_quantile相同的近似）"""
+        counts = series[:-1]
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'start_time')
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+        self.start_time = 0.0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labelvalues = self.labelvalues
+        if len(labelvalues) < len(self.histogram.labelnames) and self.histogram.labelnames[-1] == 'outcome':
+            labelvalues = labelvalues + ('error' if exc_type else 'ok',)
+        self.histogram.observe(time.perf_counter() - self.start_time, *labelvalues)
+        return False
+
+
+# 已注册的直方图
+_registry: Dict[str, Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """获取或注册直方图（参数只在首次注册时生效）"""
+    instance = _registry.get(name)
+    if instance is None:
+        with _registry_lock:
+            instance = _registry.get(name)
+            if instance is None:
+                instance = _registry[name] = Histogram(name, documentation, labelnames, buckets)
+    return instance
+
+
+def timed(instance: Histogram, *labelvalues):
+    """
+    with timed(HISTOGRAM, 'label', ...): 计时；禁用时返回空上下文管理器
+
+    直方图最后一个标签为outcome且未传入时，按是否抛出异常自动填入ok/error。
+    """
+    if not _enabled:
+        return _NOOP
+    return _Timer(instance, labelvalues)
+
+
+def observe(instance: Histogram, seconds: float, *labelvalues):
+    """记录已测得的耗时（禁用时不记录）"""
+    if _enabled:
+        instance.observe(seconds, *labelvalues)
+
+
+HTTP_REQUEST_SECONDS = histogram(
+    'http_request_duration_seconds', 'HTTP request latency by blueprint, endpoint, method and status',
+    ('blueprint', 'endpoint', 'method', 'status'))
+DB_QUERY_SECONDS = histogram(
+    'db_query_duration_seconds', 'Database statement execution time by statement type', ('statement',))
+DB_CHECKOUT_SECONDS = histogram(
+    'db_pool_checkout_seconds', 'Time spent waiting for a pooled database connection')
+MODEL_FORWARD_SECONDS = histogram(
+    'model_forward_duration_seconds', 'Model forward pass time per batch', ('model', 'dimension'))
+EXTERNAL_REQUEST_SECONDS = histogram(
+    'external_request_duration_seconds', 'Outbound HTTP call latency by service and outcome', ('service', 'outcome'))
+STORY_GENERATION_SECONDS = histogram(
+    'story_generation_duration_seconds', 'AI story generation time by source', ('source',))
+EVENT_FANOUT_SECONDS = histogram(
+    'event_fanout_duration_seconds', 'SocketIO emit time per coalesced delta by room type', ('room_type',))
+EVENT_DELIVERY_SECONDS = histogram(
+    'event_delivery_lag_seconds', 'Time from first publish to emit of a coalesced delta by room type', ('room_type',))
+EVENT_BATCH_SIZE = histogram(
+    'event_batch_size', 'Image changes per coalesced delta by room type', ('room_type',),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000))
+
+
+def init_request_metrics(app):
+    """为Flask应用注册请求计时钩子（禁用指标时不注册）"""
+    if not _enabled:
+        logger.info("📊 指标采集已禁用 (METRICS_ENABLED=false)")
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start_time = g.pop('_metrics_start', None)
+        if start_time is not None and _enabled:
+            endpoint = request.endpoint or 'unmatched'
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start_time,
+                                         request.blueprint or '', endpoint, request.method,
+                                         str(response.status_code))
+        return response
+
+    logger.info("📊 请求延迟指标已启用: /metrics")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_float(value: float) -> str:
+    return repr(float(value)) if value != int(value) else f"{int(value)}.0"
+
+
+def render_prometheus() -> str:
+    """所有直方图的Prometheus文本格式（version 0.0.4）"""
+    lines = []
+    for instance in list(_registry.values()):
+        lines.append(f"# HELP {instance.name} {instance.documentation}")
+        lines.append(f"# TYPE {instance.name} histogram")
+        for labelvalues, series in sorted(instance.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(instance.buckets, series):
+                cumulative += count
+                labels = _format_labels(instance.labelnames, labelvalues, f'le="{_format_float(bound)}"')
+                lines.append(f"{instance.name}_bucket{labels} {cumulative}")
+            cumulative += series[len(instance.buckets)]
+            labels = _format_labels(instance.labelnames, labelvalues, 'le="+Inf"')
+            lines.append(f"{instance.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(instance.labelnames, labelvalues)
+            lines.append(f"{instance.name}_sum{labels} {series[-1]:.6f}")
+            lines.append(f"{instance.name}_count{labels} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def get_metrics_summary() -> Dict[str, Any]:
+    """每个直方图每组标签的次数、平均值和估算的p50/p95/p99（耗时直方图换算为毫秒）"""
+    summary = {}
+    for instance in list(_registry.values()):
+        scale, suffix = (1000, '_ms') if instance.name.endswith('_seconds') else (1, '')
+        series_summaries = []
+        for labelvalues, series in sorted(instance.snapshot().items()):
+            count = int(sum(series[:-1]))
+            series_summaries.append({
+                'labels': dict(zip(instance.labelnames, labelvalues)),
+                'count': count,
+                f'avg{suffix}': round(series[-1] / count * scale, 3) if count else 0.0,
+                f'p50{suffix}': round(instance.quantile(0.50, series) * scale, 3),
+                f'p95{suffix}': round(instance.quantile(0.95, series) * scale, 3),
+                f'p99{suffix}': round(instance.quantile(0.99, series) * scale, 3)
+            })
+        summary[instance.name] = series_summaries
+    return {'enabled': _enabled, 'histograms': summary}
+
+
+def reset_metrics():
+    """清空所有直方图"""
+    for instance in list(_registry.values()):
+        instance.reset()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Observation Store - 持久化的时空观测数据缓存
+
+API预测、模型训练脚本和测试脚本都会反复请求相同(位置, 日期)的日观测值。
+这里用SQLite按(网格单元, 日期, API族)保存每日变量，每个变量一列：
+- 历史日期的数据不会再变化，永久保存
+- 最近几天的数据（Open-Meteo仍可能修订）带TTL，过期后重新请求
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# 各API族保存的变量（与RealTimeEnvironmentalDataCollector的输出字段一致）
+FAMILY_VARIABLES = {
+    'meteorological': [
+        'temperature', 'humidity', 'wind_speed', 'precipitation',
+        'atmospheric_pressure', 'solar_radiation'
+    ],
+    'geospatial': [
+        'soil_temperature_0_7cm', 'soil_moisture_7_28cm', 'reference_evapotranspiration'
+    ],
+    'flood': ['urban_flood_risk'],
+    'air_quality': ['NO2'],
+}
+
+ALL_VARIABLES = [variable for variables in FAMILY_VARIABLES.values() for variable in variables]
+
+
+class ObservationStore:
+    """基于SQLite的日观测数据存储（多线程、多进程共享）"""
+
+    def __init__(self, path: str, grid_resolution: float = 0.1,
+                 recent_days: int = 7, recent_ttl: float = 21600.0):
+        """
+        初始化存储
+
+        Args:
+            path: SQLite文件路径
+            grid_resolution: 网格单元大小（度），坐标吸附到该网格，默认0.1°与ERA5-Land一致
+            recent_days: 距今多少天以内的数据视为"最近"数据
+            recent_ttl: 最近数据的有效期（秒）
+        """
+        self.path = path
+        self.grid_resolution = grid_resolution
+        self.recent_days = recent_days
+        self.recent_ttl = recent_ttl
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._ensure_schema()
+
+        logger.info(f"✅ 观测数据存储已就绪: {path} (grid={grid_resolution}°)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self):
+        variable_columns = ",\n".join(f'"{variable}" REAL' for variable in ALL_VARIABLES)
+        conn = self._connect()
+        with conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS observations (
+                    cell_lat REAL NOT NULL,
+                    cell_lon REAL NOT NULL,
+                    date TEXT NOT NULL,
+                    family TEXT NOT NULL,
+                    {variable_columns},
+                    fetched_at REAL NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (cell_lat, cell_lon, date, family)
+                )
+            """)
+
+    def snap(self, lat: float, lon: float):
+        """把坐标吸附到网格单元中心"""
+        resolution = self.grid_resolution
+        return (round(round(lat / resolution) * resolution, 6),
+                round(round(lon / resolution) * resolution, 6))
+
+    def _expires_at(self, date: str, now: float) -> Optional[float]:
+        """历史日期返回None（永不过期），最近日期返回过期时间戳"""
+        recent_cutoff = (datetime.utcnow() - timedelta(days=self.recent_days)).strftime('%Y-%m-%d')
+        if date < recent_cutoff:
+            return None
+        return now + self.recent_ttl
+
+    def _record_stat(self, key: str, count: int = 1):
+        with self._stats_lock:
+            self._stats[key] += count
+
+    def get_many(self, lat: float, lon: float, dates: List[str], family: str) -> Dict[str, Dict[str, Any]]:
+        """
+        读取某个API族多个日期的数据
+
+        Returns:
+            {日期: 变量字典}，未命中或已过期的日期不包含在结果中；值为NULL的变量不返回
+        """
+        variables = FAMILY_VARIABLES[family]
+        cell_lat, cell_lon = self.snap(lat, lon)
+        unique_dates = list(dict.fromkeys(dates))
+        if not unique_dates:
+            return {}
+
+        columns = ", ".join(f'"{variable}"' for variable in variables)
+        placeholders = ", ".join("?" for _ in unique_dates)
+        try:
+            rows = self._connect().execute(
+                f"""
+                SELECT date, {columns} FROM observations
+                WHERE cell_lat = ? AND cell_lon = ? AND family = ?
+                  AND date IN ({placeholders})
+                  AND (expires_at IS NULL OR expires_at > ?)
+                """,
+                (cell_lat, cell_lon, family, *unique_dates, time.time())
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 观测数据读取失败: {e}")
+            self._record_stat('errors')
+            return {}
+
+        result = {
+            row[0]: {variable: value for variable, value in zip(variables, row[1:]) if value is not None}
+            for row in rows
+        }
+        self._record_stat('hits', len(result))
+        self._record_stat('misses', len(unique_dates) - len(result))
+        return result
+
+    def get(self, lat: float, lon: float, date: str, family: str) -> Optional[Dict[str, Any]]:
+        """读取某个API族单日数据，未命中返回None"""
+        return self.get_many(lat, lon, [date], family).get(date)
+
+    def put_many(self, lat: float, lon: float, family: str, records: Dict[str, Dict[str, Any]]):
+        """写入某个API族多个日期的数据 {日期: 变量字典}（没有任何有效值的日期不写入）"""
+        records = {date: values for date, values in records.items()
+                   if any(value is not None for value in values.values())}
+        if not records:
+            return
+
+        variables = FAMILY_VARIABLES[family]
+        cell_lat, cell_lon = self.snap(lat, lon)
+        now = time.time()
+
+        columns = ", ".join(f'"{variable}"' for variable in variables)
+        placeholders = ", ".join("?" for _ in range(len(variables) + 6))
+        rows = [
+            (cell_lat, cell_lon, date, family,
+             *[None if values.get(variable) is None else float(values[variable]) for variable in variables],
+             now, self._expires_at(date, now))
+            for date, values in records.items()
+        ]
+
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    f"""
+                    INSERT OR REPLACE INTO observations
+                        (cell_lat, cell_lon, date, family, {columns}, fetched_at, expires_at)
+                    VALUES ({placeholders})
+                    """,
+                    rows
+                )
+            self._record_stat('writes', len(rows))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 观测数据写入失败: {e}")
+            self._record_stat('errors')
+
+    def put(self, lat: float, lon: float, date: str, family: str, values: Dict[str, Any]):
+        """写入某个API族单日数据"""
+        self.put_many(lat, lon, family, {date: values})
+
+    def purge_expired(self) -> int:
+        """删除已过期的最近数据，返回删除行数"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM observations WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)
+            )
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计信息"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        try:
+            stats['rows'] = self._connect().execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+        except sqlite3.Error:
+            stats['rows'] = None
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['path'] = self.path
+        stats['grid_resolution'] = self.grid_resolution
+        return stats
+
+
+# 单例实例
+_observation_store = None
+_observation_store_lock = threading.Lock()
+
+
+def observation_store_enabled() -> bool:
+    """是否启用观测数据存储（OBSERVATION_STORE_ENABLED，默认启用）"""
+    return os.getenv('OBSERVATION_STORE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_observation_store() -> Optional[ObservationStore]:
+    """
+    获取观测数据存储单例（未启用或无法创建时返回None）
+
+    配置项:
+        OBSERVATION_STORE_PATH, OBSERVATION_GRID_RESOLUTION,
+        OBSERVATION_RECENT_DAYS, OBSERVATION_RECENT_TTL
+    """
+    global _observation_store
+    if not observation_store_enabled():
+        return None
+
+    if _observation_store is None:
+        with _observation_store_lock:
+            if _observation_store is None:
+                default_path = os.path.join(os.path.expanduser('~'), '.cache', 'obscura', 'observations.sqlite')
+                try:
+                    _observation_store = ObservationStore(
+                        os.getenv('OBSERVATION_STORE_PATH', default_path),
+                        grid_resolution=float(os.getenv('OBSERVATION_GRID_RESOLUTION', 0.1)),
+                        recent_days=int(os.getenv('OBSERVATION_RECENT_DAYS', 7)),
+                        recent_ttl=float(os.getenv('OBSERVATION_RECENT_TTL', 21600))
+                    )
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"⚠️ 观测数据存储不可用，直接请求网络: {e}")
+                    return None
+
+    return _observation_store
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prediction Cache - 量化网格预测结果缓存
+
+展览现场的访客会反复把望远镜指向几乎相同的坐标。
+预测结果按(吸附到网格的经纬度, 月份, 模型版本)缓存，容量有限，按LRU淘汰；
+"当前"特征来自最近几天的观测数据，因此缓存在日期切换时（或最长TTL后）失效。
+"""
+
+import os
+import time
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    """线程安全的LRU + TTL预测缓存"""
+
+    def __init__(self, max_entries: int = 1024, grid_resolution: float = 0.01, max_ttl: float = 21600.0):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大缓存条目数
+            grid_resolution: 坐标量化网格大小（度）
+            max_ttl: 条目最长有效期（秒），与观测数据中最近数据的刷新周期一致
+        """
+        self.max_entries = max_entries
+        self.grid_resolution = grid_resolution
+        self.max_ttl = max_ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'stores': 0}
+
+        logger.info(f"PredictionCache初始化完成: max_entries={max_entries}, grid={grid_resolution}°")
+
+    def make_key(self, latitude: float, longitude: float, month: int, model_version: str) -> Tuple:
+        """生成缓存键（坐标吸附到网格）"""
+        resolution = self.grid_resolution
+        return (
+            round(round(latitude / resolution) * resolution, 6),
+            round(round(longitude / resolution) * resolution, 6),
+            int(month),
+            model_version
+        )
+
+    def _expires_at(self) -> float:
+        """过期时间: 下一个日期切换点与最长TTL中较早者"""
+        now = datetime.now()
+        next_day = datetime(now.year, now.month, now.day) + timedelta(days=1)
+        return time.time() + min((next_day - now).total_seconds(), self.max_ttl)
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """读取缓存（返回副本），未命中或已过期返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            expires_at, value = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+
+        return copy.deepcopy(value)
+
+    def set(self, key: Tuple, value: Dict[str, Any]):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (self._expires_at(), value)
+            self._entries.move_to_end(key)
+            self._stats['stores'] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中率等统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['miss_ratio'] = stats['misses'] / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['grid_resolution'] = self.grid_resolution
+        stats['max_ttl_seconds'] = self.max_ttl
+        return stats
+
+
+# 单例实例
+_prediction_cache = None
+_prediction_cache_lock = threading.Lock()
+_explanation_cache = None
+_explanation_cache_lock = threading.Lock()
+
+
+def prediction_cache_enabled() -> bool:
+    """是否启用预测缓存（PREDICTION_CACHE_ENABLED，默认启用）"""
+    return os.getenv('PREDICTION_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_prediction_cache() -> PredictionCache:
+    """
+    获取预测缓存单例
+
+    配置项:
+        PREDICTION_CACHE_SIZE, PREDICTION_CACHE_GRID, PREDICTION_CACHE_MAX_TTL
+    """
+    global _prediction_cache
+    if _prediction_cache is None:
+        with _prediction_cache_lock:
+            if _prediction_cache is None:
+                _prediction_cache = PredictionCache(
+                    max_entries=int(os.getenv('PREDICTION_CACHE_SIZE', 1024)),
+                    grid_resolution=float(os.getenv('PREDICTION_CACHE_GRID', 0.01)),
+                    max_ttl=float(os.getenv('PREDICTION_CACHE_MAX_TTL', 21600))
+                )
+    return _prediction_cache
+
+
+def get_prediction_cache_stats() -> Dict[str, Any]:
+    """获取预测缓存统计（未创建时返回initialized=False）"""
+    if _prediction_cache is None:
+        return {'enabled': prediction_cache_enabled(), 'initialized': False}
+
+    stats = _prediction_cache.get_stats()
+    stats['enabled'] = prediction_cache_enabled()
+    stats['initialized'] = True
+    return stats
+
+
+def get_explanation_cache() -> PredictionCache:
+    """
+    获取SHAP解释缓存单例（与预测缓存使用相同的键和失效规则）
+
+    配置项:
+        EXPLANATION_CACHE_SIZE, PREDICTION_CACHE_GRID, PREDICTION_CACHE_MAX_TTL
+    """
+    global _explanation_cache
+    if _explanation_cache is None:
+        with _explanation_cache_lock:
+            if _explanation_cache is None:
+                _explanation_cache = PredictionCache(
+                    max_entries=int(os.getenv('EXPLANATION_CACHE_SIZE', 512)),
+                    grid_resolution=float(os.getenv('PREDICTION_CACHE_GRID', 0.01)),
+                    max_ttl=float(os.getenv('PREDICTION_CACHE_MAX_TTL', 21600))
+                )
+    return _explanation_cache
+
+
+def get_explanation_cache_stats() -> Dict[str, Any]:
+    """获取SHAP解释缓存统计（未创建时返回initialized=False）"""
+    if _explanation_cache is None:
+        return {'enabled': prediction_cache_enabled(), 'initialized': False}
+
+    stats = _explanation_cache.get_stats()
+    stats['enabled'] = prediction_cache_enabled()
+    stats['initialized'] = True
+    return stats
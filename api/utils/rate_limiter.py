@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rate Limiter - 外部API调用的令牌桶限速
+
+按每分钟请求数补充令牌，允许不超过burst的短时突发；acquire()在没有令牌时阻塞等待，
+异步调用方使用acquire_async()（预占令牌后await等待，不阻塞事件循环）。
+只在进程内生效，多进程部署时每个进程各自限速。
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """线程安全的令牌桶限速器"""
+
+    def __init__(self, name: str, requests_per_minute: float, burst: int = 1):
+        """
+        Args:
+            name: 名称（用于日志和统计）
+            requests_per_minute: 每分钟允许的请求数，<=0表示不限速
+            burst: 令牌桶容量（允许的短时突发请求数）
+        """
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'timeouts': 0}
+
+    def _refill(self, now: float):
+        rate = self.requests_per_minute / 60.0
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = None) -> bool:
+        """
+        获取一个令牌，必要时等待
+
+        Returns:
+            是否获取成功（等待超过timeout时返回False）
+        """
+        if self.requests_per_minute <= 0:
+            with self._lock:
+                self._stats['acquired'] += 1
+            return True
+
+        start_time = time.monotonic()
+        deadline = None if timeout is None else start_time + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    waited = now - start_time
+                    self._stats['acquired'] += 1
+                    if waited > 0.001:
+                        self._stats['waited'] += 1
+                        self._stats['wait_seconds'] += waited
+                    return True
+                sleep_seconds = (1 - self._tokens) * 60.0 / self.requests_per_minute
+
+            if deadline is not None and now + sleep_seconds > deadline:
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                return False
+            time.sleep(sleep_seconds)
+
+    def reserve(self) -> float:
+        """
+        预占一个令牌（不阻塞；令牌不足时记为欠账，后续调用方排在其后）
+
+        Returns:
+            调用方需要等待的秒数
+        """
+        with self._lock:
+            self._stats['acquired'] += 1
+            if self.requests_per_minute <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            wait_seconds = -self._tokens * 60.0 / self.requests_per_minute
+            self._stats['waited'] += 1
+            self._stats['wait_seconds'] += wait_seconds
+            return wait_seconds
+
+    async def acquire_async(self):
+        """异步获取一个令牌（可在多个事件循环之间共享同一个限速器）"""
+        import asyncio
+        wait_seconds = self.reserve()
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        stats['name'] = self.name
+        stats['requests_per_minute'] = self.requests_per_minute
+        stats['burst'] = self.burst
+        return stats
+
+
+# 按名称注册的单例实例
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, requests_per_minute: float, burst: int = 1) -> RateLimiter:
+    """获取指定名称的限速器单例（参数只在首次创建时生效）"""
+    rate_limiter = _rate_limiters.get(name)
+    if rate_limiter is None:
+        with _rate_limiters_lock:
+            rate_limiter = _rate_limiters.get(name)
+            if rate_limiter is None:
+                rate_limiter = _rate_limiters[name] = RateLimiter(name, requests_per_minute, burst)
+                logger.info(f"✅ 限速器{name}: {requests_per_minute}次/分钟, burst={burst}")
+    return rate_limiter
+
+
+def get_rate_limiter_stats() -> Dict[str, Any]:
+    """获取所有限速器的统计"""
+    return {name: rate_limiter.get_stats() for name, rate_limiter in list(_rate_limiters.items())}
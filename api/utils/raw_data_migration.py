@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Raw Data Migration - environmental_data.raw_data 由TEXT迁移为JSONB（部署时运行一次）
+
+旧版本以TEXT保存上传数据的Python repr（str(dict)），上传接口现在写入JSON并假设该列为JSONB。
+部署新版本前运行:
+    python -m api.utils.raw_data_migration [--batch-size 1000]
+
+迁移在一个事务中完成：先获取ACCESS EXCLUSIVE锁，再检查列类型（已是JSONB时直接退出，
+可重复运行），然后逐批把旧值转换为JSON写入新列，最后替换旧列。
+无法解析的旧值保留在 {'unparsed_raw_data': 原文} 中。
+
+配置项:
+    DATABASE_URL: PostgreSQL连接串
+"""
+
+import os
+import sys
+import ast
+import json
+import logging
+import argparse
+from typing import Any, Optional, Sequence
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+
+def parse_legacy_raw_data(raw_data: Any) -> Any:
+    """旧记录的raw_data是str(dict)的Python repr，尽量还原为JSON对象（已是对象时原样返回）"""
+    if raw_data is None or not isinstance(raw_data, str):
+        return raw_data
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            return parse(raw_data)
+        except (ValueError, SyntaxError, TypeError):
+            continue
+    return {'unparsed_raw_data': raw_data}
+
+
+def raw_data_column_type(cur) -> Optional[str]:
+    """environmental_data.raw_data的列类型（表或列不存在时返回None）"""
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'environmental_data' AND column_name = 'raw_data'
+    """)
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def migrate_raw_data(conn, batch_size: int = 1000) -> Optional[int]:
+    """
+    把raw_data列迁移为JSONB
+
+    Returns:
+        转换的行数（已是JSONB时为None）
+    Raises:
+        RuntimeError: environmental_data.raw_data列不存在
+    """
+    with conn:
+        cur = conn.cursor()
+        cur.execute("LOCK TABLE environmental_data IN ACCESS EXCLUSIVE MODE")
+        # 持有锁之后再检查，并发运行的另一个迁移已完成时不会重复转换
+        column_type = raw_data_column_type(cur)
+        if column_type is None:
+            raise RuntimeError("environmental_data.raw_data column not found")
+        if column_type == 'jsonb':
+            return None
+
+        cur.execute("ALTER TABLE environmental_data ADD COLUMN raw_data_jsonb JSONB")
+        migrated, last_id = 0, 0
+        while True:
+            cur.execute("""
+                SELECT id, raw_data FROM environmental_data
+                WHERE id > %s AND raw_data IS NOT NULL
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            execute_values(cur, """
+                UPDATE environmental_data AS e SET raw_data_jsonb = v.raw_data::jsonb
+                FROM (VALUES %s) AS v (id, raw_data) WHERE e.id = v.id
+            """, [(row_id, json.dumps(parse_legacy_raw_data(raw_data))) for row_id, raw_data in rows],
+                page_size=batch_size)
+            migrated += len(rows)
+            last_id = rows[-1][0]
+            logger.info(f"🔄 已转换 {migrated} 行")
+
+        cur.execute("ALTER TABLE environmental_data DROP COLUMN raw_data")
+        cur.execute("ALTER TABLE environmental_data RENAME COLUMN raw_data_jsonb TO raw_data")
+        cur.close()
+    return migrated
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Migrate environmental_data.raw_data from TEXT to JSONB')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows converted per UPDATE')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        logger.error("❌ DATABASE_URL is not set")
+        return 1
+
+    conn = psycopg2.connect(database_url)
+    try:
+        migrated = migrate_raw_data(conn, batch_size=args.batch_size)
+    except Exception as e:
+        logger.error(f"❌ raw_data迁移失败（已回滚）: {e}")
+        return 1
+    finally:
+        conn.close()
+
+    if migrated is not None:
+        logger.info(f"✅ environmental_data.raw_data migrated to JSONB ({migrated} rows)")
+    else:
+        logger.info("✅ environmental_data.raw_data is already JSONB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,19 +5,27 @@
 用于获取11个环境变量的当前数据和历史数据，支持SHAP模型的特征工程
 """
 
+import os
 import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
 import time
+import threading
 from typing import Dict, List, Optional, Tuple
 import json
 
+from .observation_store import get_observation_store
+from api.utils.metrics import EXTERNAL_REQUEST_SECONDS, timed
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 区间请求模式下的API族
+RANGE_FAMILIES = ('meteorological', 'geospatial', 'flood', 'air_quality')
+
 class RealTimeEnvironmentalDataCollector:
     """实时环境数据收集器"""
     
@@ -64,6 +72,18 @@ class RealTimeEnvironmentalDataCollector:
         # 滞后周期和移动平均窗口
         self.lag_periods = [1, 3, 6, 12]  # 月
         self.ma_windows = [3, 6, 12]      # 月
+        
+        # 获取模式: range = 每个API族一次请求获取整个12个月窗口的日序列，daily = 逐日请求
+        self.fetch_mode = os.getenv('ENV_DATA_FETCH_MODE', 'range').lower()
+        self.range_timeout = float(os.getenv('ENV_DATA_RANGE_TIMEOUT', 10))
+        
+        # 日序列短期缓存，使当前/滞后/移动平均数据共享同一次区间请求
+        self.series_cache_ttl = float(os.getenv('ENV_DATA_SERIES_TTL', 600))
+        self._series_cache = {}
+        self._series_lock = threading.Lock()
+        
+        # 各数据源请求并发发送（按主机令牌桶限流），关闭后恢复顺序请求
+        self.async_enabled = os.getenv('ENV_DATA_ASYNC', 'true').lower() in ('1', 'true', 'yes')
     
     def get_closest_city(self, latitude: float, longitude: float) -> str:
         """获取最近的城市"""
@@ -81,12 +101,17 @@ class RealTimeEnvironmentalDataCollector:
     def fetch_daily_meteorological_data(self, lat: float, lon: float, date: str) -> Dict:
         """获取单日气象数据（小时级→日平均）"""
         
+        store = get_observation_store()
+        stored = store.get(lat, lon, date, 'meteorological') if store else None
+        if stored:
+            return self._validate_meteorological_data(stored)
+        
         try:
             base_url = self.open_meteo_archive_url
             # 手动构建查询字符串
             params_str = f"latitude={lat}&longitude={lon}&start_date={date}&end_date={date}&hourly={','.join(self.meteorological_params)}&timezone=UTC"
             
-            response = requests.get(f"{base_url}?{params_str}", timeout=2)
+            response = self._get(f"{base_url}?{params_str}", timeout=2)
             response.raise_for_status()
             
             data = response.json()
@@ -119,6 +144,9 @@ class RealTimeEnvironmentalDataCollector:
                 'solar_radiation': df['shortwave_radiation'].mean()
             }
             
+            if store:
+                store.put(lat, lon, date, 'meteorological', result)
+            
             # 数据验证和清理
             result = self._validate_meteorological_data(result)
             
@@ -132,6 +160,13 @@ class RealTimeEnvironmentalDataCollector:
     def fetch_daily_geospatial_data(self, lat: float, lon: float, date: str) -> Dict:
         """获取单日地理数据"""
         
+        store = get_observation_store()
+        stored = store.get(lat, lon, date, 'geospatial') if store else None
+        if stored:
+            result = dict(stored)
+            result.update(self._fetch_flood_risk_data(lat, lon, date))
+            return self._validate_geospatial_data(result)
+        
         try:
             base_url = self.open_meteo_archive_url
             # 手动构建查询字符串
@@ -139,7 +174,7 @@ class RealTimeEnvironmentalDataCollector:
             daily_params_str = ",".join(self.geospatial_daily_params)
             params_str = f"latitude={lat}&longitude={lon}&start_date={date}&end_date={date}&hourly={hourly_params_str}&daily={daily_params_str}&timezone=UTC"
 
-            response = requests.get(f"{base_url}?{params_str}", timeout=2)
+            response = self._get(f"{base_url}?{params_str}", timeout=2)
             response.raise_for_status()
             
             data = response.json()
@@ -165,6 +200,10 @@ class RealTimeEnvironmentalDataCollector:
                 if daily_data['et0_fao_evapotranspiration'] and daily_data['et0_fao_evapotranspiration'][0] is not None:
                     result['reference_evapotranspiration'] = daily_data['et0_fao_evapotranspiration'][0]
             
+            # 没有可用数据时不写入存储（空记录会被当作命中，跳过之后的重新请求）
+            if store and result:
+                store.put(lat, lon, date, 'geospatial', result)
+            
             # 获取洪水风险数据
             flood_data = self._fetch_flood_risk_data(lat, lon, date)
             result.update(flood_data)
@@ -182,6 +221,11 @@ class RealTimeEnvironmentalDataCollector:
     def _fetch_flood_risk_data(self, lat: float, lon: float, date: str) -> Dict:
         """获取洪水风险数据"""
         
+        store = get_observation_store()
+        stored = store.get(lat, lon, date, 'flood') if store else None
+        if stored:
+            return stored
+        
         try:
             params = {
                 'latitude': lat,
@@ -192,7 +236,7 @@ class RealTimeEnvironmentalDataCollector:
                 'timezone': 'UTC'
             }
             
-            response = requests.get(self.open_meteo_flood_url, params=params, timeout=2)
+            response = self._get(self.open_meteo_flood_url, params=params, timeout=2)
             response.raise_for_status()
             
             data = response.json()
@@ -200,6 +244,8 @@ class RealTimeEnvironmentalDataCollector:
             if 'daily' in data and data['daily'] and data['daily']['river_discharge_max']:
                 discharge = data['daily']['river_discharge_max'][0]
                 if discharge is not None:
+                    if store:
+                        store.put(lat, lon, date, 'flood', {'urban_flood_risk': discharge})
                     return {'urban_flood_risk': discharge}
             
             return {'urban_flood_risk': 1.0}  # 默认值
@@ -211,12 +257,17 @@ class RealTimeEnvironmentalDataCollector:
     def fetch_daily_air_quality_data(self, lat: float, lon: float, date: str) -> Dict:
         """获取指定日期的空气质量数据"""
         
+        store = get_observation_store()
+        stored = store.get(lat, lon, date, 'air_quality') if store else None
+        if stored:
+            return self._validate_air_quality_data(stored)
+        
         try:
             base_url = self.open_meteo_air_quality_url
             # 手动构建查询字符串
             params_str = f"latitude={lat}&longitude={lon}&start_date={date}&end_date={date}&hourly={','.join(self.air_quality_params)}&timezone=UTC"
             
-            response = requests.get(f"{base_url}?{params_str}", timeout=2)
+            response = self._get(f"{base_url}?{params_str}", timeout=2)
             response.raise_for_status()
             
             data = response.json()
@@ -244,6 +295,9 @@ class RealTimeEnvironmentalDataCollector:
                 'NO2': df['nitrogen_dioxide'].mean() if not df['nitrogen_dioxide'].isna().all() else 15.0
             }
             
+            if store:
+                store.put(lat, lon, date, 'air_quality', result)
+            
             # 数据验证和清理
             result = self._validate_air_quality_data(result)
             
@@ -269,6 +323,260 @@ class RealTimeEnvironmentalDataCollector:
         
         return data
     
+    # ------------------------------------------------------------------
+    # 区间请求模式：每个API族一次请求获取连续日序列，本地派生所有时间点
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _build_url(base_url: str, params: Dict) -> str:
+        """手动构建查询字符串（与单日请求保持一致，逗号不转义）"""
+        return f"{base_url}?" + "&".join(f"{key}={value}" for key, value in params.items())
+    
+    def _request_range(self, base_url: str, lat: float, lon: float, start_date: str, end_date: str, **params) -> Dict:
+        """发送区间请求"""
+        query = {
+            'latitude': lat,
+            'longitude': lon,
+            'start_date': start_date,
+            'end_date': end_date,
+            **params,
+            'timezone': 'UTC'
+        }
+        response = self._get(self._build_url(base_url, query), timeout=self.range_timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    @staticmethod
+    def _get(url: str, **kwargs):
+        """Open-Meteo GET请求（记录外部调用延迟）"""
+        with timed(EXTERNAL_REQUEST_SECONDS, 'open_meteo'):
+            return requests.get(url, **kwargs)
+    
+    @staticmethod
+    def _hourly_to_daily(hourly_data: Dict, params: List[str], sum_params: Tuple = ()) -> pd.DataFrame:
+        """小时级数据→日统计（与单日请求相同：先剔除含缺失值的小时，再按日求均值/累计）"""
+        df = pd.DataFrame({
+            'datetime': pd.to_datetime(hourly_data['time']),
+            **{param: hourly_data[param] for param in params}
+        })
+        df = df.dropna()
+        df['date'] = df['datetime'].dt.strftime('%Y-%m-%d')
+        aggregations = {param: ('sum' if param in sum_params else 'mean') for param in params}
+        return df.groupby('date').agg(aggregations)
+    
+    def _parse_meteorological_range(self, data: Dict) -> Dict[str, Dict]:
+        """解析气象区间数据"""
+        if 'hourly' not in data or not data['hourly']:
+            return {}
+        
+        daily = self._hourly_to_daily(data['hourly'], self.meteorological_params, sum_params=('precipitation',))
+        return {
+            date: {
+                'temperature': row['temperature_2m'],
+                'humidity': row['relative_humidity_2m'],
+                'wind_speed': row['wind_speed_10m'],
+                'precipitation': row['precipitation'],  # 降水用累计
+                'atmospheric_pressure': row['surface_pressure'],
+                'solar_radiation': row['shortwave_radiation']
+            }
+            for date, row in daily.iterrows()
+        }
+    
+    def _parse_geospatial_range(self, data: Dict) -> Dict[str, Dict]:
+        """解析地理区间数据（土壤小时数据 + 蒸散发日数据）"""
+        series = {}
+        
+        if 'hourly' in data and data['hourly']:
+            daily = self._hourly_to_daily(data['hourly'], self.geospatial_hourly_params)
+            for date, row in daily.iterrows():
+                series[date] = {
+                    'soil_temperature_0_7cm': row['soil_temperature_0_to_7cm'],
+                    'soil_moisture_7_28cm': row['soil_moisture_7_to_28cm']
+                }
+        
+        if 'daily' in data and data['daily']:
+            daily_data = data['daily']
+            for date, et0 in zip(daily_data.get('time', []), daily_data.get('et0_fao_evapotranspiration') or []):
+                if et0 is not None:
+                    series.setdefault(date, {})['reference_evapotranspiration'] = et0
+        
+        return series
+    
+    @staticmethod
+    def _parse_flood_range(data: Dict) -> Dict[str, Dict]:
+        """解析洪水区间数据"""
+        if 'daily' not in data or not data['daily']:
+            return {}
+        
+        daily_data = data['daily']
+        return {
+            date: {'urban_flood_risk': discharge}
+            for date, discharge in zip(daily_data.get('time', []), daily_data.get('river_discharge_max') or [])
+            if discharge is not None
+        }
+    
+    def _parse_air_quality_range(self, data: Dict) -> Dict[str, Dict]:
+        """解析空气质量区间数据"""
+        if 'hourly' not in data or not data['hourly']:
+            return {}
+        
+        daily = self._hourly_to_daily(data['hourly'], self.air_quality_params)
+        return {date: {'NO2': row['nitrogen_dioxide']} for date, row in daily.iterrows()}
+    
+    def _range_requests(self, lat: float, lon: float, start_date: str, end_date: str) -> Dict[str, Tuple]:
+        """各API族的区间请求定义: 族名 -> (URL, 额外参数, 解析函数)"""
+        return {
+            'meteorological': (
+                self.open_meteo_archive_url,
+                {'hourly': ','.join(self.meteorological_params)},
+                self._parse_meteorological_range
+            ),
+            'geospatial': (
+                self.open_meteo_archive_url,
+                {'hourly': ','.join(self.geospatial_hourly_params), 'daily': ','.join(self.geospatial_daily_params)},
+                self._parse_geospatial_range
+            ),
+            'flood': (
+                self.open_meteo_flood_url,
+                {'daily': 'river_discharge_max'},
+                self._parse_flood_range
+            ),
+            'air_quality': (
+                self.open_meteo_air_quality_url,
+                {'hourly': ','.join(self.air_quality_params)},
+                self._parse_air_quality_range
+            )
+        }
+    
+    def fetch_range_series(self, lat: float, lon: float, start_date: str, end_date: str) -> Dict[str, Optional[Dict]]:
+        """
+        每个API族发送一次区间请求，返回原始日序列
+        
+        Returns:
+            {族名: {日期: 变量字典}}，请求失败的族为None（调用方回退到逐日请求）
+        """
+        if self.async_enabled:
+            from .async_fetch import fetch_range_series_concurrently
+            return fetch_range_series_concurrently(self, lat, lon, start_date, end_date)
+        
+        series = {}
+        for family, (base_url, params, parser) in self._range_requests(lat, lon, start_date, end_date).items():
+            try:
+                data = self._request_range(base_url, lat, lon, start_date, end_date, **params)
+                series[family] = parser(data)
+                logger.info(f"区间数据获取成功: {family} {start_date}~{end_date} ({len(series[family])}天)")
+            except Exception as e:
+                logger.warning(f"区间数据获取失败 {family} {start_date}~{end_date}: {e}")
+                series[family] = None
+        return series
+    
+    def _history_window(self) -> Tuple[str, str]:
+        """覆盖当前值、所有滞后点和移动平均点的日期窗口"""
+        now = datetime.now()
+        longest_months = max(self.lag_periods + self.ma_windows)
+        start_date = (now - timedelta(days=longest_months * 30)).strftime('%Y-%m-%d')
+        end_date = (now - timedelta(days=3)).strftime('%Y-%m-%d')
+        return start_date, end_date
+    
+    def _get_range_series(self, lat: float, lon: float) -> Dict[str, Optional[Dict]]:
+        """获取（或复用缓存的）12个月日序列"""
+        start_date, end_date = self._history_window()
+        key = (round(lat, 4), round(lon, 4), start_date, end_date)
+        
+        with self._series_lock:
+            cached = self._series_cache.get(key)
+            if cached and time.time() < cached[0]:
+                return cached[1]
+        
+        series = self.fetch_range_series(lat, lon, start_date, end_date)
+        
+        # 写入持久化存储，其他进程（训练脚本、测试）和后续请求可直接复用
+        store = get_observation_store()
+        if store:
+            for family, family_series in series.items():
+                if family_series is not None:
+                    store.put_many(lat, lon, family, family_series)
+        
+        with self._series_lock:
+            # 清理过期条目
+            now = time.time()
+            for stale_key in [k for k, (expires_at, _) in self._series_cache.items() if now >= expires_at]:
+                del self._series_cache[stale_key]
+            # 有API族失败时只短暂缓存，避免长时间停留在逐日回退路径
+            ttl = self.series_cache_ttl if all(v is not None for v in series.values()) else min(30.0, self.series_cache_ttl)
+            self._series_cache[key] = (now + ttl, series)
+        
+        return series
+    
+    def _get_daily_record(self, lat: float, lon: float, date: str) -> Dict:
+        """从持久化存储或区间日序列中取出某一天的11个变量（经过与单日请求相同的验证）"""
+        store = get_observation_store()
+        stored = {}
+        if store:
+            for family in RANGE_FAMILIES:
+                record = store.get(lat, lon, date, family)
+                if record:
+                    stored[family] = record
+        
+        # 所有API族都命中存储时不需要网络请求
+        series = self._get_range_series(lat, lon) if len(stored) < len(RANGE_FAMILIES) else {}
+        
+        def lookup(family: str) -> Optional[Dict]:
+            """该族当天的原始值；None表示区间请求失败，{}表示序列中没有这一天"""
+            if family in stored:
+                return stored[family]
+            if series.get(family) is None:
+                return None
+            return series[family].get(date, {})
+        
+        # 气象数据
+        meteo_raw = lookup('meteorological')
+        if meteo_raw is None:
+            meteo_data = self.fetch_daily_meteorological_data(lat, lon, date)
+        elif meteo_raw:
+            meteo_data = self._validate_meteorological_data(dict(meteo_raw))
+        else:
+            logger.warning(f"气象数据为空: {date}")
+            meteo_data = self._get_default_meteorological_data()
+        
+        # 地理数据（土壤、蒸散发 + 洪水风险）
+        geo_raw, flood_raw = lookup('geospatial'), lookup('flood')
+        if geo_raw is None or flood_raw is None:
+            geo_data = self.fetch_daily_geospatial_data(lat, lon, date)
+        else:
+            geo_raw = dict(geo_raw)
+            geo_raw.update(flood_raw or {'urban_flood_risk': 1.0})
+            geo_data = self._validate_geospatial_data(geo_raw)
+        
+        # 空气质量数据
+        air_quality_raw = lookup('air_quality')
+        if air_quality_raw is None:
+            air_quality_data = self.fetch_daily_air_quality_data(lat, lon, date)
+        elif air_quality_raw:
+            air_quality_data = self._validate_air_quality_data(dict(air_quality_raw))
+        else:
+            logger.warning(f"空气质量数据为空: {date}")
+            air_quality_data = self._get_default_air_quality_data()
+        
+        return {**meteo_data, **geo_data, **air_quality_data}
+    
+    def _use_range_mode(self) -> bool:
+        return self.fetch_mode == 'range'
+    
+    def _get_daily_records(self, lat: float, lon: float, dates: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        批量获取多个日期的数据
+        
+        Returns:
+            {日期: 变量字典}；逐日顺序模式返回None，由调用方按原有方式逐日请求
+        """
+        if self._use_range_mode():
+            return {date: self._get_daily_record(lat, lon, date) for date in dates}
+        if self.async_enabled:
+            from .async_fetch import fetch_daily_records_concurrently
+            return fetch_daily_records_concurrently(self, lat, lon, dates)
+        return None
+    
     def get_current_environmental_data(self, latitude: float, longitude: float) -> Dict:
         """获取当前环境数据 (使用3天前的数据，因为Open-Meteo有数据处理延迟)"""
         
@@ -277,6 +585,12 @@ class RealTimeEnvironmentalDataCollector:
         today = three_days_ago.strftime('%Y-%m-%d')
         logger.info(f"获取环境数据日期: {today} (3天前，确保数据可用性)")
         
+        records = self._get_daily_records(latitude, longitude, [today])
+        if records is not None:
+            environmental_data = records[today]
+            logger.info(f"当前环境数据获取完成: {len(environmental_data)} 个变量")
+            return environmental_data
+        
         # 获取气象数据
         meteo_data = self.fetch_daily_meteorological_data(latitude, longitude, today)
         
@@ -297,13 +611,20 @@ class RealTimeEnvironmentalDataCollector:
         
         historical_data = {}
         
-        for lag_months in self.lag_periods:
-            # 计算历史日期
-            target_date = datetime.now() - timedelta(days=lag_months * 30)
-            date_str = target_date.strftime('%Y-%m-%d')
-            
+        # 计算历史日期
+        lag_dates = {
+            lag_months: (datetime.now() - timedelta(days=lag_months * 30)).strftime('%Y-%m-%d')
+            for lag_months in self.lag_periods
+        }
+        records = self._get_daily_records(latitude, longitude, list(lag_dates.values()))
+        
+        for lag_months, date_str in lag_dates.items():
             logger.info(f"获取 {lag_months}个月前数据: {date_str}")
             
+            if records is not None:
+                historical_data[f'lag_{lag_months}'] = records[date_str]
+                continue
+            
             # 获取气象数据
             meteo_data = self.fetch_daily_meteorological_data(latitude, longitude, date_str)
             geo_data = self.fetch_daily_geospatial_data(latitude, longitude, date_str)
@@ -322,6 +643,12 @@ class RealTimeEnvironmentalDataCollector:
         
         ma_data = {}
         
+        ma_dates = [
+            (datetime.now() - timedelta(days=(i + 1) * 30)).strftime('%Y-%m-%d')
+            for i in range(max(self.ma_windows))
+        ]
+        records = self._get_daily_records(latitude, longitude, ma_dates)
+        
         for window in self.ma_windows:
             logger.info(f"获取 {window}个月移动平均数据...")
             
@@ -329,8 +656,11 @@ class RealTimeEnvironmentalDataCollector:
             
             # 获取过去N个月的数据
             for i in range(window):
-                target_date = datetime.now() - timedelta(days=(i + 1) * 30)
-                date_str = target_date.strftime('%Y-%m-%d')
+                date_str = ma_dates[i]
+                
+                if records is not None:
+                    window_data.append(records[date_str])
+                    continue
                 
                 meteo_data = self.fetch_daily_meteorological_data(latitude, longitude, date_str)
                 geo_data = self.fetch_daily_geospatial_data(latitude, longitude, date_str)
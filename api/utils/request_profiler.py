@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request Profiler - 按需对单个请求进行性能分析（火焰图输出）
+
+带有管理员令牌标记的请求在分析器下执行，结果写入本地目录:
+    curl -H "X-Profile: $ADMIN_TOKEN" https://.../api/v1/images/42/analysis
+    curl "https://.../api/v1/images/42/analysis?_profile=$ADMIN_TOKEN&_profile_mode=deterministic"
+
+分析模式（X-Profile-Mode 或 _profile_mode）:
+- sampling（默认）: 后台线程按固定间隔采样请求线程的调用栈（sys._current_frames），开销低
+- deterministic: sys.setprofile记录请求线程的每次函数调用和返回，精确到自身耗时，但会明显拖慢请求
+
+每个分析结果保存两种格式:
+- <id>.collapsed: 折叠栈（flamegraph.pl / speedscope均可直接打开）
+- <id>.speedscope.json: speedscope格式（https://www.speedscope.app）
+响应带有 X-Profile-Id 头；/admin/profiles 列出最近的分析结果。
+
+未设置ADMIN_TOKEN时不安装中间件，未标记的请求没有任何额外开销；
+设置后未标记的请求只多一次WSGI环境字典查找。流式响应在分析时会被完整缓冲。
+
+配置项:
+    ADMIN_TOKEN: 管理员令牌（未设置时禁用按需分析和 /admin/profiles）
+    PROFILE_DIR: 分析结果目录（默认 ~/.cache/obscura/profiles）
+    PROFILE_MAX_FILES: 保留的分析结果数量（默认50，超出时删除最旧的）
+    PROFILE_SAMPLE_INTERVAL_MS: 采样间隔（默认2ms）
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from api.utils.admin_auth import admin_token, admin_token_valid
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('sampling', 'deterministic')
+
+# 触发分析的请求头和查询参数
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_MODE_HEADER = 'HTTP_X_PROFILE_MODE'
+PROFILE_QUERY_KEY = '_profile'
+PROFILE_MODE_QUERY_KEY = '_profile_mode'
+
+# 分析结果文件名只允许 <时间戳>-<随机串>
+_PROFILE_ID_CHARS = set('0123456789abcdef-T')
+
+
+_PROJECT_ROOT = str(Path(__file__).resolve().parents[2]) + os.sep
+_SITE_PACKAGES = 'site-packages' + os.sep
+_labels: Dict[Any, str] = {}
+
+
+def _frame_label(code) -> str:
+    """函数名 (相对文件路径:行号)，去掉折叠栈格式中的分隔符（按代码对象缓存）"""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_PROJECT_ROOT):
+            filename = filename[len(_PROJECT_ROOT):]
+        elif _SITE_PACKAGES in filename:
+            filename = filename[filename.rindex(_SITE_PACKAGES) + len(_SITE_PACKAGES):]
+        label = _labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+    return label
+
+
+class _SamplingProfiler:
+    """在后台线程中按固定间隔采样目标线程的调用栈"""
+
+    unit = 'milliseconds'
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Dict[str, int] = defaultdict(int)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, root_frame):
+        thread_id = threading.get_ident()
+
+        def sample():
+            while not self._stop.wait(self.interval):
+                frame = sys._current_frames().get(thread_id)
+                labels = []
+                while frame is not None and frame is not root_frame:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if labels:
+                    self.stacks[';'.join(reversed(labels))] += 1
+                    self.samples += 1
+
+        self._thread = threading.Thread(target=sample, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def weights(self) -> Dict[str, float]:
+        interval_ms = self.interval * 1000
+        return {stack: count * interval_ms for stack, count in self.stacks.items()}
+
+
+class _DeterministicProfiler:
+    """sys.setprofile记录每次调用，按完整调用栈累计自身耗时（微秒）"""
+
+    unit = 'microseconds'
+
+    def __init__(self):
+        self.stacks: Dict[str, float] = defaultdict(float)
+        self.samples = 0
+        # [标签, 开始时间, 子调用耗时]
+        self._stack: List[list] = []
+        self._labels: List[str] = []
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            label = _frame_label(frame.f_code) if event == 'call' else \
+                f"{getattr(arg, '__qualname__', repr(arg))} (builtin)".replace(';', ':')
+            self._labels.append(label)
+            self._stack.append([label, now, 0.0])
+        elif self._stack:  # return / c_return / c_exception
+            _, start, child = self._stack.pop()
+            elapsed = now - start
+            self.stacks[';'.join(self._labels)] += (elapsed - child) * 1e6
+            self._labels.pop()
+            self.samples += 1
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def start(self, root_frame):
+        sys.setprofile(self._callback)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def weights(self) -> Dict[str, float]:
+        return dict(self.stacks)
+
+
+def to_collapsed(weights: Dict[str, float]) -> str:
+    """折叠栈格式: 每行 "帧1;帧2;帧3 权重" """
+    return ''.join(f"{stack} {max(1, round(weight))}\n" for stack, weight in sorted(weights.items()))
+
+
+def to_speedscope(weights: Dict[str, float], name: str, unit: str) -> Dict[str, Any]:
+    """speedscope文件格式（sampled类型，每个唯一调用栈一个带权重的样本）"""
+    frames, frame_index, samples, sample_weights = [], {}, [], []
+    for stack, weight in weights.items():
+        sample = []
+        for label in stack.split(';'):
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                frames.append({'name': label})
+            sample.append(frame_index[label])
+        samples.append(sample)
+        sample_weights.append(round(weight, 3))
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': unit,
+            'startValue': 0,
+            'endValue': round(sum(sample_weights), 3),
+            'samples': samples,
+            'weights': sample_weights
+        }],
+        'name': name,
+        'exporter': 'obscura-request-profiler'
+    }
+
+
+class ProfileStore:
+    """分析结果目录（按数量限制，超出时删除最旧的结果）"""
+
+    def __init__(self, directory: str, max_profiles: int = 50):
+        self.directory = Path(directory)
+        self.max_profiles = max(1, max_profiles)
+        self._lock = threading.Lock()
+
+    def save(self, meta: Dict[str, Any], weights: Dict[str, float], unit: str) -> str:
+        profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        meta = dict(meta, id=profile_id, created_at=datetime.now().isoformat(), stacks=len(weights))
+        name = f"{meta['method']} {meta['path']} ({meta['mode']})"
+
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / f"{profile_id}.collapsed").write_text(to_collapsed(weights), encoding='utf-8')
+            (self.directory / f"{profile_id}.speedscope.json").write_text(
+                json.dumps(to_speedscope(weights, name, unit)), encoding='utf-8')
+            (self.directory / f"{profile_id}.meta.json").write_text(json.dumps(meta), encoding='utf-8')
+            self._evict()
+        return profile_id
+
+    def _evict(self):
+        metas = sorted(self.directory.glob('*.meta.json'))
+        for meta_path in metas[:-self.max_profiles]:
+            profile_id = meta_path.name[:-len('.meta.json')]
+            for suffix in ('.meta.json', '.collapsed', '.speedscope.json'):
+                try:
+                    (self.directory / f"{profile_id}{suffix}").unlink()
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的分析结果（新的在前）"""
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for meta_path in sorted(self.directory.glob('*.meta.json'), reverse=True)[:limit]:
+            try:
+                profiles.append(json.loads(meta_path.read_text(encoding='utf-8')))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def path(self, profile_id: str, fmt: str) -> Optional[Path]:
+        """分析结果文件路径（fmt: collapsed / speedscope；不存在或ID无效时返回None）"""
+        suffix = {'collapsed': '.collapsed', 'speedscope': '.speedscope.json'}.get(fmt)
+        if not suffix or not profile_id or not set(profile_id) <= _PROFILE_ID_CHARS:
+            return None
+        path = self.directory / f"{profile_id}{suffix}"
+        return path if path.exists() else None
+
+
+class RequestProfilerMiddleware:
+    """WSGI中间件：只对带有效管理员令牌标记的请求进行分析"""
+
+    def __init__(self, wsgi_app, store: ProfileStore, interval: float):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.interval = interval
+
+    def __call__(self, environ, start_response):
+        token = environ.get(PROFILE_HEADER)
+        if token is None:
+            query = environ.get('QUERY_STRING')
+            if not query or PROFILE_QUERY_KEY not in query:
+                return self.wsgi_app(environ, start_response)
+            token = dict(parse_qsl(query)).get(PROFILE_QUERY_KEY)
+
+        if not admin_token_valid(token):
+            logger.warning(f"⚠️ 分析请求令牌无效，按普通请求处理: {environ.get('PATH_INFO')}")
+            return self.wsgi_app(environ, start_response)
+        return self._profile(environ, start_response)
+
+    def _profile(self, environ, start_response):
+        query = dict(parse_qsl(environ.get('QUERY_STRING', '')))
+        mode = (environ.get(PROFILE_MODE_HEADER) or query.get(PROFILE_MODE_QUERY_KEY) or 'sampling').lower()
+        if mode not in PROFILE_MODES:
+            mode = 'sampling'
+        profiler = _DeterministicProfiler() if mode == 'deterministic' else _SamplingProfiler(self.interval)
+
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            return lambda data: captured.setdefault('written', []).append(data)
+
+        start_time = time.perf_counter()
+        profiler.start(sys._getframe())
+        try:
+            result = self.wsgi_app(environ, capture_start_response)
+            try:
+                body = list(result)  # 流式响应也在分析范围内生成
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            profiler.stop()
+        elapsed = time.perf_counter() - start_time
+
+        public_query = {key: value for key, value in query.items()
+                        if key not in (PROFILE_QUERY_KEY, PROFILE_MODE_QUERY_KEY)}
+        meta = {
+            'method': environ.get('REQUEST_METHOD'),
+            'path': environ.get('PATH_INFO'),
+            'query': urlencode(public_query),
+            'status': int(captured.get('status', '500').split(' ', 1)[0]),
+            'mode': mode,
+            'unit': profiler.unit,
+            'duration_ms': round(elapsed * 1000, 2),
+            'samples': profiler.samples
+        }
+        try:
+            profile_id = self.store.save(meta, profiler.weights(), profiler.unit)
+            logger.info(f"🔬 请求分析完成: {meta['method']} {meta['path']} "
+                        f"{meta['duration_ms']:.0f}ms ({mode}, {profiler.samples} samples) → {profile_id}")
+        except OSError as e:
+            profile_id = None
+            logger.error(f"❌ 保存分析结果失败: {e}")
+
+        headers = list(captured.get('headers', []))
+        if profile_id:
+            headers.append(('X-Profile-Id', profile_id))
+        start_response(captured.get('status', '500 INTERNAL SERVER ERROR'), headers, captured.get('exc_info'))
+        return captured.get('written', []) + body
+
+
+# 单例实例
+_profile_store = None
+_profile_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """获取分析结果目录单例"""
+    global _profile_store
+    if _profile_store is None:
+        with _profile_store_lock:
+            if _profile_store is None:
+                _profile_store = ProfileStore(
+                    directory=os.getenv('PROFILE_DIR', os.path.expanduser('~/.cache/obscura/profiles')),
+                    max_profiles=int(os.getenv('PROFILE_MAX_FILES', 50))
+                )
+    return _profile_store
+
+
+def init_request_profiler(app):
+    """安装按需分析中间件（未设置ADMIN_TOKEN时不安装）"""
+    if not admin_token():
+        logger.info("🔬 按需请求分析未启用（未设置ADMIN_TOKEN）")
+        return
+    interval = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 2)) / 1000
+    app.wsgi_app = RequestProfilerMiddleware(app.wsgi_app, get_profile_store(), interval)
+    logger.info(f"🔬 按需请求分析已启用: X-Profile 请求头或 ?{PROFILE_QUERY_KEY}= 参数")
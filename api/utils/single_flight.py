@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single Flight - 按键合并并发的重复计算
+
+同一个键同时只执行一次计算：第一个调用者执行，其余并发调用者等待并共享它的结果
+（或异常）；计算结束后键被释放，之后的调用重新执行（通常此时结果已持久化，调用方会直接读取）。
+只在进程内合并，跨进程的重复由调用方在计算前重新检查持久化结果来避免。
+"""
+
+import copy
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """一次正在进行的计算"""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """线程安全的请求合并器"""
+
+    def __init__(self, name: str = 'single_flight', timeout: float = 120.0):
+        """
+        Args:
+            name: 名称（用于日志和统计）
+            timeout: 等待者等待结果的最长时间（秒）
+        """
+        self.name = name
+        self.timeout = timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {'executions': 0, 'shared': 0, 'errors': 0, 'timeouts': 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        执行或等待键对应的计算
+
+        Returns:
+            (结果, 是否为共享结果)；共享结果是执行者结果的副本
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['executions'] += 1
+            else:
+                call.waiters += 1
+                self._stats['shared'] += 1
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise TimeoutError(f"{self.name}: 等待{key}的计算结果超时")
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        if call.waiters:
+            logger.info(f"🔗 {self.name}: {key}的计算结果共享给{call.waiters}个并发请求")
+        return call.result, False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取执行/共享次数和当前进行中的计算数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        stats['name'] = self.name
+        return stats
+
+
+# 按名称注册的单例实例
+_single_flights: Dict[str, SingleFlight] = {}
+_single_flights_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """获取指定名称的请求合并器单例"""
+    single_flight = _single_flights.get(name)
+    if single_flight is None:
+        with _single_flights_lock:
+            single_flight = _single_flights.get(name)
+            if single_flight is None:
+                single_flight = _single_flights[name] = SingleFlight(name)
+    return single_flight
+
+
+def get_single_flight_stats() -> Dict[str, Any]:
+    """获取所有请求合并器的统计"""
+    return {name: single_flight.get_stats() for name, single_flight in list(_single_flights.items())}
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup Profile - 启动模式、延迟加载和导入耗时分析
+
+启动模式（STARTUP_MODE）:
+- lazy（默认）: 蓝图只导入轻量依赖；cloudinary、joblib、混合SHAP模型等重依赖和模型加载
+  在第一次使用时（或显式预热时）才执行，缩短按请求唤醒实例的冷启动时间
+- eager: 启动时同步执行预热（见warmup.py，加载所有模型），首个请求不再承担加载耗时
+
+导入耗时分析:
+    python -m api.utils.startup_profile [--budget-ms 800] [--top 8] [--json] [模块 ...]
+每个蓝图模块在独立的解释器中以 -X importtime 导入，报告累计耗时和最重的依赖；
+指定 --budget-ms 时任一蓝图超出预算则以非零状态退出，用于跟踪启动预算回归。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# app.py注册的蓝图模块
+BLUEPRINT_MODULES = (
+    'api.routes.ml_predict',
+    'api.routes.health',
+    'api.routes.images',
+    'api.routes.environmental',
+    'api.routes.shap_predict',
+    'api.routes.jobs',
+    'api.routes.admin',
+    'api.routes.frontend',
+)
+
+STARTUP_MODES = ('lazy', 'eager')
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+_process_started = time.time()
+_phases: Dict[str, float] = {}
+_loaders: Dict[str, Callable[[], Any]] = {}
+_loader_status: Dict[str, Dict[str, Any]] = {}
+_loader_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def startup_mode() -> str:
+    """当前启动模式（STARTUP_MODE: lazy / eager，默认lazy）"""
+    mode = os.getenv('STARTUP_MODE', 'lazy').lower()
+    return mode if mode in STARTUP_MODES else 'lazy'
+
+
+@contextmanager
+def startup_phase(name: str):
+    """记录一个启动阶段的耗时"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        with _lock:
+            _phases[name] = round(elapsed, 4)
+        logger.info(f"⏱️ 启动阶段 {name}: {elapsed * 1000:.0f}ms")
+
+
+def register_deferred_loader(name: str, loader: Callable[[], Any]):
+    """注册一个延迟加载器（重依赖导入或模型加载），由load_deferred在首次使用或预热时执行"""
+    with _lock:
+        _loaders[name] = loader
+        _loader_locks.setdefault(name, threading.Lock())
+        _loader_status.setdefault(name, {'loaded': False, 'seconds': None, 'error': None, 'trigger': None})
+
+
+def load_deferred(name: str, trigger: str = 'first_use') -> Any:
+    """
+    执行延迟加载器（每个加载器成功后只执行一次，并发调用等待同一次加载）
+
+    Returns:
+        加载器的返回值
+    Raises:
+        KeyError: 加载器未注册
+        加载器抛出的异常（下次调用时重试）
+    """
+    loader = _loaders[name]
+    status = _loader_status[name]
+    if status['loaded']:
+        return status['value']
+
+    with _loader_locks[name]:
+        if status['loaded']:
+            return status['value']
+        start_time = time.perf_counter()
+        try:
+            value = loader()
+        except Exception as e:
+            status.update(error=f"{type(e).__name__}: {e}", seconds=round(time.perf_counter() - start_time, 4))
+            raise
+        status.update(loaded=True, value=value, error=None, trigger=trigger,
+                      seconds=round(time.perf_counter() - start_time, 4))
+
+    logger.info(f"📦 延迟加载 {name} 完成 ({trigger}): {status['seconds'] * 1000:.0f}ms")
+    return value
+
+
+def load_all_deferred(trigger: str = 'warmup') -> Dict[str, Optional[str]]:
+    """执行所有已注册的延迟加载器，返回 {名称: 错误信息或None}"""
+    results = {}
+    for name in list(_loaders):
+        try:
+            load_deferred(name, trigger=trigger)
+            results[name] = None
+        except Exception as e:
+            logger.warning(f"⚠️ 延迟加载 {name} 失败: {e}")
+            results[name] = f"{type(e).__name__}: {e}"
+    return results
+
+
+def get_startup_profile() -> Dict[str, Any]:
+    """启动模式、各启动阶段耗时和延迟加载器状态"""
+    with _lock:
+        phases = dict(_phases)
+        loaders = {name: {key: value for key, value in status.items() if key != 'value'}
+                   for name, status in _loader_status.items()}
+    return {
+        'mode': startup_mode(),
+        'process_started_at': _process_started,
+        'phases': phases,
+        'startup_seconds': round(sum(phases.values()), 4),
+        'deferred_loaders': loaders
+    }
+
+
+def profile_import(module: str, top: int = 8, python: str = None) -> Dict[str, Any]:
+    """
+    在独立的解释器中以 -X importtime 导入模块
+
+    Returns:
+        {'module', 'cumulative_ms', 'modules_imported', 'heaviest': [{'module', 'self_ms', 'cumulative_ms', 'depth'}],
+         'error'}
+    """
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    project_root = os.path.dirname(api_dir)
+    # 与 python api/app.py 启动时相同的模块搜索路径
+    search_path = [api_dir, project_root, os.environ.get('PYTHONPATH')]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, search_path)))
+    completed = subprocess.run(
+        [python or sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=project_root, env=env, capture_output=True, text=True
+    )
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({'module': name, 'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000,
+                            'depth': (len(indent) - 1) // 2})
+
+    target = next((entry for entry in reversed(entries) if entry['module'] == module), None)
+    error = None
+    if completed.returncode != 0:
+        error = (completed.stderr.strip().splitlines() or ['import failed'])[-1]
+
+    return {
+        'module': module,
+        'cumulative_ms': target['cumulative_ms'] if target else sum(entry['self_ms'] for entry in entries),
+        'modules_imported': len(entries),
+        # 直接依赖（包括父包__init__的导入）按累计耗时排序
+        'heaviest': sorted((entry for entry in entries if entry['depth'] == 1),
+                           key=lambda entry: -entry['cumulative_ms'])[:top],
+        'error': error
+    }
+
+
+def profile_imports(modules: Sequence[str] = BLUEPRINT_MODULES, top: int = 8) -> List[Dict[str, Any]]:
+    """逐个分析模块的冷导入耗时"""
+    return [profile_import(module, top=top) for module in modules]
+
+
+def _print_report(reports: List[Dict[str, Any]], budget_ms: Optional[float]):
+    print(f"{'module':<32} {'cumulative':>12} {'modules':>8}  status")
+    for report in sorted(reports, key=lambda item: -item['cumulative_ms']):
+        status = 'ERROR' if report['error'] else 'ok'
+        if budget_ms is not None and report['cumulative_ms'] > budget_ms:
+            status = f'OVER BUDGET ({budget_ms:.0f}ms)'
+        print(f"{report['module']:<32} {report['cumulative_ms']:>10.1f}ms {report['modules_imported']:>8}  {status}")
+        if report['error']:
+            print(f"    {report['error']}")
+        for entry in report['heaviest']:
+            print(f"    {entry['cumulative_ms']:>8.1f}ms cumulative  {entry['self_ms']:>8.1f}ms self  {entry['module']}")
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Per-blueprint import time report (python -X importtime)')
+    parser.add_argument('modules', nargs='*', default=list(BLUEPRINT_MODULES))
+    parser.add_argument('--budget-ms', type=float, default=None, help='fail if any module exceeds this cold import time')
+    parser.add_argument('--top', type=int, default=8, help='heaviest dependencies to list per module')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    reports = profile_imports(args.modules, top=args.top)
+    if args.json:
+        print(json.dumps({'budget_ms': args.budget_ms, 'modules': reports}, indent=2))
+    else:
+        _print_report(reports, args.budget_ms)
+
+    over_budget = args.budget_ms is not None and any(report['cumulative_ms'] > args.budget_ms for report in reports)
+    return 1 if over_budget or any(report['error'] for report in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Story Cache - 按内容寻址的AI环境故事缓存（可选启用）
+
+故事按(城市, 取整后的三个维度得分, 主要特征, 风格, 情感基调)的规范化哈希缓存:
+- 同一组分析输入最多有variants个不同的故事变体，每个变体使用固定的风格/基调组合，
+  请求时随机选择一个变体；variants越大故事越多样，LLM调用也越多
+- 变体在ttl秒内直接返回；过期后stale_ttl秒内仍返回旧故事，同时在后台重新生成
+- 超出容量时按LRU淘汰
+- 同一变体并发未命中时只调用一次LLM
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+from api.utils.single_flight import get_single_flight
+
+logger = logging.getLogger(__name__)
+
+
+class StoryCache:
+    """线程安全的LRU + TTL故事缓存，支持过期后后台刷新"""
+
+    def __init__(self, max_entries: int = 512, variants: int = 3, ttl: float = 86400.0,
+                 stale_ttl: float = 604800.0, score_decimals: int = 2, top_features: int = 3):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大缓存故事数（所有键的所有变体）
+            variants: 每组分析输入的故事变体数
+            ttl: 故事有效期（秒）
+            stale_ttl: 过期后仍可返回旧故事（并后台刷新）的时间（秒）
+            score_decimals: 得分取整的小数位数（越小命中率越高）
+            top_features: 参与缓存键的主要特征数量
+        """
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.score_decimals = score_decimals
+        self.top_features = top_features
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='story-cache-refresh')
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                       'refreshes': 0, 'refresh_errors': 0}
+
+        logger.info(f"StoryCache初始化完成: max_entries={max_entries}, variants={self.variants}, ttl={ttl}s")
+
+    def base_fields(self, shap_data: Dict[str, Any]) -> Dict[str, Any]:
+        """分析输入的规范化表示（不含风格/基调）"""
+        feature_importance = shap_data.get('shap_analysis', {}).get('feature_importance', {}) or {}
+        top_features = sorted(feature_importance.items(), key=lambda x: (-x[1], x[0]))[:self.top_features]
+        return {
+            'city': str(shap_data.get('city', 'Unknown Location')).strip().lower(),
+            'scores': [round(float(shap_data.get(name, 0.5)), self.score_decimals)
+                       for name in ('climate_score', 'geographic_score', 'economic_score')],
+            'top_features': [name for name, _ in top_features]
+        }
+
+    @staticmethod
+    def make_key(fields: Dict[str, Any]) -> str:
+        """规范化JSON的SHA-1哈希"""
+        canonical = json.dumps(fields, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def choose_variant(self, base_fields: Dict[str, Any], styles: Sequence[str],
+                       tones: Sequence[str]) -> Tuple[str, str, str]:
+        """
+        随机选择一个变体
+
+        Returns:
+            (缓存键, 风格, 情感基调)；同一输入的第i个变体总是使用相同的风格/基调
+        """
+        variant = random.randrange(self.variants)
+        seed = int(self.make_key({**base_fields, 'variant': variant})[:8], 16)
+        style = styles[seed % len(styles)]
+        tone = tones[(seed // len(styles)) % len(tones)]
+        return self.make_key({**base_fields, 'style': style, 'tone': tone}), style, tone
+
+    def _store(self, key: str, story: str):
+        with self._lock:
+            self._entries[key] = (time.time(), story)
+            self._entries.move_to_end(key)
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _generate_and_store(self, key: str, generate: Callable[[], str]) -> str:
+        story = generate()
+        self._store(key, story)
+        return story
+
+    def _refresh(self, key: str, generate: Callable[[], str]):
+        """后台重新生成过期的故事（失败时保留旧故事）"""
+        try:
+            get_single_flight('story_cache').do(key, self._generate_and_store, key, generate)
+            with self._lock:
+                self._stats['refreshes'] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats['refresh_errors'] += 1
+            logger.warning(f"⚠️ 故事缓存后台刷新失败 {key[:12]}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_generate(self, key: str, generate: Callable[[], str]) -> Tuple[str, str]:
+        """
+        读取缓存的故事，未命中时调用generate生成并缓存
+
+        Returns:
+            (故事, 缓存状态)  缓存状态: 'hit' / 'stale' / 'miss'
+        Raises:
+            generate抛出的异常（未命中时）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.time() - entry[0]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[1], 'hit'
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['stale_hits'] += 1
+                    schedule_refresh = key not in self._refreshing
+                    if schedule_refresh:
+                        self._refreshing.add(key)
+                else:
+                    del self._entries[key]
+                    entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+
+        if entry is not None:
+            if schedule_refresh:
+                self._refresh_executor.submit(self._refresh, key, generate)
+            return entry[1], 'stale'
+
+        story, _ = get_single_flight('story_cache').do(key, self._generate_and_store, key, generate)
+        return story, 'miss'
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中率等统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['refreshing'] = len(self._refreshing)
+
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['variants'] = self.variants
+        stats['ttl_seconds'] = self.ttl
+        stats['stale_ttl_seconds'] = self.stale_ttl
+        return stats
+
+
+# 单例实例
+_story_cache = None
+_story_cache_lock = threading.Lock()
+
+
+def story_cache_enabled() -> bool:
+    """是否启用故事缓存（STORY_CACHE_ENABLED，默认不启用：每次请求都生成新故事）"""
+    return os.getenv('STORY_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+
+def get_story_cache() -> StoryCache:
+    """
+    获取故事缓存单例
+
+    配置项:
+        STORY_CACHE_SIZE, STORY_CACHE_VARIANTS, STORY_CACHE_TTL, STORY_CACHE_STALE_TTL,
+        STORY_CACHE_SCORE_DECIMALS
+    """
+    global _story_cache
+    if _story_cache is None:
+        with _story_cache_lock:
+            if _story_cache is None:
+                _story_cache = StoryCache(
+                    max_entries=int(os.getenv('STORY_CACHE_SIZE', 512)),
+                    variants=int(os.getenv('STORY_CACHE_VARIANTS', 3)),
+                    ttl=float(os.getenv('STORY_CACHE_TTL', 86400)),
+                    stale_ttl=float(os.getenv('STORY_CACHE_STALE_TTL', 604800)),
+                    score_decimals=int(os.getenv('STORY_CACHE_SCORE_DECIMALS', 2))
+                )
+    return _story_cache
+
+
+def get_story_cache_stats() -> Dict[str, Any]:
+    """获取故事缓存统计（未创建时返回initialized=False）"""
+    if _story_cache is None:
+        return {'enabled': story_cache_enabled(), 'initialized': False}
+
+    stats = _story_cache.get_stats()
+    stats['enabled'] = story_cache_enabled()
+    stats['initialized'] = True
+    return stats
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Story Refresh - 批量重新生成图片的AI环境故事
+
+每次批量刷新是story_refresh_runs表中的一条记录（筛选条件、进度、检查点），
+由后台任务队列执行:
+- 按图片ID升序分页处理，每页的故事写回predictions.result_data和检查点
+  （last_image_id）在同一个事务中提交
+- 任务中断（进程重启、租约过期、LLM连续失败）后重试时从检查点继续，已提交的页不会重复生成
+- 每页内用固定大小的线程池并发调用LLM，每分钟请求数由LLM调用处的限速器控制
+- 只刷新已有完整SHAP分析的图片；生成失败的图片保留原故事并记录在failed_image_ids中
+"""
+
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from api.utils.db_pool import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+RUN_COLUMNS = ('id', 'filters', 'options', 'status', 'total', 'processed', 'succeeded', 'failed',
+               'skipped', 'last_image_id', 'failed_image_ids', 'last_error', 'job_id',
+               'created_at', 'started_at', 'finished_at', 'updated_at')
+
+# failed_image_ids最多保留的数量
+MAX_FAILED_IDS = 500
+
+_schema_ready = False
+
+
+def _ensure_schema():
+    """创建story_refresh_runs表（每个进程只执行一次）"""
+    global _schema_ready
+    if _schema_ready:
+        return
+
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS story_refresh_runs (
+                id SERIAL PRIMARY KEY,
+                filters JSONB NOT NULL,
+                options JSONB NOT NULL,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                processed INTEGER NOT NULL DEFAULT 0,
+                succeeded INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                last_image_id INTEGER NOT NULL DEFAULT 0,
+                failed_image_ids JSONB NOT NULL DEFAULT '[]',
+                last_error TEXT,
+                job_id INTEGER,
+                created_at TIMESTAMP NOT NULL,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL
+            )
+        """)
+        conn.commit()
+        cur.close()
+    _schema_ready = True
+
+
+def parse_story_refresh_filters(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验批量刷新的筛选条件
+
+    支持: image_ids (整数列表), since / until (图片创建时间, ISO格式),
+          location (预测地点，模糊匹配), only_missing (只处理还没有故事的图片)
+
+    Raises:
+        ValueError: 筛选条件无效
+    """
+    filters = {}
+
+    image_ids = data.get('image_ids')
+    if image_ids is not None:
+        if not isinstance(image_ids, list) or not all(isinstance(i, int) for i in image_ids):
+            raise ValueError("image_ids必须是整数列表")
+        filters['image_ids'] = sorted(set(image_ids))
+
+    for field in ('since', 'until'):
+        if data.get(field):
+            try:
+                filters[field] = datetime.fromisoformat(str(data[field])).isoformat()
+            except ValueError:
+                raise ValueError(f"{field}必须是ISO格式时间: {data[field]}")
+
+    if data.get('location'):
+        filters['location'] = str(data['location'])
+
+    if data.get('only_missing'):
+        filters['only_missing'] = True
+
+    return filters
+
+
+def _filter_clause(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """筛选条件 → WHERE子句片段和参数"""
+    conditions, params = [], []
+    if 'image_ids' in filters:
+        conditions.append("i.id = ANY(%s)")
+        params.append(filters['image_ids'])
+    if 'since' in filters:
+        conditions.append("i.created_at >= %s")
+        params.append(filters['since'])
+    if 'until' in filters:
+        conditions.append("i.created_at < %s")
+        params.append(filters['until'])
+    if 'location' in filters:
+        conditions.append("p.location ILIKE %s")
+        params.append(f"%{filters['location']}%")
+    if filters.get('only_missing'):
+        conditions.append("NOT COALESCE(p.result_data::jsonb ? 'ai_story', FALSE)")
+    return (' AND ' + ' AND '.join(conditions)) if conditions else '', params
+
+
+def _row_to_run(row) -> Dict[str, Any]:
+    run = dict(zip(RUN_COLUMNS, row))
+    for field in ('created_at', 'started_at', 'finished_at', 'updated_at'):
+        if isinstance(run[field], datetime):
+            run[field] = run[field].isoformat()
+
+    remaining = max(0, run['total'] - run['processed'])
+    run['progress'] = round(run['processed'] / run['total'], 4) if run['total'] else 1.0
+    run['eta_seconds'] = None
+    if run['status'] == 'running' and run['started_at'] and run['processed']:
+        elapsed = (datetime.now() - datetime.fromisoformat(run['started_at'])).total_seconds()
+        run['eta_seconds'] = round(elapsed / run['processed'] * remaining, 1)
+    return run
+
+
+def create_story_refresh_run(filters: Dict[str, Any], concurrency: int, batch_size: int) -> Dict[str, Any]:
+    """新建批量刷新记录（统计符合条件的图片数量）"""
+    _ensure_schema()
+    where, params = _filter_clause(filters)
+    now = datetime.now()
+
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT COUNT(*) FROM images i
+            LEFT JOIN predictions p ON i.prediction_id = p.id
+            WHERE TRUE{where}
+        """, params)
+        total = cur.fetchone()[0]
+        cur.execute(f"""
+            INSERT INTO story_refresh_runs (filters, options, status, total, created_at, updated_at)
+            VALUES (%s, %s, 'queued', %s, %s, %s)
+            RETURNING {', '.join(RUN_COLUMNS)}
+        """, (json.dumps(filters), json.dumps({'concurrency': concurrency, 'batch_size': batch_size}),
+              total, now, now))
+        run = _row_to_run(cur.fetchone())
+        conn.commit()
+        cur.close()
+
+    logger.info(f"📝 批量故事刷新#{run['id']}已创建: {total}张图片, 筛选条件={filters}")
+    return run
+
+
+def get_story_refresh_run(run_id: int) -> Optional[Dict[str, Any]]:
+    """查询批量刷新的进度"""
+    _ensure_schema()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM story_refresh_runs WHERE id = %s", (run_id,))
+        row = cur.fetchone()
+        cur.close()
+    return _row_to_run(row) if row else None
+
+
+def set_story_refresh_job(run_id: int, job_id: int):
+    """记录执行批量刷新的任务ID"""
+    _update_run(run_id, "job_id = %s", (job_id,))
+
+
+def _update_run(run_id: int, assignments: str, params: Tuple = ()):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"UPDATE story_refresh_runs SET {assignments}, updated_at = %s WHERE id = %s",
+                    (*params, datetime.now(), run_id))
+        conn.commit()
+        cur.close()
+
+
+def _fetch_page(filters: Dict[str, Any], after_image_id: int, limit: int) -> List[Tuple]:
+    """检查点之后的下一页图片: (image_id, prediction_id, result_data)"""
+    where, params = _filter_clause(filters)
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT i.id, i.prediction_id, p.result_data
+            FROM images i
+            LEFT JOIN predictions p ON i.prediction_id = p.id
+            WHERE i.id > %s{where}
+            ORDER BY i.id
+            LIMIT %s
+        """, [after_image_id, *params, limit])
+        rows = cur.fetchall()
+        cur.close()
+    return rows
+
+
+def _commit_page(run_id: int, stories: List[Tuple[int, str]], counts: Dict[str, int],
+                 failed_ids: List[int], last_image_id: int, last_error: Optional[str]):
+    """在同一个事务中写回本页的故事并推进检查点"""
+    from psycopg2.extras import execute_values
+
+    now = datetime.now()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        if stories:
+            execute_values(cur, """
+                UPDATE predictions AS p
+                SET result_data = p.result_data::jsonb || jsonb_build_object(
+                    'ai_story', v.story, 'story_generated_at', v.generated_at)
+                FROM (VALUES %s) AS v (prediction_id, story, generated_at)
+                WHERE p.id = v.prediction_id
+            """, [(prediction_id, story, now.isoformat()) for prediction_id, story in stories])
+        cur.execute("""
+            UPDATE story_refresh_runs
+            SET processed = processed + %s, succeeded = succeeded + %s, failed = failed + %s,
+                skipped = skipped + %s, last_image_id = %s,
+                failed_image_ids = CASE WHEN jsonb_array_length(failed_image_ids) < %s
+                                        THEN failed_image_ids || %s::jsonb ELSE failed_image_ids END,
+                last_error = COALESCE(%s, last_error), updated_at = %s
+            WHERE id = %s
+        """, (counts['processed'], counts['succeeded'], counts['failed'], counts['skipped'], last_image_id,
+              MAX_FAILED_IDS, json.dumps(failed_ids), last_error, now, run_id))
+        conn.commit()
+        cur.close()
+
+
+class LeaseLostError(RuntimeError):
+    """执行批量刷新的任务租约已被其他工作线程接管"""
+
+
+def _can_refresh(result_data) -> bool:
+    """只有已完成SHAP分析的预测记录才重新生成故事"""
+    if isinstance(result_data, str):
+        result_data = json.loads(result_data)
+    return bool(result_data) and 'climate_score' in result_data
+
+
+def run_story_refresh(run_id: int, generate_story: Callable[[Dict[str, Any]], str],
+                      heartbeat: Callable[[], bool] = None) -> Dict[str, Any]:
+    """
+    执行（或从检查点继续）批量故事刷新
+
+    Args:
+        run_id: 批量刷新记录ID
+        generate_story: 根据result_data生成故事，失败时抛出异常（不使用备用故事）
+        heartbeat: 每页提交后调用，返回False表示应停止（任务租约已失效）
+
+    Returns:
+        批量刷新记录
+    """
+    run = get_story_refresh_run(run_id)
+    if run is None:
+        raise LookupError(f"批量故事刷新不存在: {run_id}")
+    if run['status'] == 'completed':
+        return run
+
+    concurrency = run['options']['concurrency']
+    batch_size = run['options']['batch_size']
+    last_image_id = run['last_image_id']
+    if last_image_id:
+        logger.info(f"🔁 批量故事刷新#{run_id}从检查点继续: image_id > {last_image_id} ({run['processed']}/{run['total']})")
+    _update_run(run_id, "status = 'running', started_at = COALESCE(started_at, %s), last_error = NULL",
+                (datetime.now(),))
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"story-refresh-{run_id}") as executor:
+            while True:
+                rows = _fetch_page(run['filters'], last_image_id, batch_size)
+                if not rows:
+                    break
+
+                page_start = time.monotonic()
+                counts = {'processed': len(rows), 'succeeded': 0, 'failed': 0, 'skipped': 0}
+                futures = {}
+                for image_id, prediction_id, result_data in rows:
+                    if not _can_refresh(result_data):
+                        counts['skipped'] += 1
+                        continue
+                    if isinstance(result_data, str):
+                        result_data = json.loads(result_data)
+                    futures[executor.submit(generate_story, result_data)] = (image_id, prediction_id)
+
+                stories, failed_ids, last_error = [], [], None
+                for future in as_completed(futures):
+                    image_id, prediction_id = futures[future]
+                    try:
+                        stories.append((prediction_id, future.result()))
+                        counts['succeeded'] += 1
+                    except Exception as e:
+                        counts['failed'] += 1
+                        failed_ids.append(image_id)
+                        last_error = f"image {image_id}: {type(e).__name__}: {e}"
+                        logger.warning(f"⚠️ 批量故事刷新#{run_id}: 图片{image_id}故事生成失败: {e}")
+
+                last_image_id = rows[-1][0]
+                _commit_page(run_id, stories, counts, failed_ids, last_image_id, last_error)
+                logger.info(f"📝 批量故事刷新#{run_id}: 已提交至image_id={last_image_id} "
+                            f"(成功{counts['succeeded']}, 失败{counts['failed']}, 跳过{counts['skipped']}, "
+                            f"{time.monotonic() - page_start:.1f}s)")
+
+                if heartbeat is not None and not heartbeat():
+                    raise LeaseLostError("任务租约已失效，停止执行（将从检查点继续）")
+
+    except LeaseLostError:
+        logger.warning(f"⚠️ 批量故事刷新#{run_id}的任务租约已失效，在image_id={last_image_id}后停止")
+        raise
+    except Exception as e:
+        _update_run(run_id, "status = 'interrupted', last_error = %s", (f"{type(e).__name__}: {e}",))
+        logger.error(f"❌ 批量故事刷新#{run_id}中断于image_id={last_image_id}: {e}")
+        raise
+
+    _update_run(run_id, "status = 'completed', finished_at = %s", (datetime.now(),))
+    run = get_story_refresh_run(run_id)
+    logger.info(f"✅ 批量故事刷新#{run_id}完成: 成功{run['succeeded']}, 失败{run['failed']}, 跳过{run['skipped']}")
+    return run
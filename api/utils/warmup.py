@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Warmup - 模型预热与就绪状态
+
+预热按顺序执行已注册的步骤（由拥有模型或缓存的模块注册，例如加载混合SHAP模型后
+用合成批次跑一遍RandomForest和LSTM、加载TreeSHAP解释器和预测瓦片），完成后实例才算就绪:
+- /livez: 进程存活即返回200，不访问数据库和模型
+- /readyz: 只有预热完成（所有required步骤成功）后才返回200，负载均衡器不会把请求路由到冷实例
+
+required步骤失败时状态为failed，下一次/readyz请求会重新开始预热。
+
+配置项:
+    WARMUP_ON_STARTUP: 应用启动时在后台线程中预热（默认true；false时第一次/readyz请求触发预热）
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WARMUP_STATES = ('pending', 'running', 'ready', 'failed')
+
+_steps: List[Dict[str, Any]] = []
+_state = {
+    'state': 'pending',
+    'started_at': None,
+    'finished_at': None,
+    'seconds': None,
+    'attempts': 0,
+    'steps': {}
+}
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def register_warmup_step(name: str, step: Callable[[], Any], required: bool = True):
+    """
+    注册一个预热步骤（按注册顺序执行）
+
+    Args:
+        name: 步骤名称
+        step: 无参数函数，返回值（可JSON序列化的摘要）记录在预热状态中
+        required: 失败时实例是否不可就绪
+    """
+    with _lock:
+        _steps[:] = [existing for existing in _steps if existing['name'] != name]
+        _steps.append({'name': name, 'step': step, 'required': required})
+
+
+def warmup_on_startup() -> bool:
+    """是否在应用启动时预热（WARMUP_ON_STARTUP，默认启用）"""
+    return os.getenv('WARMUP_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+
+
+def run_warmup() -> Dict[str, Any]:
+    """同步执行所有预热步骤，返回预热状态"""
+    with _lock:
+        steps = list(_steps)
+        _state.update(state='running', started_at=datetime.now().isoformat(), finished_at=None, seconds=None,
+                      steps={step['name']: {'status': 'pending', 'required': step['required']} for step in steps})
+        _state['attempts'] += 1
+
+    logger.info(f"🔥 开始预热: {len(steps)}个步骤")
+    start_time = time.perf_counter()
+    failed_required = []
+    for step in steps:
+        step_start = time.perf_counter()
+        try:
+            summary = step['step']()
+            result = {'status': 'ok', 'result': summary}
+        except Exception as e:
+            result = {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+            if step['required']:
+                failed_required.append(step['name'])
+            logger.warning(f"⚠️ 预热步骤 {step['name']} 失败: {e}")
+        result.update(required=step['required'], seconds=round(time.perf_counter() - step_start, 4))
+        with _lock:
+            _state['steps'][step['name']] = result
+        logger.info(f"🔥 预热步骤 {step['name']}: {result['status']} ({result['seconds'] * 1000:.0f}ms)")
+
+    elapsed = time.perf_counter() - start_time
+    with _lock:
+        _state.update(state='failed' if failed_required else 'ready', finished_at=datetime.now().isoformat(),
+                      seconds=round(elapsed, 4))
+
+    if failed_required:
+        logger.error(f"❌ 预热失败（{', '.join(failed_required)}），实例未就绪")
+    else:
+        logger.info(f"✅ 预热完成: {elapsed:.2f}s，实例已就绪")
+    return get_warmup_status()
+
+
+def start_warmup(background: bool = True) -> bool:
+    """
+    开始预热（已在运行或已就绪时不重复执行；失败后可以重新开始）
+
+    Returns:
+        是否开始了新的预热
+    """
+    global _thread
+    with _lock:
+        if _state['state'] in ('running', 'ready'):
+            return False
+        _state['state'] = 'running'
+
+    if not background:
+        run_warmup()
+        return True
+
+    _thread = threading.Thread(target=run_warmup, name='model-warmup', daemon=True)
+    _thread.start()
+    return True
+
+
+def is_ready() -> bool:
+    """预热是否已完成"""
+    return _state['state'] == 'ready'
+
+
+def get_warmup_status() -> Dict[str, Any]:
+    """预热状态和各步骤的耗时、结果"""
+    with _lock:
+        status = dict(_state)
+        status['steps'] = {name: dict(step) for name, step in _state['steps'].items()}
+    status['ready'] = status['state'] == 'ready'
+    return status
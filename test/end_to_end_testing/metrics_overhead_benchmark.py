@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Obscura No.7 指标采集开销基准测试
+测量延迟直方图（api/utils/metrics.py）在启用和禁用时的开销:
+- Histogram.observe 每次调用的耗时
+- timed() 上下文管理器启用 / 禁用时的耗时
+- Flask测试客户端请求一个空路由的吞吐量（无钩子 / 钩子已注册但禁用 / 启用）
+
+不需要数据库、模型或网络:
+    python test/end_to_end_testing/metrics_overhead_benchmark.py [--iterations 200000] [--requests 5000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from flask import Flask
+
+from api.utils import metrics
+from api.utils.metrics import Histogram, timed, set_metrics_enabled, init_request_metrics
+
+
+def time_per_call_ns(func, iterations: int, repeats: int = 5) -> float:
+    """多次重复取中位数，返回每次调用的纳秒数"""
+    samples = []
+    for _ in range(repeats):
+        start_time = time.perf_counter_ns()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter_ns() - start_time) / iterations)
+    return statistics.median(samples)
+
+
+def benchmark_primitives(iterations: int) -> dict:
+    """直方图和计时器本身的开销"""
+    histogram = Histogram('benchmark_seconds', 'benchmark', ('service', 'outcome'))
+    results = {}
+
+    results['empty_loop'] = time_per_call_ns(lambda: None, iterations)
+    results['observe'] = time_per_call_ns(lambda: histogram.observe(0.0123, 'bench', 'ok'), iterations)
+
+    def with_timer():
+        with timed(histogram, 'bench'):
+            pass
+
+    set_metrics_enabled(True)
+    results['timed_enabled'] = time_per_call_ns(with_timer, iterations)
+    set_metrics_enabled(False)
+    results['timed_disabled'] = time_per_call_ns(with_timer, iterations)
+    set_metrics_enabled(True)
+    return results
+
+
+def create_benchmark_app(with_hooks: bool) -> Flask:
+    app = Flask(__name__)
+    if with_hooks:
+        init_request_metrics(app)
+
+    @app.route('/ping')
+    def ping():
+        return 'pong'
+
+    return app
+
+
+def requests_per_second(app: Flask, requests: int) -> float:
+    client = app.test_client()
+    start_time = time.perf_counter()
+    for _ in range(requests):
+        client.get('/ping')
+    return requests / (time.perf_counter() - start_time)
+
+
+def benchmark_requests(requests: int, repeats: int = 5) -> dict:
+    """请求钩子对Flask请求吞吐量的影响（三种配置交替运行，取中位数，减少噪声）"""
+    set_metrics_enabled(True)
+    apps = {'no_hooks': create_benchmark_app(with_hooks=False)}
+    apps['hooks_disabled'] = apps['hooks_enabled'] = create_benchmark_app(with_hooks=True)
+    for app in set(apps.values()):
+        requests_per_second(app, 200)  # 预热
+
+    samples = {name: [] for name in apps}
+    for _ in range(repeats):
+        for name, app in apps.items():
+            set_metrics_enabled(name != 'hooks_disabled')
+            samples[name].append(requests_per_second(app, requests))
+    set_metrics_enabled(True)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metrics collection overhead benchmark')
+    parser.add_argument('--iterations', type=int, default=200000, help='iterations per primitive measurement')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per throughput measurement')
+    args = parser.parse_args()
+
+    print("📊 指标采集开销基准测试")
+    print("=" * 60)
+
+    primitives = benchmark_primitives(args.iterations)
+    print(f"{'空循环':<24} {primitives['empty_loop']:>10.1f} ns/op")
+    print(f"{'Histogram.observe':<24} {primitives['observe']:>10.1f} ns/op")
+    print(f"{'timed() 启用':<24} {primitives['timed_enabled']:>10.1f} ns/op")
+    print(f"{'timed() 禁用':<24} {primitives['timed_disabled']:>10.1f} ns/op")
+
+    print("-" * 60)
+    throughput = benchmark_requests(args.requests)
+    baseline = throughput['no_hooks']
+    for name, label in (('no_hooks', '无钩子'), ('hooks_disabled', '钩子/禁用'), ('hooks_enabled', '钩子/启用')):
+        rps = throughput[name]
+        overhead_us = (1 / rps - 1 / baseline) * 1e6
+        print(f"{label:<24} {rps:>10.0f} req/s  ({overhead_us:+.1f} µs/请求)")
+
+    metrics.reset_metrics()
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    exit(exit_code)